@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量文章生成
+从CSV或JSONL文件读取主题列表（主题、字数、文风等），并发生成文章和配图
+
+  - 文本阶段和配图阶段分别限制并发数(--text-workers / --image-workers)
+  - 每完成一篇就写入检查点文件(输入文件名.checkpoint.jsonl)
+  - 中断后重新运行同一命令即可从检查点继续，已完成的条目不会重复生成
+  - 配图默认写入输出目录的 assets/ 下，--single-file 时内嵌进HTML
+
+输入字段(CSV表头或JSONL键):
+  theme(必填), length(默认2000), style(默认standard), collaborative(y/n),
+  max_rounds, drafts(协作模式候选初稿数), images(配图数量), image_style(默认realistic), id(可选，默认按内容生成)
+
+用法:
+  python batch_generate.py themes.csv
+  python batch_generate.py themes.jsonl --text-workers 4 --image-workers 2 --output-dir batch_out
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from toutiao_article_generator import MAX_DRAFT_CANDIDATES, ToutiaoArticleGenerator
+from run_manifest import RunManifest
+
+
+def _truthy(value):
+    return str(value).strip().lower() in ('y', 'yes', 'true', '1')
+
+
+def normalize_item(raw, default_images, default_image_style):
+    """把一行输入整理为生成参数，缺少主题时返回None"""
+    theme = str(raw.get('theme') or '').strip()
+    if not theme:
+        return None
+    item = {
+        'theme': theme,
+        'length': int(raw.get('length') or 2000),
+        'style': str(raw.get('style') or 'standard').strip() or 'standard',
+        'collaborative': _truthy(raw.get('collaborative', 'n')),
+        'max_rounds': int(raw.get('max_rounds') or 3),
+        'images': int(raw['images']) if str(raw.get('images', '')).strip() else default_images,
+        'image_style': str(raw.get('image_style') or default_image_style).strip(),
+    }
+    drafts = max(1, min(int(raw.get('drafts') or 1), MAX_DRAFT_CANDIDATES))
+    if drafts > 1:
+        item['drafts'] = drafts
+    # 没有指定id时按参数内容生成，输入文件调整顺序后仍能对应检查点
+    item_id = str(raw.get('id') or '').strip()
+    if not item_id:
+        payload = json.dumps(item, ensure_ascii=False, sort_keys=True)
+        item_id = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+    item['id'] = item_id
+    return item
+
+
+def load_items(input_path, default_images=3, default_image_style='realistic'):
+    """读取CSV或JSONL输入文件"""
+    input_path = Path(input_path)
+    rows = []
+    if input_path.suffix.lower() in ('.jsonl', '.json'):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as e:
+                    print(f"[WARN] 第{line_no}行不是有效的JSON，已跳过: {e}")
+    else:
+        # utf-8-sig: 兼容Excel导出的带BOM的CSV
+        with open(input_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    items = []
+    seen = set()
+    for row in rows:
+        item = normalize_item(row, default_images, default_image_style)
+        if item is None or item['id'] in seen:
+            continue
+        seen.add(item['id'])
+        items.append(item)
+    return items
+
+
+class Checkpoint:
+    """检查点文件：每个结束的条目追加一行JSON，同一条目以最后一行为准"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.records = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时可能写了半行
+                    self.records[record['id']] = record
+
+    def is_done(self, item_id):
+        record = self.records.get(item_id)
+        return record is not None and record['status'] == 'completed'
+
+    def record(self, record):
+        with self._lock:
+            self.records[record['id']] = record
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def save_article(generator, item, article, images, output_dir, image_mode=None):
+    """保存Markdown和HTML文件，返回 (md_path, html_path)"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_title = "".join(c for c in article['title'] if c.isalnum() or c in (' ', '_', '-'))[:20]
+    base_name = f"Article_{safe_title}_{timestamp}_{item['id'][:6]}"
+
+    md_path = output_dir / f"{base_name}.md"
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(f"# {article['title']}\n\n{article['content']}")
+
+    html_path = output_dir / f"{base_name}.html"
+    html_content = generator.create_article_html(article['title'], article['content'], item['theme'], images,
+                                                 html_path=html_path, image_mode=image_mode)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    return md_path, html_path
+
+
+def generate_item(item, text_slots, image_slots, output_dir, image_mode=None):
+    """生成一篇文章：文本阶段和配图阶段分别占用各自的并发名额"""
+    generator = ToutiaoArticleGenerator()
+    if not generator.text_client:
+        raise RuntimeError("AI客户端初始化失败")
+    started = time.time()
+
+    with text_slots:
+        if item['collaborative']:
+            article = generator.generate_article_collaborative(
+                item['theme'], target_length=item['length'], style=item['style'], max_rounds=item['max_rounds'],
+                num_drafts=item.get('drafts')
+            )
+        else:
+            article = generator.generate_article_with_ai(
+                item['theme'], target_length=item['length'], style=item['style']
+            )
+    if not article:
+        raise RuntimeError("文章生成失败")
+    text_time = time.time() - started
+
+    images = []
+    if item['images'] > 0:
+        with image_slots:
+            images = generator.generate_article_images(
+                item['theme'], article['content'], item['image_style'], num_images=item['images']
+            ) or []
+
+    md_path, html_path = save_article(generator, item, article, images, output_dir, image_mode)
+
+    # 逐条调用记录保存在文章旁边，检查点中只记汇总
+    generator.trace.name = html_path.stem
+    trace_path = generator.trace.write_jsonl(html_path.with_suffix('.trace.jsonl'))
+    summary = generator.trace.summary()
+    costs = [row['cost'] for row in summary if row['cost'] is not None]
+    return {
+        'title': article['title'],
+        'word_count': article.get('word_count'),
+        'images': images,
+        'md_path': str(md_path),
+        'html_path': str(html_path),
+        'trace_path': str(trace_path),
+        'tokens': sum(row['input_tokens'] + row['output_tokens'] for row in summary),
+        'cost': round(sum(costs), 4) if costs else None,
+        'text_time': round(text_time, 1),
+        'total_time': round(time.time() - started, 1),
+    }
+
+
+def run_batch(input_path, output_dir=None, text_workers=3, image_workers=2, default_images=3,
+              image_style='realistic', retry_failed=True, checkpoint_path=None, image_mode=None):
+    """批量生成，返回 {'completed', 'failed', 'skipped'}"""
+    input_path = Path(input_path)
+    output_dir = Path(output_dir) if output_dir else Path(__file__).parent / f"batch_{input_path.stem}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path or input_path.with_name(input_path.name + '.checkpoint.jsonl'))
+    manifest = RunManifest.from_env()
+
+    items = load_items(input_path, default_images, image_style)
+    pending = []
+    skipped = 0
+    for item in items:
+        record = checkpoint.records.get(item['id'])
+        if checkpoint.is_done(item['id']) or (record and record['status'] == 'failed' and not retry_failed):
+            skipped += 1
+        else:
+            pending.append(item)
+
+    print(f"[批量生成] 共 {len(items)} 篇，按检查点跳过 {skipped} 篇，本次生成 {len(pending)} 篇")
+    print(f"[批量生成] 文本并发 {text_workers}，配图并发 {image_workers}，输出目录: {output_dir}")
+
+    text_slots = threading.BoundedSemaphore(text_workers)
+    image_slots = threading.BoundedSemaphore(image_workers)
+    stats = {'completed': 0, 'failed': 0, 'skipped': skipped}
+
+    # 线程数为两个阶段名额之和：文本阶段占满时，已进入配图阶段的条目不会阻塞新条目开始写作
+    with ThreadPoolExecutor(max_workers=text_workers + image_workers, thread_name_prefix='batch') as executor:
+        futures = {
+            executor.submit(generate_item, item, text_slots, image_slots, output_dir, image_mode): item
+            for item in pending
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            record = {'id': item['id'], 'theme': item['theme'], 'finished_at': time.time()}
+            try:
+                record.update(status='completed', **future.result())
+                stats['completed'] += 1
+                print(f"[批量生成] ({done}/{len(pending)}) [OK] {item['theme']} -> {Path(record['html_path']).name}")
+                if manifest:
+                    manifest.add_output(record['html_path'], 'html')
+                    manifest.add_output(record['trace_path'], 'trace')
+            except Exception as e:
+                record.update(status='failed', error=str(e)[:200])
+                stats['failed'] += 1
+                print(f"[批量生成] ({done}/{len(pending)}) [FAIL] {item['theme']}: {e}")
+            checkpoint.record(record)
+
+    print(f"[批量生成] 完成 {stats['completed']} 篇，失败 {stats['failed']} 篇，跳过 {stats['skipped']} 篇")
+    print(f"[批量生成] 检查点: {checkpoint.path}")
+    if manifest:
+        manifest.finish('completed' if not stats['failed'] else 'failed',
+                        error=f"{stats['failed']} 篇生成失败" if stats['failed'] else None)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量生成今日头条文章（支持断点续跑）')
+    parser.add_argument('input', help='主题列表文件(CSV或JSONL)')
+    parser.add_argument('--output-dir', help='输出目录(默认 article/batch_<输入文件名>)')
+    parser.add_argument('--text-workers', type=int, default=3, help='文本阶段并发数')
+    parser.add_argument('--image-workers', type=int, default=2, help='配图阶段并发数')
+    parser.add_argument('--images', type=int, default=3, help='每篇默认配图数量(输入中未指定时)')
+    parser.add_argument('--image-style', default='realistic', help='默认配图风格')
+    parser.add_argument('--checkpoint', help='检查点文件路径(默认为 输入文件名.checkpoint.jsonl)')
+    parser.add_argument('--skip-failed', action='store_true', help='续跑时跳过检查点中失败的条目')
+    parser.add_argument('--single-file', action='store_true', help='配图内嵌进HTML(单文件导出)')
+    args = parser.parse_args()
+
+    stats = run_batch(
+        args.input,
+        output_dir=args.output_dir,
+        text_workers=max(1, args.text_workers),
+        image_workers=max(1, args.image_workers),
+        default_images=args.images,
+        image_style=args.image_style,
+        retry_failed=not args.skip_failed,
+        checkpoint_path=args.checkpoint,
+        image_mode='inline' if args.single_file else None,
+    )
+    return 0 if not stats['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -39,20 +39,37 @@ from datetime import datetime
 import json
 import base64
 import re
-from PIL import Image
-import io
 import time
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # 添加父目录到路径以导入config
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config import get_zhipu_anthropic_client, get_antigravity_client, get_volcano_client
+from run_manifest import RunManifest
+from provider_health import get_provider_health
+from hedging import ProviderBudget, race
+from llm_cache import LLMCallCancelled, cached_text_client, default_cache_stats, stream_message
+from progress_events import emit, has_listener, progress_print
+from call_trace import CallTrace
+from image_assets import ASSET_DIR_NAME, default_image_mode, image_tag_attrs, inline_data_url
+from image_ingest import discard, finalize_image, ingest_bytes, ingest_url
+from draft_scoring import pick_best
+from reference_search import format_materials, get_search_cache, search as search_references, search_many
+from paragraph_diff import (apply_patches, changed_paragraphs, join_paragraphs, numbered, outline,
+                            parse_paragraph_numbers, parse_patches, split_paragraphs)
+
+# 本模块的输出同时作为进度事件发给当前任务（见 progress_events），并发任务之间互不干扰
+print = progress_print
 
 
 def ddg_search(query, max_results=5):
     """
     使用DuckDuckGo进行免费搜索（无需API Key）
-    用于在写作前搜集名人美食故事/作品的素材
+    用于在写作前搜集名人美食故事/作品的素材；结果有磁盘缓存（见 reference_search）
 
     Args:
         query: 搜索查询
@@ -61,33 +78,8 @@ def ddg_search(query, max_results=5):
     Returns:
         str: 格式化的搜索结果文本，用于注入到AI提示词中
     """
-    print(f"[素材搜索] 查询: {query}")
-
     try:
-        from duckduckgo_search import DDGS
-
-        results = []
-        with DDGS() as ddgs:
-            search_results = list(ddgs.text(query, max_results=max_results))
-
-            for r in search_results:
-                results.append({
-                    'title': r.get('title', ''),
-                    'snippet': r.get('body', ''),
-                    'url': r.get('href', '')
-                })
-
-        if results:
-            content = '\n\n'.join([
-                f"【{r['title']}】\n{r['snippet']}\n来源: {r['url']}"
-                for r in results
-            ])
-            print(f"[素材搜索] 找到 {len(results)} 条相关素材")
-            return content
-        else:
-            print(f"[素材搜索] 未找到相关素材")
-            return ""
-
+        results = search_references(query, max_results, get_search_cache())
     except ImportError:
         print("[素材搜索] 未安装duckduckgo-search库，跳过预搜索")
         return ""
@@ -95,15 +87,79 @@ def ddg_search(query, max_results=5):
         print(f"[素材搜索] 搜索异常: {e}")
         return ""
 
+    if results:
+        print(f"[素材搜索] 找到 {len(results)} 条相关素材")
+        return format_materials(results)
+    print(f"[素材搜索] 未找到相关素材")
+    return ""
+
+
+# 配图并发设置
+IMAGE_MAX_WORKERS = int(os.environ.get('ARTICLE_IMAGE_WORKERS', '3'))  # 同时生成的图片数
+IMAGE_PROVIDER_LIMITS = {'volcano': 2, 'antigravity': 2, 'pollinations': 1}  # 各提供方同时进行的请求数
+_budget = os.environ.get('ARTICLE_IMAGE_TIME_BUDGET')
+IMAGE_TIME_BUDGET = float(_budget) if _budget else None  # 配图阶段总耗时上限(秒)，None表示不限制
+_hedge_delay = os.environ.get('ARTICLE_IMAGE_HEDGE_DELAY')
+IMAGE_HEDGE_DELAY = float(_hedge_delay) if _hedge_delay else None  # 对冲模式的等待秒数，None表示依次降级
+IMAGE_RACE_BUDGET = {'volcano': 6, 'antigravity': 6}  # 对冲模式下每篇文章各付费提供方最多调用次数
+_max_width = os.environ.get('ARTICLE_IMAGE_MAX_WIDTH')
+IMAGE_MAX_WIDTH = int(_max_width) if _max_width else None  # 配图保存宽度上限(超过时缩小重新编码)，None表示保持原图
+IMAGE_DIR = Path(__file__).parent
+REVISION_PATCH_MAX_RATIO = 0.6  # 被标记的段落超过全文该比例时改为整篇修改
+DRAFT_CANDIDATES = int(os.environ.get('ARTICLE_DRAFT_CANDIDATES', '1'))  # 协作模式并行生成的候选初稿数
+MAX_DRAFT_CANDIDATES = 5  # 候选初稿数上限（每篇一次并发的模型调用）
+
+_provider_semaphores = {}
+_provider_semaphores_lock = threading.Lock()
+
+
+def _provider_slot(provider):
+    """返回提供方的并发信号量（同一进程内的所有生成器共享）"""
+    with _provider_semaphores_lock:
+        semaphore = _provider_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(IMAGE_PROVIDER_LIMITS.get(provider, 1))
+            _provider_semaphores[provider] = semaphore
+    return semaphore
+
 
 class ToutiaoArticleGenerator:
     """今日头条文章生成器 - AI增强版 v3.3"""
 
-    def __init__(self):
+    def __init__(self, use_llm_cache=True):
         self.text_client = get_zhipu_anthropic_client()  # 使用Anthropic兼容接口
+        if use_llm_cache:
+            self.text_client = cached_text_client(self.text_client)  # 相同请求直接返回磁盘缓存的响应
         self.image_client = get_antigravity_client()  # 使用anti-gravity代理生成配图
         self.volcano_client = get_volcano_client()  # 火山引擎Seedream客户端
 
+        # 流式输出: 设置on_token(stage, text)或当前任务在接收进度事件时，文本模型改用流式接口逐段输出
+        # stage为 draft/review_facts/review_redundancy/review_style/revise/improve/image_prompts；
+        # cancel_event被设置时抛出LLMCallCancelled
+        self.on_token = None
+        self.cancel_event = None
+
+        # 每次外部调用(文本模型、配图、素材搜索)的耗时和token记录（见 call_trace）
+        self.trace = CallTrace()
+        self._image_attempts = {}
+        self._image_attempts_lock = threading.Lock()
+
+    def _create_message(self, stage, **params):
+        """调用文本模型（Anthropic messages接口），需要流式输出时使用流式接口"""
+        on_token = self.on_token
+        if on_token is None and has_listener():
+            on_token = lambda token_stage, text: emit('token', stage=token_stage, text=text)
+        with self.trace.span(stage, 'llm', provider='zhipu', model=params.get('model')) as span:
+            if on_token is None:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise LLMCallCancelled()
+                response = self.text_client.messages.create(**params)
+            else:
+                response = stream_message(self.text_client, lambda text: on_token(stage, text),
+                                          cancelled=self.cancel_event, **params)
+            self.trace.record_usage(span, response)
+        return response
+
     def improve_article_draft(self, draft_content, target_length=2000, style='standard'):
         """根据用户草稿完善文章
 
@@ -261,7 +317,8 @@ class ToutiaoArticleGenerator:
             print(f"[DEBUG] Calling AI API with model=glm-4-flash, max_tokens={estimated_tokens}")
             print(f"[DEBUG] Draft content length: {len(draft_content)} chars")
 
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                'improve',
                 model="glm-4-flash",  # 使用快速模型
                 max_tokens=estimated_tokens,
                 messages=[
@@ -514,7 +571,8 @@ class ToutiaoArticleGenerator:
             print(f"[DEBUG] Calling AI API with model=glm-4-flash, max_tokens=4000")
             print(f"[DEBUG] Theme: {theme}")
 
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                'draft',
                 model="glm-4-flash",  # 使用快速模型
                 max_tokens=4000,
                 messages=[
@@ -599,7 +657,8 @@ class ToutiaoArticleGenerator:
             traceback.print_exc()
             return None
 
-    def generate_article_collaborative(self, theme, target_length=2000, style='standard', max_rounds=3):
+    def generate_article_collaborative(self, theme, target_length=2000, style='standard', max_rounds=3,
+                                       diff_scoped=True, num_drafts=None):
         """双作者协作生成高质量文章
 
         作者1负责原创写作，作者2负责审校和提出修改意见。
@@ -610,6 +669,9 @@ class ToutiaoArticleGenerator:
             target_length: 目标字数
             style: 写作风格
             max_rounds: 最大协作轮数（默认3轮）
+            diff_scoped: 按段落跟踪修改（默认开启）：修改时只重写作者2标记的段落，
+                         第2轮起作者2只审阅上一轮改动过的段落
+            num_drafts: 并行生成的候选初稿数，大于1时按本地评分取最好的一篇（默认 ARTICLE_DRAFT_CANDIDATES）
 
         Returns:
             dict: 包含标题、正文、协作历史等信息
@@ -640,7 +702,8 @@ class ToutiaoArticleGenerator:
 
         # ========== 第一步：作者1原创初稿 ==========
         print(f"\n[作者1 - 原创] 正在创作初稿...")
-        draft_result = self._author1_create_draft(theme, target_length, style, search_materials)
+        num_drafts = num_drafts or DRAFT_CANDIDATES
+        draft_result = self._author1_create_draft(theme, target_length, style, search_materials, num_drafts=num_drafts)
 
         if not draft_result:
             print("[ERROR] 作者1创作初稿失败")
@@ -652,12 +715,15 @@ class ToutiaoArticleGenerator:
             'round': 0,
             'author': '作者1',
             'action': '创作初稿',
-            'content_preview': current_content[:200] + '...'
+            'content_preview': current_content[:200] + '...',
+            'draft_scores': draft_result.get('draft_scores')
         })
         print(f"[作者1] 初稿完成: {current_title}")
         print(f"[作者1] 字数: {len(current_content)}")
 
         # ========== 开始多轮协作 ==========
+        changed = None  # 上一轮改动过的段落编号，None表示审阅全文
+        review_summary = None
         for round_num in range(1, max_rounds + 1):
             print(f"\n{'─'*40}")
             print(f"[协作轮次 {round_num}]")
@@ -669,7 +735,10 @@ class ToutiaoArticleGenerator:
                 theme=theme,
                 title=current_title,
                 content=current_content,
-                style=style
+                style=style,
+                changed=changed,
+                previous_summary=review_summary,
+                target_length=target_length
             )
 
             if not review_result:
@@ -714,6 +783,7 @@ class ToutiaoArticleGenerator:
 
             # ========== 作者1根据意见修改 ==========
             print(f"\n[作者1 - 修改] 正在根据审校意见修改文章...")
+            old_paragraphs = split_paragraphs(current_content)
             revision_result = self._author1_revise(
                 theme=theme,
                 title=current_title,
@@ -723,7 +793,8 @@ class ToutiaoArticleGenerator:
                 fact_errors=review_result.get('fact_errors', []),
                 redundant_content=review_result.get('redundant_content', []),
                 target_length=target_length,
-                style=style
+                style=style,
+                flagged_paragraphs=review_result.get('paragraphs') if diff_scoped else None
             )
 
             if not revision_result:
@@ -732,17 +803,34 @@ class ToutiaoArticleGenerator:
 
             current_title = revision_result['title']
             current_content = revision_result['content']
+            new_paragraphs = split_paragraphs(current_content)
+            if diff_scoped:
+                changed = changed_paragraphs(old_paragraphs, new_paragraphs)
+                review_summary = self._review_summary(review_result)
 
             collaboration_history.append({
                 'round': round_num,
                 'author': '作者1',
                 'action': '修改文章',
-                'content_preview': current_content[:200] + '...'
+                'content_preview': current_content[:200] + '...',
+                'changed_paragraphs': changed
             })
 
             print(f"[作者1] 修改完成")
             print(f"[作者1] 新字数: {len(current_content)}")
 
+            if diff_scoped:
+                print(f"[作者1] 改动段落: {len(changed)}个")
+                if new_paragraphs == old_paragraphs:
+                    print(f"\n[协作完成] 本轮修改没有改动任何段落，协作结束")
+                    collaboration_history.append({
+                        'round': round_num,
+                        'author': '系统',
+                        'action': '协作完成',
+                        'message': '修改未改动任何段落'
+                    })
+                    break
+
             # 如果是最后一轮，强制完成
             if round_num == max_rounds:
                 print(f"\n[协作完成] 达到最大轮数({max_rounds}轮)，协作结束")
@@ -771,8 +859,11 @@ class ToutiaoArticleGenerator:
             'rounds': len([h for h in collaboration_history if h['author'] == '作者2'])
         }
 
-    def _author1_create_draft(self, theme, target_length, style, reference_materials=""):
-        """作者1: 创作初稿"""
+    def _author1_create_draft(self, theme, target_length, style, reference_materials="", num_drafts=1):
+        """作者1: 创作初稿
+
+        num_drafts大于1时并行生成多篇(各用不同temperature)，按篇幅、素材覆盖、重复度本地评分取最好的一篇
+        """
 
         # 构建素材部分
         materials_section = ""
@@ -845,8 +936,12 @@ class ToutiaoArticleGenerator:
 ---
 """
 
+        if num_drafts > 1:
+            return self._best_of_drafts(prompt, theme, target_length, reference_materials, num_drafts)
+
         try:
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                'draft',
                 model="glm-4-flash",
                 max_tokens=4000,
                 messages=[{"role": "user", "content": prompt}]
@@ -858,45 +953,107 @@ class ToutiaoArticleGenerator:
             print(f"[ERROR] 作者1创作失败: {e}")
             return None
 
+    def _best_of_drafts(self, prompt, theme, target_length, reference_materials, num_drafts):
+        """并行生成num_drafts篇候选初稿，返回本地评分最高的一篇（附 draft_scores）"""
+        num_drafts = max(2, min(int(num_drafts), MAX_DRAFT_CANDIDATES))
+        # temperature不同：候选之间有差异，且各自的响应缓存键不同
+        temperatures = [round(0.6 + 0.4 * i / (num_drafts - 1), 2) for i in range(num_drafts)]
+        print(f"[作者1] 并行创作{num_drafts}篇候选初稿...")
+
+        def attempt(index, temperature):
+            try:
+                response = self._create_message(
+                    f'draft_{index}',
+                    model="glm-4-flash",
+                    max_tokens=4000,
+                    temperature=temperature,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+                return self._parse_article_response(response.content[0].text, theme)
+            except Exception as e:
+                print(f"[WARN] 候选初稿{index}创作失败: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=num_drafts, thread_name_prefix='draft') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, attempt, index, temperature)
+                       for index, temperature in enumerate(temperatures, 1)]
+            candidates = [(index, future.result()) for index, future in enumerate(futures, 1)]
+
+        candidates = [(index, draft) for index, draft in candidates if draft]
+        if not candidates:
+            print(f"[ERROR] 作者1创作失败: 所有候选初稿均未生成")
+            return None
+
+        best, scores = pick_best([draft for _, draft in candidates], target_length, reference_materials)
+        for (index, draft), score in zip(candidates, scores):
+            coverage = '-' if score['coverage'] is None else f"{score['coverage']:.0%}"
+            print(f"[作者1] 候选{index}: 得分{score['score']:.2f} "
+                  f"(字数{len(draft['content'])}, 素材覆盖{coverage}, 重复句{score['duplicates']:.0%})"
+                  f"{' <- 选用' if draft is best else ''}")
+        best['draft_scores'] = scores
+        return best
+
     def _search_reference_materials(self, theme):
-        """搜索与主题相关的参考素材（名人故事、作品等）"""
-        # 从主题中提取可能的名人名字
-        import re
+        """搜索与主题相关的参考素材（名人故事、作品等）
+
+        多个查询变体并行搜索，按URL去重排序后取前几条，素材长度有上限（见 reference_search）
+        """
         # 常见文学/美食名人列表
         famous_people = [
             '汪曾祺', '梁实秋', '周作人', '林语堂', '老舍', '鲁迅',
             '蔡澜', '沈宏非', '陈晓卿', '王世襄', '唐鲁孙',
             '苏轼', '袁枚', '李渔', '张岱'
         ]
+        found_names = [name for name in famous_people if name in theme]
 
-        found_names = []
-        for name in famous_people:
-            if name in theme:
-                found_names.append(name)
-
-        # 搜索素材
-        all_materials = []
-
-        # 如果主题中有名人名字，搜索他们的美食故事/作品
-        for name in found_names[:2]:  # 最多搜索2个人物
-            query = f"{name} 美食 散文 作品 故事"
-            materials = ddg_search(query, max_results=3)
-            if materials:
-                all_materials.append(f"【{name}相关素材】\n{materials}")
-
-        # 搜索主题相关的素材
-        theme_query = f"{theme} 故事 典故 来源"
-        theme_materials = ddg_search(theme_query, max_results=3)
-        if theme_materials:
-            all_materials.append(f"【主题相关素材】\n{theme_materials}")
-
-        if all_materials:
-            return "\n\n".join(all_materials)
-        return ""
+        # (查询, 权重)：主题中有名人名字时搜索他们的美食故事/作品（最多2个人物）
+        queries = []
+        for name in found_names[:2]:
+            queries.append((f"{name} 美食 散文 作品 故事", 1.0))
+            queries.append((f"{name} {theme}", 0.8))
+        queries.append((f"{theme} 故事 典故 来源", 1.0))
+        queries.append((f"{theme} 由来 历史", 0.7))
+
+        try:
+            with self.trace.span('search', 'search', provider='duckduckgo', queries=len(queries)) as span:
+                results = search_many(queries, max_results=3, cache=get_search_cache())
+                span['results'] = len(results)
+        except ImportError:
+            print("[素材搜索] 未安装duckduckgo-search库，跳过预搜索")
+            return ""
+
+        if not results:
+            print(f"[素材搜索] 未找到相关素材")
+            return ""
+        print(f"[素材搜索] {len(queries)}个查询，去重后选用 {len(results)} 条素材")
+        return format_materials(results)
+
+    def _author2_review(self, theme, title, content, style, changed=None, previous_summary=None, target_length=None):
+        """作者2: 审校文章，从顶级文学评论家角度提出意见
+
+        审校拆为三项独立检查并行执行（事实核查、冗余检查、文风与篇幅），按固定规则合并为
+        opinion/score/needs_revision/fact_errors/redundant_content/issues/paragraphs，耗时约为最慢的一项
+
+        changed为上一轮改动过的段落编号时只审阅这些段落（附全文提纲和上一轮意见摘要），否则审阅全文
+        """
+        paragraphs = split_paragraphs(content)
+        if changed is None:
+            content_section = f"""## 原文内容（段落已编号）
+{numbered(paragraphs)}"""
+        else:
+            content_section = f"""## 本轮修改过的段落
+上一轮你已审阅全文并提出意见，作者已据此修改。以下只列出修改过的段落，请只审阅这些段落，未列出的段落已通过审校。
+
+{numbered(paragraphs, changed)}
+
+## 全文提纲（每段开头，供把握上下文）
+{outline(paragraphs)}
 
-    def _author2_review(self, theme, title, content, style):
-        """作者2: 审校文章，从顶级文学评论家角度提出意见"""
-        prompt = f"""你是【作者2】，一位当代顶级文学评论家、资深主编，文坛泰斗级人物。
+## 上一轮审校意见摘要
+{previous_summary or '无'}"""
+
+        length_note = f"{len(content)}字" + (f"（目标{target_length}字）" if target_length else "")
+        header = f"""你是【作者2】，一位当代顶级文学评论家、资深主编，文坛泰斗级人物。
 
 你的资历：
 - 担任多家顶级文学刊物主编数十年
@@ -908,32 +1065,15 @@ class ToutiaoArticleGenerator:
 - 主题: {theme}
 - 标题: {title}
 - 文风要求: {style if style and style != 'standard' else '通俗易懂，有感染力'}
+- 篇幅: {length_note}
 
-## 原文内容
-{content}
-
-## 你的审校职责
-
-### 🔴 第一优先级 - 内容精炼度检查（新增！）:
-**核心原则：文章中的每一句话都应该有其存在的价值。**
-
-1. **废话检测**（重点！）:
-   - 是否有与主题无关的段落或句子？
-   - 是否为了凑字数而添加的"填充内容"？
-   - 引用的典故、名人、作品是否与主题紧密相关？
-   - 例如："在《蔡澜食旅》中，虽然蔡澜并未详细描述品尝奶酪的过程"——这种内容对主题有任何助益吗？
-
-2. **冗余内容识别**:
-   - 是否有重复表达同一意思的句子？
-   - 是否有"正确的废话"（虽然没错但对读者无价值）？
-   - 引用某人物的作品时，该作品是否真的与主题相关？（如：主题是汪曾祺，却提《舌尖上的中国》）
-
-3. **精炼度评分标准**:
-   - 每个段落都必须推进主题
-   - 每个引用都必须紧密关联主题
-   - 不相关的名人/作品提及必须删除
+{content_section}
+"""
 
-### 🔴 第二优先级 - 事实准确性（零容忍！）:
+        checks = {
+            'facts': header + """
+## 本次审校职责：事实准确性（零容忍！）
+本次只做事实核查，文笔与冗余由其他审校负责。
 
 1. **人物身份描述准确性（极易出错！）**:
    - 不能把所有人都称为"文学大家"或"文学家"
@@ -962,8 +1102,50 @@ class ToutiaoArticleGenerator:
    - 历史事件的时间、地点、人物是否准确？
    - 引用的名言是否确为该人物所说？
 
-### 🔴 第三优先级 - 文学性与美感评估:
-**核心目标：打造一篇高质量的极具欣赏性的美文**
+## 输出格式（必须严格遵循JSON格式）
+{
+    "fact_errors": [
+        "事实错误1：具体描述错误内容和正确信息"
+    ],
+    "paragraphs": [存在事实错误的段落编号，如 3, 5]
+}
+
+没有发现事实错误时两个数组都为空。请只输出JSON，不要有其他内容。
+""",
+            'redundancy': header + """
+## 本次审校职责：内容精炼度检查
+**核心原则：文章中的每一句话都应该有其存在的价值。** 本次只做冗余检查，事实与文笔由其他审校负责。
+
+1. **废话检测**（重点！）:
+   - 是否有与主题无关的段落或句子？
+   - 是否为了凑字数而添加的"填充内容"？
+   - 引用的典故、名人、作品是否与主题紧密相关？
+   - 例如："在《蔡澜食旅》中，虽然蔡澜并未详细描述品尝奶酪的过程"——这种内容对主题有任何助益吗？
+
+2. **冗余内容识别**:
+   - 是否有重复表达同一意思的句子？
+   - 是否有"正确的废话"（虽然没错但对读者无价值）？
+   - 引用某人物的作品时，该作品是否真的与主题相关？（如：主题是汪曾祺，却提《舌尖上的中国》）
+
+3. **精炼度标准**:
+   - 每个段落都必须推进主题
+   - 每个引用都必须紧密关联主题
+   - 不相关的名人/作品提及必须删除
+
+## 输出格式（必须严格遵循JSON格式）
+{
+    "redundant_content": [
+        "冗余内容1：描述需要删除的段落或句子，说明为什么与主题无关",
+        "冗余内容2：例如'提及《舌尖上的中国》与汪曾祺主题无关，应删除'"
+    ],
+    "paragraphs": [包含冗余内容的段落编号，如 3, 5]
+}
+
+没有发现冗余内容时两个数组都为空。请只输出JSON，不要有其他内容。
+""",
+            'style': header + """
+## 本次审校职责：文学性、篇幅与读者体验
+**核心目标：打造一篇高质量的极具欣赏性的美文。** 事实核查和冗余检查由其他审校负责，本次不必重复。
 
 1. **文笔美感**:
    - 语言是否优美、有韵味？
@@ -983,6 +1165,7 @@ class ToutiaoArticleGenerator:
 
 4. **逻辑连贯性**: 论述是否清晰？段落之间是否流畅？
 5. **文风一致性**: 是否符合要求的文风？
+6. **篇幅**: 与目标字数相比是否明显过长或过短？
 
 ### 资深读者角度:
 1. **吸引力**: 开头是否足够吸引人？
@@ -992,45 +1175,50 @@ class ToutiaoArticleGenerator:
 ## 评分标准（顶级文学标准，非常严格！）:
 - 9-10分: 文学佳作，内容精炼，无一字多余
 - 7-8分: 良好，有少许可优化之处
-- 5-6分: 及格，有明显冗余或小问题
-- 5分以下: 存在事实错误或大量废话，需要大幅修改
+- 5-6分: 及格，有明显问题
+- 5分以下: 需要大幅修改
 
-## 输出格式（必须严格遵循JSON格式）
+## 特别注意:
+- 评分要严格，大量废话、堆砌修饰的文章不能超过6分
+- 事实错误和与主题无关的内容由另外的检查负责，合并结果时会据此强制修改并压低评分
 
-{{
-    "opinion": "总体评价（50-100字，必须指出是否发现事实错误或冗余内容）",
+## 输出格式（必须严格遵循JSON格式）
+{
+    "opinion": "总体评价（50-100字）",
     "needs_revision": true或false,
     "score": 1-10的评分,
-    "fact_errors": [
-        "事实错误1：具体描述错误内容和正确信息",
-        "事实错误2：..."
-    ],
-    "redundant_content": [
-        "冗余内容1：描述需要删除的段落或句子，说明为什么与主题无关",
-        "冗余内容2：例如'提及《舌尖上的中国》与汪曾祺主题无关，应删除'"
-    ],
     "issues": [
-        "其他问题1：描述问题所在和建议修改方向",
-        "其他问题2：..."
+        "问题1：描述问题所在和建议修改方向"
     ],
     "suggestions": [
-        "修改建议1",
-        "修改建议2"
-    ]
-}}
-
-## 特别注意:
-- **冗余内容检测是最高优先级**：如果有与主题无关的内容，必须标记
-- 如果发现任何事实错误或冗余内容，必须设置 "needs_revision": true
-- fact_errors数组记录事实错误
-- redundant_content数组记录需要删除的废话
-- 评分要严格，存在事实错误或大量废话的文章不能超过6分
+        "修改建议1"
+    ],
+    "paragraphs": [需要修改的段落编号，如 3, 5]
+}
 
 请只输出JSON，不要有其他内容。
-"""
+""",
+        }
+
+        with ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='review') as executor:
+            # 在各自复制的上下文中执行，流式输出和进度事件仍发给当前任务
+            futures = {
+                name: executor.submit(contextvars.copy_context().run, self._review_check, name, prompt)
+                for name, prompt in checks.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
+
+        if all(result is None for result in results.values()):
+            print(f"[ERROR] 作者2审校失败: 所有检查均未完成")
+            return None
+        return self._merge_review(results, len(paragraphs))
 
+    def _review_check(self, name, prompt):
+        """执行一项审校检查，返回解析后的dict；返回非JSON时为 {'raw': 原文}，调用失败时返回None"""
+        response_text = ''
         try:
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                f'review_{name}',
                 model="glm-4-flash",
                 max_tokens=2000,
                 messages=[{"role": "user", "content": prompt}]
@@ -1038,66 +1226,105 @@ class ToutiaoArticleGenerator:
 
             response_text = response.content[0].text.strip()
 
-            # 尝试解析JSON
             # 处理可能的markdown代码块
             if response_text.startswith('```'):
                 response_text = re.sub(r'^```json?\s*', '', response_text)
                 response_text = re.sub(r'```\s*$', '', response_text)
 
             result = json.loads(response_text)
-
-            # 验证必要字段
-            if 'opinion' not in result:
-                result['opinion'] = '审校完成'
-            if 'needs_revision' not in result:
-                result['needs_revision'] = True
-            if 'issues' not in result:
-                result['issues'] = []
-            if 'fact_errors' not in result:
-                result['fact_errors'] = []
-            if 'redundant_content' not in result:
-                result['redundant_content'] = []
-            if 'score' not in result:
-                result['score'] = 7
-
-            # 如果有事实错误或冗余内容，强制设置needs_revision
-            if result.get('fact_errors') and len(result['fact_errors']) > 0:
-                result['needs_revision'] = True
-                if result['score'] > 6:
-                    result['score'] = 5
-
-            # 如果有冗余内容，也需要修改
-            if result.get('redundant_content') and len(result['redundant_content']) > 0:
-                result['needs_revision'] = True
-                if result['score'] > 7:
-                    result['score'] = 6  # 有冗余内容，评分降低
-
-            print(f"[作者2] 评分: {result.get('score', 'N/A')}/10")
-            if result.get('fact_errors'):
-                print(f"[作者2] 发现事实错误: {len(result['fact_errors'])}处")
-            if result.get('redundant_content'):
-                print(f"[作者2] 发现冗余内容: {len(result['redundant_content'])}处")
-
+            if not isinstance(result, dict):
+                raise ValueError('not a JSON object')
             return result
 
-        except json.JSONDecodeError as e:
-            print(f"[WARN] 作者2返回非JSON格式，尝试提取信息")
-            # 尝试从文本中提取信息
-            return {
-                'opinion': response_text[:200] if response_text else '审校意见解析失败',
-                'needs_revision': True,
-                'issues': ['审校意见格式异常，建议重新审校'],
-                'fact_errors': [],
-                'redundant_content': [],
-                'fact_errors': [],
-                'score': 6
-            }
+        except (json.JSONDecodeError, ValueError):
+            print(f"[WARN] 作者2({name})返回非JSON格式")
+            return {'raw': response_text}
         except Exception as e:
-            print(f"[ERROR] 作者2审校失败: {e}")
+            print(f"[ERROR] 作者2({name})检查失败: {e}")
             return None
 
-    def _author1_revise(self, theme, title, content, review_opinion, issues, fact_errors, redundant_content, target_length, style):
-        """作者1: 根据审校意见修改文章"""
+    @staticmethod
+    def _merge_review(results, paragraph_count):
+        """按固定规则合并各项检查结果"""
+        facts = results.get('facts') or {}
+        redundancy = results.get('redundancy') or {}
+        style_review = results.get('style') or {}
+
+        result = {
+            'opinion': style_review.get('opinion') or '审校完成',
+            'needs_revision': style_review.get('needs_revision', True),
+            'score': style_review.get('score', 7),
+            'fact_errors': list(facts.get('fact_errors') or []),
+            'redundant_content': list(redundancy.get('redundant_content') or []),
+            'issues': list(style_review.get('issues') or []),
+            'suggestions': list(style_review.get('suggestions') or []),
+        }
+        flagged = set()
+        for check in (facts, redundancy, style_review):
+            flagged.update(parse_paragraph_numbers(check.get('paragraphs'), paragraph_count))
+        result['paragraphs'] = sorted(flagged)
+
+        # 文风检查没有可用结果时与原先解析失败的处理一致：要求修改
+        if 'raw' in style_review or results.get('style') is None:
+            raw = style_review.get('raw', '')
+            result['opinion'] = raw[:200] if raw else '审校意见解析失败'
+            result['needs_revision'] = True
+            result['score'] = 6
+            result['issues'].append('审校意见格式异常，建议重新审校')
+        failed = [name for name, check in results.items() if check is None or 'raw' in check]
+        if failed:
+            result['failed_checks'] = failed
+
+        try:
+            result['score'] = float(result['score'])
+        except (TypeError, ValueError):
+            result['score'] = 7
+
+        # 事实核查或冗余检查没有完成时文章等于未经检查，不能判为通过
+        unchecked = [name for name in ('facts', 'redundancy') if name in failed]
+        if unchecked:
+            result['needs_revision'] = True
+            result['score'] = min(result['score'], 6)
+            result['issues'].append(f"{'、'.join(unchecked)}检查未完成，建议重新审校")
+
+        # 以下规则取代原先提示词中"存在事实错误或大量废话的文章不能超过6分"（文风检查看不到这两项结果）
+        # 如果有事实错误或冗余内容，强制设置needs_revision
+        if result['fact_errors']:
+            result['needs_revision'] = True
+            if result['score'] > 6:
+                result['score'] = 5
+
+        # 如果有冗余内容，也需要修改
+        if result['redundant_content']:
+            result['needs_revision'] = True
+            if result['score'] > 7:
+                result['score'] = 6  # 有冗余内容，评分降低
+
+        print(f"[作者2] 评分: {result['score']:g}/10")
+        if result['fact_errors']:
+            print(f"[作者2] 发现事实错误: {len(result['fact_errors'])}处")
+        if result['redundant_content']:
+            print(f"[作者2] 发现冗余内容: {len(result['redundant_content'])}处")
+        if failed:
+            print(f"[作者2] 未完成的检查: {', '.join(failed)}")
+
+        return result
+
+    def _author1_revise(self, theme, title, content, review_opinion, issues, fact_errors, redundant_content, target_length, style,
+                        flagged_paragraphs=None):
+        """作者1: 根据审校意见修改文章
+
+        flagged_paragraphs为作者2标记的段落编号时只重写这些段落（见 _author1_patch），
+        标记过多或结果无法解析时修改全文
+        """
+        paragraphs = split_paragraphs(content)
+        if flagged_paragraphs and len(flagged_paragraphs) <= len(paragraphs) * REVISION_PATCH_MAX_RATIO:
+            patched = self._author1_patch(theme, title, paragraphs, flagged_paragraphs, review_opinion,
+                                          issues, fact_errors, redundant_content, style)
+            if patched:
+                return patched
+            print("[作者1] 段落修改结果无法使用，改为修改全文")
+
         issues_text = '\n'.join([f"- {issue}" for issue in issues]) if issues else "无其他问题"
         fact_errors_text = '\n'.join([f"🔴 {err}" for err in fact_errors]) if fact_errors else "无事实错误"
         redundant_text = '\n'.join([f"🗑️ {rc}" for rc in redundant_content]) if redundant_content else "无冗余内容"
@@ -1165,7 +1392,8 @@ class ToutiaoArticleGenerator:
 """
 
         try:
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                'revise',
                 model="glm-4-flash",
                 max_tokens=4000,
                 messages=[{"role": "user", "content": prompt}]
@@ -1177,6 +1405,84 @@ class ToutiaoArticleGenerator:
             print(f"[ERROR] 作者1修改失败: {e}")
             return None
 
+    def _author1_patch(self, theme, title, paragraphs, flagged, review_opinion, issues, fact_errors, redundant_content, style):
+        """作者1: 只重写被标记的段落，返回修改后的文章，失败时返回None"""
+        issues_text = '\n'.join([f"- {issue}" for issue in issues]) if issues else "无其他问题"
+        fact_errors_text = '\n'.join([f"🔴 {err}" for err in fact_errors]) if fact_errors else "无事实错误"
+        redundant_text = '\n'.join([f"🗑️ {rc}" for rc in redundant_content]) if redundant_content else "无冗余内容"
+
+        prompt = f"""你是【作者1】，当代顶级文学大师，根据主编的审校意见修改你的文章。本次只需修改主编标记的段落。
+
+## 文章标题
+{title}
+
+## 全文提纲（每段开头，供把握上下文）
+{outline(paragraphs)}
+
+## 需要修改的段落
+{numbered(paragraphs, flagged)}
+
+## 主编审校意见
+{review_opinion}
+
+## 🔴 冗余内容（必须删除）
+{redundant_text}
+
+## 🔴 事实错误（必须修正）
+{fact_errors_text}
+
+## 其他问题
+{issues_text}
+
+## 修改要求
+1. 只输出上面列出的段落：每段先单独一行写原编号(如[P3])，下一行起是修改后的段落内容
+2. 整段都是冗余内容时，内容只写"删除"
+3. 修改后的段落要与上下文衔接自然，文风与原文一致（{style if style and style != 'standard' else '优美雅致，有感染力'}）
+4. 不要输出标题、修改说明或其他段落
+
+## 输出示例
+[P3]
+修改后的第3段内容
+
+[P5]
+删除
+"""
+
+        try:
+            response = self._create_message(
+                'revise',
+                model="glm-4-flash",
+                max_tokens=4000,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            patches = parse_patches(response.content[0].text, set(flagged))
+        except Exception as e:
+            print(f"[ERROR] 作者1修改段落失败: {e}")
+            return None
+
+        if not patches:
+            return None
+        body = join_paragraphs(apply_patches(paragraphs, patches))
+        if len(body) < 50:
+            return None
+        deleted = sum(1 for text in patches.values() if not text)
+        print(f"[作者1] 段落修改: 重写{len(patches) - deleted}段，删除{deleted}段")
+        return {
+            'title': title,
+            'content': body,
+            'word_count': len(body)
+        }
+
+    @staticmethod
+    def _review_summary(review):
+        """审校意见的简短摘要，供下一轮只审阅改动段落时参考"""
+        lines = [f"评分 {review.get('score', 'N/A')}/10：{str(review.get('opinion', ''))[:80]}"]
+        for label, key in (('事实错误', 'fact_errors'), ('冗余内容', 'redundant_content'), ('其他问题', 'issues')):
+            items = review.get(key) or []
+            if items:
+                lines.append(f"{label}: " + '；'.join(str(item)[:40] for item in items[:5]))
+        return '\n'.join(lines)
+
     def _parse_article_response(self, response_text, default_theme):
         """解析AI返回的文章内容"""
         lines = response_text.split('\n')
@@ -1205,7 +1511,8 @@ class ToutiaoArticleGenerator:
             'word_count': len(body)
         }
 
-    def generate_article_images(self, theme, article_content, image_style="realistic", num_images=3):
+    def generate_article_images(self, theme, article_content, image_style="realistic", num_images=3,
+                                max_workers=None, time_budget=None, hedge_delay=None):
         """根据文章主题和内容生成配图，支持多模型降级
 
         Args:
@@ -1213,14 +1520,14 @@ class ToutiaoArticleGenerator:
             article_content: 文章内容
             image_style: 图片风格
             num_images: 配图数量（默认3张）
+            max_workers: 同时生成的图片数（默认 IMAGE_MAX_WORKERS）
+            time_budget: 配图阶段总耗时上限(秒)，超时未完成的图片放弃；默认读取环境变量 ARTICLE_IMAGE_TIME_BUDGET
+            hedge_delay: 对冲模式的等待秒数，当前提供方超时未返回就并行尝试下一个；默认读取环境变量 ARTICLE_IMAGE_HEDGE_DELAY
 
         优先级: Seedream 4.5 -> Seedream 4.0 -> Antigravity -> Pollinations
+        各张图片并行生成，同一提供方的并发请求数受 IMAGE_PROVIDER_LIMITS 限制，结果按提示词顺序返回
         """
 
-        import urllib.parse
-        import requests
-        from io import BytesIO
-
         # 清理主题中的 emoji 和特殊字符
         clean_theme = re.sub(r'[^\u4e00-\u9fff\w\s\-.,]', '', theme)
         clean_theme = clean_theme.strip()[:30]  # 限制长度
@@ -1230,168 +1537,230 @@ class ToutiaoArticleGenerator:
 
         # 根据文章内容提取关键词生成配图提示词
         image_prompts = self._generate_contextual_prompts(clean_theme, article_content, image_style, num_images)
+        if not image_prompts:
+            return []
+
+        if time_budget is None:
+            time_budget = IMAGE_TIME_BUDGET
+        if hedge_delay is None:
+            hedge_delay = IMAGE_HEDGE_DELAY
+        budget = ProviderBudget(IMAGE_RACE_BUDGET) if hedge_delay is not None else None
+        workers = max(1, min(max_workers or IMAGE_MAX_WORKERS, len(image_prompts)))
+        providers = self._image_providers(article_content)
+        with self._image_attempts_lock:
+            self._image_attempts.clear()
+        cancelled = threading.Event()
+        started = time.time()
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='article-image')
+        futures = [
+            # 复制上下文，使工作线程中的输出仍发往当前任务的进度事件
+            executor.submit(contextvars.copy_context().run, self._generate_single_image,
+                            i, img_prompt, img_desc, providers, cancelled, hedge_delay, budget)
+            for i, (img_prompt, img_desc) in enumerate(image_prompts, 1)
+        ]
+        deadline = started + time_budget if time_budget is not None else None
+        done, not_done = set(), set(futures)
+        while not_done:
+            # 分段等待，以便响应调用方的取消(cancel_event)
+            timeout = 0.5 if deadline is None else max(0, min(0.5, deadline - time.time()))
+            finished, not_done = wait(not_done, timeout=timeout)
+            done |= finished
+            if not not_done:
+                break
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                cancelled.set()
+                print(f"[WARN] Image phase cancelled, {len(not_done)} image(s) abandoned")
+                break
+            if deadline is not None and time.time() >= deadline:
+                # 超出时间上限：正在进行的请求无法中断，通知其不再保存结果和尝试后续提供方
+                cancelled.set()
+                print(f"[WARN] Image phase exceeded {time_budget}s, {len(not_done)} image(s) abandoned")
+                break
+        executor.shutdown(wait=False, cancel_futures=True)
+
         generated_images = []
+        for i, future in enumerate(futures, 1):
+            if future not in done:
+                continue
+            try:
+                img_path = future.result()
+            except Exception as e:
+                print(f"[IMAGE {i}] [FAIL] {str(e)[:80]}")
+                continue
+            if img_path:
+                generated_images.append(img_path)
 
-        for i, (img_prompt, img_desc) in enumerate(image_prompts, 1):
-            print(f"[IMAGE {i}] {img_desc}...")
+        print(f"[INFO] Image phase: {len(generated_images)}/{len(image_prompts)} images in {time.time() - started:.1f}s")
+        return generated_images
 
-            image_generated = False
+    def _image_providers(self, article_content):
+        """按降级优先级返回 [(提供方, 模型, 显示名称, 生成函数)]
 
-            # 1. 优先尝试 Seedream 4.5 (火山引擎)
-            if not image_generated and self.volcano_client:
-                try:
-                    print(f"    [TRY] Seedream 4.5...")
-                    response = self.volcano_client.images.generate(
-                        model="doubao-seedream-4-5-251128",
-                        prompt=img_prompt,
-                        size="2K",  # 高分辨率，不限制形状
-                        response_format="url",
-                        extra_body={
-                            "watermark": False,
-                        },
-                    )
-
-                    if hasattr(response, 'data') and len(response.data) > 0:
-                        image_url = response.data[0].url
-                        img_response = requests.get(image_url, timeout=60)
-                        if img_response.status_code == 200:
-                            img = Image.open(BytesIO(img_response.content))
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            safe_desc = "".join(c for c in img_desc if c.isalnum() or c in ('_', '-'))[:20]
-                            filename = f"article_img{i}_{safe_desc}_{timestamp}.jpg"
-                            tool_dir = Path(__file__).parent
-                            img_path = str(tool_dir / filename)
-                            img.save(img_path, 'JPEG', quality=95)
-                            generated_images.append(img_path)
-                            print(f"    [OK] {filename} (Seedream 4.5)")
-                            image_generated = True
-                        else:
-                            print(f"    [WARN] Seedream 4.5 download failed: HTTP {img_response.status_code}")
-                except Exception as e:
-                    error_str = str(e)
-                    if "429" in error_str or "quota" in error_str.lower():
-                        print(f"    [WARN] Seedream 4.5 quota exceeded, trying 4.0...")
-                    else:
-                        print(f"    [WARN] Seedream 4.5 failed: {error_str[:60]}")
-
-            # 2. 如果 Seedream 4.5 失败(配额问题)，尝试 Seedream 4.0
-            if not image_generated and self.volcano_client:
-                try:
-                    print(f"    [TRY] Seedream 4.0...")
-                    response = self.volcano_client.images.generate(
-                        model="doubao-seedream-4-0-250828",
-                        prompt=img_prompt,
-                        size="2K",  # 高分辨率，不限制形状
-                        response_format="url",
-                        extra_body={
-                            "watermark": False,
-                        },
-                    )
-
-                    if hasattr(response, 'data') and len(response.data) > 0:
-                        image_url = response.data[0].url
-                        img_response = requests.get(image_url, timeout=60)
-                        if img_response.status_code == 200:
-                            img = Image.open(BytesIO(img_response.content))
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            safe_desc = "".join(c for c in img_desc if c.isalnum() or c in ('_', '-'))[:20]
-                            filename = f"article_img{i}_{safe_desc}_{timestamp}.jpg"
-                            tool_dir = Path(__file__).parent
-                            img_path = str(tool_dir / filename)
-                            img.save(img_path, 'JPEG', quality=95)
-                            generated_images.append(img_path)
-                            print(f"    [OK] {filename} (Seedream 4.0)")
-                            image_generated = True
-                        else:
-                            print(f"    [WARN] Seedream 4.0 download failed: HTTP {img_response.status_code}")
-                except Exception as e:
-                    print(f"    [WARN] Seedream 4.0 failed: {str(e)[:60]}")
-
-            # 3. 如果 Seedream 都失败，尝试 Antigravity 模型
-            if not image_generated and self.image_client:
-                # 定义 Antigravity 模型优先级
-                antigravity_models = [
-                    {"model": "gemini-3-flash-image", "name": "Gemini 3 Flash"},
-                    {"model": "flux-1.1-pro", "name": "Flux 1.1 Pro"},
-                    {"model": "flux-schnell", "name": "Flux Schnell"},
-                    {"model": "dall-e-3", "name": "DALL-E 3"},
-                ]
+        生成函数接收提示词，返回已流式写入磁盘的临时文件(image_ingest.IngestedImage)
+        """
+        providers = []
+        if self.volcano_client:
+            for model, name in (("doubao-seedream-4-5-251128", 'Seedream 4.5'),
+                                ("doubao-seedream-4-0-250828", 'Seedream 4.0')):
+                providers.append(('volcano', model, name,
+                                  lambda prompt, model=model: self._seedream_image(prompt, model)))
+
+        if self.image_client:
+            # Antigravity 模型优先级
+            antigravity_models = [
+                {"model": "gemini-3-flash-image", "name": "Gemini 3 Flash"},
+                {"model": "flux-1.1-pro", "name": "Flux 1.1 Pro"},
+                {"model": "flux-schnell", "name": "Flux Schnell"},
+                {"model": "dall-e-3", "name": "DALL-E 3"},
+            ]
+            for model_info in antigravity_models:
+                providers.append(('antigravity', model_info['model'], model_info['name'],
+                                  lambda prompt, model=model_info['model']: self._antigravity_image(prompt, model)))
+
+        # 最后备选：Pollinations.ai（按文章内容选择简单主题词，不使用提示词）
+        providers.append(('pollinations', 'pollinations', 'Pollinations',
+                          lambda prompt: self._pollinations_image(article_content)))
+        return providers
+
+    def _generate_single_image(self, index, img_prompt, img_desc, providers, cancelled,
+                               hedge_delay=None, budget=None):
+        """生成一张配图，返回保存路径，失败或已取消时返回None
+
+        hedge_delay为None时按优先级依次尝试各提供方；否则为对冲模式（见 hedging.race），
+        当前提供方hedge_delay秒内没有结果就并行启动下一个，取最先返回的图片
+        熔断中的 提供方:模型 直接跳过（见 provider_health）
+        """
+        print(f"[IMAGE {index}] {img_desc}...")
+
+        img, name = None, None
+        if hedge_delay is None:
+            for provider, model, provider_name, generate in providers:
+                if cancelled.is_set():
+                    return None
+                img = self._try_image_provider(index, provider, model, provider_name, generate, img_prompt)
+                if img is not None:
+                    name = provider_name
+                    break
+        else:
+            health = get_provider_health()
+            candidates = [
+                (provider, provider_name,
+                 functools.partial(self._try_image_provider, index, provider, model, provider_name, generate, img_prompt))
+                for provider, model, provider_name, generate in providers
+                if not health.remaining(f"{provider}:{model}")
+            ]
+            name, img = race(candidates, hedge_delay, budget=budget, cancelled=cancelled,
+                             on_discard=lambda loser, result: discard(result),
+                             log=lambda message: print(f"    [IMAGE {index}] {message}"))
 
-                for model_info in antigravity_models:
-                    if image_generated:
-                        break
-                    try:
-                        print(f"    [TRY] {model_info['name']}...")
-                        response = self.image_client.images.generate(
-                            model=model_info["model"],
-                            prompt=img_prompt,
-                            size="1024x1024",
-                            n=1,
-                        )
-
-                        if hasattr(response, 'data') and len(response.data) > 0:
-                            image_data = response.data[0]
-                            b64_json = getattr(image_data, 'b64_json', None)
-
-                            if b64_json:
-                                image_bytes = base64.b64decode(b64_json)
-                                img = Image.open(io.BytesIO(image_bytes))
-                                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                safe_desc = "".join(c for c in img_desc if c.isalnum() or c in ('_', '-'))[:20]
-                                filename = f"article_img{i}_{safe_desc}_{timestamp}.jpg"
-                                tool_dir = Path(__file__).parent
-                                img_path = str(tool_dir / filename)
-                                img.save(img_path, 'JPEG', quality=95)
-                                generated_images.append(img_path)
-                                print(f"    [OK] {filename} ({model_info['name']})")
-                                image_generated = True
-                    except Exception as e:
-                        error_str = str(e)
-                        if "404" in error_str or "NOT_FOUND" in error_str:
-                            print(f"    [SKIP] {model_info['name']}: not available")
-                        elif "429" in error_str or "quota" in error_str.lower():
-                            print(f"    [SKIP] {model_info['name']}: quota exceeded")
-                        else:
-                            print(f"    [WARN] {model_info['name']} failed: {error_str[:50]}")
-
-            # 4. 最后备选：Pollinations.ai
-            if not image_generated:
-                print(f"    [FALLBACK] Trying Pollinations.ai...")
-                try:
-                    content_lower = article_content.lower() if article_content else ""
-                    if any(kw in content_lower for kw in ['ai', 'glm', 'artificial', 'model', 'code']):
-                        simple_topic = "robot"
-                    elif any(kw in content_lower for kw in ['food', 'cook', 'recipe', '美食']):
-                        simple_topic = "food"
-                    elif any(kw in content_lower for kw in ['travel', 'landscape', '风景']):
-                        simple_topic = "landscape"
-                    else:
-                        simple_topic = "technology"
-
-                    encoded_prompt = urllib.parse.quote(simple_topic)
-                    pollinations_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}"
-
-                    response = requests.get(pollinations_url, timeout=90)
-                    if response.status_code == 200:
-                        img = Image.open(BytesIO(response.content))
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        filename = f"article_img{i}_{img_desc}_{timestamp}.jpg"
-                        tool_dir = Path(__file__).parent
-                        img_path = str(tool_dir / filename)
-                        img.save(img_path, 'JPEG', quality=95)
-                        generated_images.append(img_path)
-                        print(f"    [OK] {filename} (Pollinations)")
-                        image_generated = True
-                    else:
-                        print(f"    [FAIL] Pollinations HTTP {response.status_code}")
-
-                except Exception as e2:
-                    print(f"    [FAIL] Pollinations error: {str(e2)[:80]}")
-
-            if not image_generated:
-                print(f"    [FAIL] Could not generate image {i}")
+        if cancelled.is_set():
+            discard(img)
+            return None
+        if img is None:
+            print(f"    [IMAGE {index}] [FAIL] Could not generate image {index}")
+            return None
 
-        return generated_images
+        # 原图不重新编码；资源模式下顺带生成HTML用的缩略图(与缩放共用一次解码)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        safe_desc = "".join(c for c in img_desc if c.isalnum() or c in ('_', '-'))[:20]
+        rendition_dir = IMAGE_DIR / ASSET_DIR_NAME if default_image_mode() == 'assets' else None
+        try:
+            img_path = finalize_image(img, IMAGE_DIR / f"article_img{index}_{safe_desc}_{timestamp}",
+                                      max_width=IMAGE_MAX_WIDTH, rendition_dir=rendition_dir)
+        except Exception as e:
+            discard(img)
+            print(f"    [IMAGE {index}] [FAIL] Could not save image: {str(e)[:60]}")
+            return None
+        print(f"    [IMAGE {index}] [OK] {Path(img_path).name} ({name}, {img.size // 1024}KB)")
+        return img_path
+
+    def _try_image_provider(self, index, provider, model, name, generate, img_prompt):
+        """调用一个提供方生成图片，更新熔断状态；失败或熔断中时返回None"""
+        health = get_provider_health()
+        key = f"{provider}:{model}"
+        if not health.available(key):
+            print(f"    [IMAGE {index}] [SKIP] {name}: circuit open ({health.remaining(key)}s left)")
+            return None
+
+        print(f"    [IMAGE {index}] [TRY] {name}...")
+        with self._image_attempts_lock:
+            retries = self._image_attempts.get(index, 0)
+            self._image_attempts[index] = retries + 1
+        try:
+            with _provider_slot(provider):
+                with self.trace.span('image', 'image', provider=provider, model=model,
+                                     image=index, retries=retries) as span:
+                    img = generate(img_prompt)
+                    span['bytes'] = getattr(img, 'size', 0)
+        except Exception as e:
+            error_str = str(e)
+            kind = health.record_failure(key, e)
+            if kind == 'not_found':
+                print(f"    [IMAGE {index}] [SKIP] {name}: not available")
+            elif kind == 'quota':
+                print(f"    [IMAGE {index}] [SKIP] {name}: quota exceeded")
+            elif kind == 'capacity':
+                print(f"    [IMAGE {index}] [SKIP] {name}: over capacity")
+            else:
+                print(f"    [IMAGE {index}] [WARN] {name} failed: {error_str[:60]}")
+            return None
+
+        health.record_success(key)
+        if img is None:
+            print(f"    [IMAGE {index}] [WARN] {name} returned no image")
+        return img
+
+    def _seedream_image(self, prompt, model):
+        """火山引擎 Seedream 生成图片并流式下载"""
+        response = self.volcano_client.images.generate(
+            model=model,
+            prompt=prompt,
+            size="2K",  # 高分辨率，不限制形状
+            response_format="url",
+            extra_body={
+                "watermark": False,
+            },
+        )
+        if not (hasattr(response, 'data') and len(response.data) > 0):
+            return None
+
+        return ingest_url(response.data[0].url, IMAGE_DIR, timeout=60)
+
+    def _antigravity_image(self, prompt, model):
+        """Antigravity 代理生成图片（base64返回）"""
+        response = self.image_client.images.generate(
+            model=model,
+            prompt=prompt,
+            size="1024x1024",
+            n=1,
+        )
+        if not (hasattr(response, 'data') and len(response.data) > 0):
+            return None
+
+        b64_json = getattr(response.data[0], 'b64_json', None)
+        if not b64_json:
+            return None
+        return ingest_bytes(base64.b64decode(b64_json), IMAGE_DIR)
+
+    def _pollinations_image(self, article_content):
+        """Pollinations.ai 免费生成（根据文章内容选择简单主题词）"""
+        import urllib.parse
+
+        content_lower = article_content.lower() if article_content else ""
+        if any(kw in content_lower for kw in ['ai', 'glm', 'artificial', 'model', 'code']):
+            simple_topic = "robot"
+        elif any(kw in content_lower for kw in ['food', 'cook', 'recipe', '美食']):
+            simple_topic = "food"
+        elif any(kw in content_lower for kw in ['travel', 'landscape', '风景']):
+            simple_topic = "landscape"
+        else:
+            simple_topic = "technology"
+
+        encoded_prompt = urllib.parse.quote(simple_topic)
+        pollinations_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}"
+
+        return ingest_url(pollinations_url, IMAGE_DIR, timeout=90)
 
     def _generate_contextual_prompts(self, theme, content, style, num_images=3):
         """使用AI大模型根据文章内容智能生成上下文相关的图片提示词
@@ -1442,7 +1811,8 @@ class ToutiaoArticleGenerator:
             print("[AI] Generating contextual image prompts...")
 
             # 使用ZhipuAI生成提示词
-            response = self.text_client.messages.create(
+            response = self._create_message(
+                'image_prompts',
                 model="glm-4.6",
                 max_tokens=500,
                 messages=[{"role": "user", "content": ai_prompt}]
@@ -1548,11 +1918,19 @@ class ToutiaoArticleGenerator:
 
         return list(zip(prompts, descs))
 
-    def create_article_html(self, title, content, theme, images=None):
-        """创建HTML格式的文章(配图插入到段落之间)"""
+    def create_article_html(self, title, content, theme, images=None, html_path=None, image_mode=None):
+        """创建HTML格式的文章(配图插入到段落之间)
+
+        Args:
+            html_path: HTML将要保存的路径；配图缩放版本写入其旁边的 assets/ 目录
+            image_mode: 'assets'(默认，外部文件) 或 'inline'(单文件导出，原图base64内嵌)；
+                        未提供html_path时只能内嵌
+        """
+        image_mode = image_mode or default_image_mode()
+        html_dir = Path(html_path).parent if html_path and image_mode == 'assets' else None
 
         # 将内容分割成段落
-        formatted_content = self._format_content_with_images(content, images)
+        formatted_content = self._format_content_with_images(content, images, html_dir=html_dir)
 
         html_content = f"""<!DOCTYPE html>
 <html lang="zh-CN">
@@ -1696,8 +2074,8 @@ class ToutiaoArticleGenerator:
 
         return html_content
 
-    def _format_content_with_images(self, content, images=None):
-        """将内容格式化为HTML，并将图片插入到段落之间"""
+    def _format_content_with_images(self, content, images=None, html_dir=None):
+        """将内容格式化为HTML，并将图片插入到段落之间（html_dir为None时图片base64内嵌）"""
 
         import re
         import os
@@ -1751,16 +2129,20 @@ class ToutiaoArticleGenerator:
                 if image_index < num_images and current_paragraph in image_insert_points:
                     img = images[image_index]
 
-                    # 将图片转为Base64嵌入HTML，这样HTML单独打开时也能显示图片
-                    img_url = img  # 默认使用路径
-                    try:
-                        with open(img, 'rb') as f:
-                            img_data = f.read()
-                        img_base64 = base64.b64encode(img_data).decode('utf-8')
-                        img_url = f"data:image/jpeg;base64,{img_base64}"
-                    except Exception as e:
-                        # 如果读取失败，使用相对路径
-                        img_url = os.path.basename(img)
+                    # 资源模式: 缩放后的图片写入assets/，srcset按需加载；单文件导出: 原图Base64嵌入HTML
+                    attrs = None
+                    if html_dir is not None:
+                        try:
+                            attrs = image_tag_attrs(img, html_dir)
+                        except Exception as e:
+                            print(f"[WARN] 配图资源生成失败，改为内嵌: {e}")
+                    if attrs is None:
+                        try:
+                            attrs = {'src': inline_data_url(img)}
+                        except Exception as e:
+                            # 如果读取失败，使用相对路径
+                            attrs = {'src': os.path.basename(img)}
+                    img_attrs = ' '.join(f'{key}="{value}"' for key, value in attrs.items())
 
                     # 图片描述
                     captions = ["Main scene", "Detail view", "Context view"]
@@ -1768,7 +2150,7 @@ class ToutiaoArticleGenerator:
 
                     html_paragraphs.append(f'''
 <div class="article-image">
-    <img src="{img_url}" alt="Article image">
+    <img {img_attrs} alt="Article image">
     <div class="caption">{caption}</div>
 </div>''')
                     image_index += 1
@@ -1778,6 +2160,20 @@ class ToutiaoArticleGenerator:
         return '\n'.join(html_paragraphs)
 
 
+def report_trace(generator, name):
+    """输出本次生成各阶段的调用汇总表，并保存逐条调用记录(JSONL)，返回记录文件路径"""
+    generator.trace.name = name
+    print("\n[调用统计]")
+    print(generator.trace.format_summary())
+    try:
+        trace_path = generator.trace.write_jsonl()
+    except OSError as e:
+        print(f"[调用统计] 保存失败: {e}")
+        return None
+    print(f"[调用统计] 调用记录已保存: {trace_path}")
+    return str(trace_path)
+
+
 def get_user_input_mode():
     """获取用户选择:主题生成 or 草稿完善"""
 
@@ -2225,13 +2621,16 @@ def main():
     # 保存为HTML文件
     html_filename = f"{file_prefix}_{theme}_{timestamp}.html"
     html_path = str(tool_dir / html_filename)
-    html_content = generator.create_article_html(article['title'], article['content'], theme, generated_images)
+    html_content = generator.create_article_html(article['title'], article['content'], theme, generated_images,
+                                                 html_path=html_path)
 
     with open(html_path, 'w', encoding='utf-8') as f:
         f.write(html_content)
 
     print(f"[成功] HTML文件已保存: {html_path}")
 
+    report_trace(generator, Path(html_path).stem)
+
     # 自动打开HTML文件
     try:
         import webbrowser
@@ -2263,6 +2662,25 @@ def main_web():
     print("[INFO] Web Mode - main_web() started")
     print("="*60 + "\n")
 
+    # 运行清单（由工具管理器启动时才有），管理器据此判断是否完成
+    manifest = RunManifest.from_env()
+    result = _main_web(manifest)
+
+    cache_stats = default_cache_stats()
+    if cache_stats:
+        print(f"[LLM缓存] 命中 {cache_stats['hits']} 次, 未命中 {cache_stats['misses']} 次, "
+              f"缓存条目 {cache_stats['entries']} 个 ({cache_stats['size_bytes'] / 1024:.0f} KB)")
+    if manifest:
+        if result.get('error'):
+            manifest.finish('failed', error=result['error'])
+        elif manifest.data['status'] == 'running':
+            manifest.finish('completed')
+    return result
+
+
+def _main_web(manifest):
+    """main_web的实际流程"""
+
     try:
         # 读取JSON参数文件
         params_json_path = os.environ.get('ARTICLE_PARAMS_JSON', 'article_params.json')
@@ -2390,6 +2808,9 @@ def main_web():
         else:
             return {"error": f"Invalid mode: {mode}"}
 
+        if manifest:
+            manifest.mark('text')
+
         # 生成配图（如果启用）
         generated_images = None
         if generate_images == 'y':
@@ -2407,6 +2828,8 @@ def main_web():
             except Exception as e:
                 print(f"[WARN] Image generation failed: {e}")
                 generated_images = None
+            if manifest:
+                manifest.mark('images')
 
         # 保存文章到文件
         print("[INFO] Saving article to files...")
@@ -2444,12 +2867,23 @@ def main_web():
             article['title'],
             article['content'],
             theme if theme else 'Draft',
-            generated_images  # 传入配图
+            generated_images,  # 传入配图
+            html_path=html_path
         )
         with open(html_path, 'w', encoding='utf-8') as f:
             f.write(html_content)
         print(f"[INFO] HTML saved: {html_filename}")
 
+        trace_path = report_trace(generator, Path(html_path).stem)
+
+        if manifest:
+            manifest.add_output(md_path, 'markdown')
+            manifest.add_output(html_path, 'html')
+            if trace_path:
+                manifest.add_output(trace_path, 'trace')
+            manifest.mark('save')
+            manifest.finish('completed')
+
         # 添加文件路径到结果
         result['md_file'] = md_filename
         result['html_file'] = html_filename
@@ -17,6 +17,7 @@ from datetime import datetime
 import json
 import base64
 import re
+import threading
 from flask import Flask, request, jsonify, render_template_string, make_response
 from flask_cors import CORS
 
@@ -24,7 +25,10 @@ from flask_cors import CORS
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # 导入原有的生成器类
-from article.toutiao_article_generator import ToutiaoArticleGenerator
+from article.toutiao_article_generator import MAX_DRAFT_CANDIDATES, ToutiaoArticleGenerator, report_trace
+from llm_cache import LLMCallCancelled
+from progress_events import emit, emit_log, job_events
+from job_queue import FINISHED_STATES, JobEventLog, JobQueue
 
 app = Flask(__name__)
 CORS(app)
@@ -97,6 +101,21 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         .progress-log .success { color: #48bb78; }
         .progress-log .error { color: #f56565; }
         .progress-log .info { color: #4299e1; }
+        .live-output {
+            margin-top: 10px; padding: 15px; background: white; border: 1px solid #e2e8f0; border-radius: 8px;
+            max-height: 300px; overflow-y: auto; white-space: pre-wrap; line-height: 1.7; display: none;
+        }
+        .live-output .stage-title { display: block; margin: 8px 0 4px; font-weight: 600; color: #667eea; }
+        .waterfall { margin-top: 10px; padding: 10px 15px; background: white; border: 1px solid #e2e8f0; border-radius: 8px; font-size: 0.85em; display: none; }
+        .waterfall-row { display: flex; align-items: center; height: 20px; }
+        .waterfall-label { width: 130px; flex-shrink: 0; overflow: hidden; white-space: nowrap; text-overflow: ellipsis; color: #4a5568; }
+        .waterfall-track { position: relative; flex: 1; height: 12px; background: #f7fafc; }
+        .waterfall-bar { position: absolute; top: 0; height: 12px; min-width: 2px; border-radius: 2px; background: #667eea; }
+        .waterfall-bar.image { background: #ed8936; }
+        .waterfall-bar.search { background: #38b2ac; }
+        .waterfall-bar.cached { opacity: 0.4; }
+        .waterfall-bar.error, .waterfall-bar.cancelled { background: #f56565; }
+        .waterfall-total { margin-top: 6px; color: #a0aec0; }
         .result-section { margin-top: 20px; display: none; }
         .result-section.active { display: block; }
         .result-card { background: #f7fafc; border-radius: 10px; padding: 20px; margin-bottom: 15px; }
@@ -219,6 +238,9 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 <div class="form-group">
                     <label>生成配图 <small style="color: #a0aec0; font-weight: normal;">(0=不生成)</small></label>
                     <input type="number" id="image-count-input" value="3" min="0" max="10" step="1" placeholder="0-10">
+                    <label class="save-template-label" title="配图以base64内嵌，HTML可单独分发，但文件较大">
+                        <input type="checkbox" id="single-file-checkbox"> 单文件导出(配图内嵌)
+                    </label>
                 </div>
             </div>
 
@@ -239,6 +261,11 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             <div class="progress-section" id="progress-section">
                 <h3>生成进度</h3>
                 <div class="progress-log" id="progress-log"></div>
+                <div class="live-output" id="live-output"></div>
+                <div class="waterfall" id="waterfall"></div>
+                <div class="btn-group">
+                    <button class="action-btn btn-secondary hidden" id="cancel-btn" onclick="cancelGeneration()">取消生成</button>
+                </div>
             </div>
 
             <div class="result-section" id="result-section">
@@ -248,6 +275,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                     <div class="btn-group">
                         <button class="action-btn btn-primary" onclick="openHtmlFile()">打开HTML文件</button>
                         <button class="action-btn btn-secondary" onclick="copyContent()">复制内容</button>
+                        <button class="action-btn btn-secondary" onclick="generateArticle(true)" title="相同参数重新写一篇（不使用缓存）">换一篇</button>
                         <button class="action-btn btn-secondary" onclick="resetForm()">重新生成</button>
                     </div>
                 </div>
@@ -274,6 +302,16 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
     <script>
         let currentMode = 'theme';
         let generatedFiles = {};
+        let currentJobId = null;
+        let currentStage = null;
+        var stageBlocks = {};
+        var liveSpans = [];
+        var STAGE_NAMES = {draft: '初稿', review: '审校', revise: '修改', improve: '润色', image_prompts: '配图提示词',
+                           review_facts: '审校·事实核查', review_redundancy: '审校·冗余检查', review_style: '审校·文风与篇幅'};
+
+        function isParallelStage(stage) {
+            return !!stage && (stage.indexOf('review_') === 0 || stage.indexOf('draft_') === 0);
+        }
 
         function selectDraftFile() {
             var path = prompt('请输入草稿文件的完整路径:\\n\\n例如: C:\\\\Users\\\\xxx\\\\Documents\\\\draft.txt\\n或者: article/draft.txt (相对路径)');
@@ -310,7 +348,49 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             logDiv.scrollTop = logDiv.scrollHeight;
         }
 
-        function generateArticle() {
+        function appendToken(stage, text) {
+            var liveDiv = document.getElementById('live-output');
+            liveDiv.style.display = 'block';
+            // 并行审校的几项检查同时输出，各自追加到自己的段落中
+            var block = stageBlocks[stage];
+            if (!block || (stage !== currentStage && !isParallelStage(stage))) {
+                if (!isParallelStage(stage) || !isParallelStage(currentStage)) {
+                    stageBlocks = {};
+                }
+                var title = document.createElement('span');
+                title.className = 'stage-title';
+                var stageName = STAGE_NAMES[stage] ||
+                    (stage.indexOf('draft_') === 0 ? '候选初稿' + stage.substring(6) : stage);
+                title.textContent = '【' + stageName + '】';
+                liveDiv.appendChild(title);
+                block = document.createElement('span');
+                liveDiv.appendChild(block);
+                stageBlocks[stage] = block;
+            }
+            currentStage = stage;
+            block.appendChild(document.createTextNode(text));
+            liveDiv.scrollTop = liveDiv.scrollHeight;
+        }
+
+        function cancelGeneration() {
+            if (!currentJobId) {
+                return;
+            }
+            document.getElementById('cancel-btn').disabled = true;
+            fetch('/api/cancel/' + currentJobId, { method: 'POST' });
+            addLog('info', '正在取消...');
+        }
+
+        function finishGeneration() {
+            var btn = document.getElementById('generate-btn');
+            btn.disabled = false;
+            btn.textContent = '开始生成';
+            currentJobId = null;
+            document.getElementById('cancel-btn').classList.add('hidden');
+        }
+
+        // force=true 时即使已有相同参数的任务也重新生成
+        function generateArticle(force) {
             var btn = document.getElementById('generate-btn');
             var progressSection = document.getElementById('progress-section');
             var resultSection = document.getElementById('result-section');
@@ -348,6 +428,12 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             progressSection.classList.add('active');
             resultSection.classList.remove('active');
             progressLog.innerHTML = '';
+            document.getElementById('live-output').innerHTML = '';
+            document.getElementById('live-output').style.display = 'none';
+            currentStage = null;
+            stageBlocks = {};
+            liveSpans = [];
+            renderWaterfall(liveSpans);
 
             addLog('info', '正在启动生成任务...');
 
@@ -360,50 +446,92 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 style: styleInput || 'standard',
                 image_count: imageCount,
                 image_style: imageStyle,
+                single_file: document.getElementById('single-file-checkbox').checked,
                 collaborative: currentMode === 'collaborative' ? 'y' : 'n',
-                max_rounds: parseInt(rounds)
+                max_rounds: parseInt(rounds),
+                force: force === true
             };
 
             fetch('/api/generate', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(requestData)
-            }).then(function(response) {
-                var reader = response.body.getReader();
-                var decoder = new TextDecoder();
-
-                function read() {
-                    return reader.read().then(function(result) {
-                        if (result.done) {
-                            btn.disabled = false;
-                            btn.textContent = '开始生成';
-                            return;
+            }).then(readEventStream).catch(function(error) {
+                addLog('error', '请求失败: ' + error.message);
+                finishGeneration();
+            });
+        }
+
+        // 读取任务的SSE进度流（提交新任务和页面刷新后继续跟随共用）
+        function readEventStream(response) {
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = '';
+
+            function read() {
+                return reader.read().then(function(result) {
+                    if (result.done) {
+                        finishGeneration();
+                        return;
+                    }
+                    // 事件可能被拆分到多个数据块中，最后一段不完整的行留到下次处理
+                    buffer += decoder.decode(result.value, { stream: true });
+                    var lines = buffer.split('\\n');
+                    buffer = lines.pop();
+                    lines.forEach(function(line) {
+                        if (line.startsWith('data: ')) {
+                            try {
+                                var data = JSON.parse(line.slice(6));
+                                if (data.type === 'start') {
+                                    currentJobId = data.job_id;
+                                    localStorage.setItem('toutiaoCurrentJob', data.job_id);
+                                    var cancelBtn = document.getElementById('cancel-btn');
+                                    cancelBtn.disabled = false;
+                                    cancelBtn.classList.remove('hidden');
+                                } else if (data.type === 'token') {
+                                    appendToken(data.stage, data.text);
+                                } else if (data.type === 'span') {
+                                    liveSpans.push(data.span);
+                                    renderWaterfall(liveSpans);
+                                } else if (data.type === 'cancelled') {
+                                    localStorage.removeItem('toutiaoCurrentJob');
+                                    addLog('error', data.message);
+                                } else if (data.type === 'log') {
+                                    addLog(data.level || 'info', data.message);
+                                } else if (data.type === 'complete') {
+                                    localStorage.removeItem('toutiaoCurrentJob');
+                                    generatedFiles = data.files || {};
+                                    showResult(data);
+                                } else if (data.type === 'error') {
+                                    localStorage.removeItem('toutiaoCurrentJob');
+                                    addLog('error', data.message);
+                                }
+                            } catch (e) {}
                         }
-                        var text = decoder.decode(result.value);
-                        var lines = text.split('\\n');
-                        lines.forEach(function(line) {
-                            if (line.startsWith('data: ')) {
-                                try {
-                                    var data = JSON.parse(line.slice(6));
-                                    if (data.type === 'log') {
-                                        addLog(data.level || 'info', data.message);
-                                    } else if (data.type === 'complete') {
-                                        generatedFiles = data.files || {};
-                                        showResult(data);
-                                    } else if (data.type === 'error') {
-                                        addLog('error', data.message);
-                                    }
-                                } catch (e) {}
-                            }
-                        });
-                        return read();
                     });
+                    return read();
+                });
+            }
+            return read();
+        }
+
+        // 页面刷新或关闭前任务仍在进行时，重新打开页面后继续跟随该任务
+        function resumeCurrentJob() {
+            var jobId = localStorage.getItem('toutiaoCurrentJob');
+            if (!jobId) {
+                return;
+            }
+            fetch('/api/jobs/' + jobId + '/events').then(function(response) {
+                if (!response.ok) {
+                    localStorage.removeItem('toutiaoCurrentJob');
+                    return;
                 }
-                return read();
-            }).catch(function(error) {
-                addLog('error', '请求失败: ' + error.message);
-                btn.disabled = false;
-                btn.textContent = '开始生成';
+                var btn = document.getElementById('generate-btn');
+                btn.disabled = true;
+                btn.textContent = '生成中...';
+                document.getElementById('progress-section').classList.add('active');
+                addLog('info', '继续跟随未完成的任务: ' + jobId);
+                return readEventStream(response);
             });
         }
 
@@ -422,6 +550,48 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             if (data.images && data.images.length > 0) {
                 addLog('success', '生成配图: ' + data.images.length + '张');
             }
+            if (data.trace) {
+                renderWaterfall(data.trace.spans, data.trace.wall_time);
+            }
+        }
+
+        // 调用瀑布图：每个外部调用一行，横条位置和长度对应开始时间和耗时
+        function renderWaterfall(spans, total) {
+            var container = document.getElementById('waterfall');
+            if (!spans || spans.length === 0) {
+                container.innerHTML = '';
+                container.style.display = 'none';
+                return;
+            }
+            spans = spans.slice().sort(function(a, b) { return a.start - b.start; });
+            spans.forEach(function(span) {
+                total = Math.max(total || 0, span.start + span.duration);
+            });
+            var html = '';
+            spans.forEach(function(span) {
+                var label = STAGE_NAMES[span.stage] || span.stage;
+                var tip = label + ' | ' + (span.provider || '') + ' ' + (span.model || '') +
+                    ' | ' + span.duration.toFixed(1) + 's';
+                if (span.input_tokens || span.output_tokens) {
+                    tip += ' | tokens ' + span.input_tokens + '/' + span.output_tokens;
+                }
+                if (span.cost !== null && span.cost !== undefined) {
+                    tip += ' | ¥' + span.cost.toFixed(4);
+                }
+                if (span.cached) { tip += ' | 缓存'; }
+                if (span.retries) { tip += ' | 重试' + span.retries + '次'; }
+                if (span.status !== 'ok') { tip += ' | ' + span.status; }
+                var classes = 'waterfall-bar ' + span.kind + (span.cached ? ' cached' : '') +
+                    (span.status !== 'ok' ? ' ' + span.status : '');
+                html += '<div class="waterfall-row" title="' + escapeHtml(tip).replace(/"/g, '&quot;') + '">' +
+                    '<span class="waterfall-label">' + escapeHtml(label) + '</span>' +
+                    '<div class="waterfall-track"><div class="' + classes + '" style="left: ' +
+                    (span.start / total * 100).toFixed(2) + '%; width: ' + (span.duration / total * 100).toFixed(2) +
+                    '%;"></div></div></div>';
+            });
+            html += '<div class="waterfall-total">共' + spans.length + '次调用，总耗时 ' + total.toFixed(1) + 's</div>';
+            container.innerHTML = html;
+            container.style.display = 'block';
         }
 
         function openHtmlFile() {
@@ -617,6 +787,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         // 页面加载时恢复参数
         window.onload = function() {
             loadParams();
+            resumeCurrentJob();
         };
 
         // 页面关闭前保存参数
@@ -628,186 +799,303 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 </html>'''
 
 
-def stream_generator(gen, params):
-    """生成器函数，流式返回进度"""
-    import queue
-    import threading
-
-    output_queue = queue.Queue()
+# 任务队列（SQLite持久化，服务重启后未完成的任务重新排队）和工作线程数
+JOB_DB_PATH = Path(os.environ.get('ARTICLE_JOB_DB', Path(__file__).parent / 'article_jobs.db'))
+GENERATION_WORKERS = int(os.environ.get('ARTICLE_WEB_WORKERS', '2'))
+job_queue = JobQueue(JOB_DB_PATH)
+job_wakeup = threading.Event()
+
+# 本进程中任务的运行时状态: job_id -> {'events': JobEventLog, 'cancel': threading.Event}
+job_runtime = {}
+job_runtime_lock = threading.Lock()
+
+
+def get_job_runtime(job_id):
+    with job_runtime_lock:
+        runtime = job_runtime.get(job_id)
+        if runtime is None:
+            runtime = {'events': JobEventLog(), 'cancel': threading.Event()}
+            job_runtime[job_id] = runtime
+        return runtime
+
+
+def run_generation(gen, params, cancel_event):
+    """执行一次文章生成（进度通过 progress_events 发出），返回结果摘要
+
+    Raises:
+        ValueError: 参数错误或生成失败
+        LLMCallCancelled: 任务被取消
+    """
+    # 获取文风描述 - 如果有自定义文风则使用，否则使用默认值
+    style = params.get('style', '').strip()
+    if not style:
+        style = 'standard'
+
+    # 检查是否使用协作模式
+    use_collaborative = params.get('collaborative', 'n') == 'y'
+    max_rounds = params.get('max_rounds', 3)
+
+    if params['mode'] == '1':
+        # 主题生成模式
+        target_length = params['length']
+        length_desc = "自动" if target_length == 0 else f"{target_length}字"
+
+        if use_collaborative:
+            # 协作模式 - 双作者协作
+            emit_log(f"开始协作生成文章，主题: {params['theme']}")
+            emit_log(f"模式: 双作者协作 (最多{max_rounds}轮)")
+            emit_log(f"目标长度: {length_desc}")
+            if style != 'standard':
+                emit_log(f"文风: {style[:50]}...")
+            result = gen.generate_article_collaborative(
+                theme=params['theme'],
+                target_length=target_length,
+                style=style,
+                max_rounds=max_rounds,
+                num_drafts=int(params.get('num_drafts') or 0) or None
+            )
+        else:
+            # 快速模式 - 单次生成
+            emit_log(f"开始生成文章，主题: {params['theme']}")
+            emit_log(f"目标长度: {length_desc}")
+            if style != 'standard':
+                emit_log(f"文风: {style[:50]}...")
+            result = gen.generate_article_with_ai(
+                theme=params['theme'],
+                target_length=target_length,
+                style=style
+            )
+    else:
+        # 草稿完善模式 - 从文件读取草稿内容
+        draft_path = params.get('draft_path', '').strip()
+        if not draft_path:
+            raise ValueError('草稿文件路径不能为空')
+
+        # 解析文件路径
+        base_dir = Path(__file__).parent.parent
+        if os.path.isabs(draft_path):
+            file_path = Path(draft_path)
+        else:
+            # 相对路径，相对于post目录
+            file_path = base_dir / draft_path
+
+        if not file_path.exists():
+            raise ValueError(f'草稿文件不存在: {file_path}')
+
+        emit_log(f'读取草稿文件: {file_path}')
+        with open(file_path, 'r', encoding='utf-8') as f:
+            draft_content = f.read()
+
+        emit_log(f'草稿内容: {len(draft_content)}字')
+        if style != 'standard':
+            emit_log(f"文风: {style[:50]}...")
+
+        result = gen.improve_article_draft(
+            draft_content=draft_content,
+            target_length=params['length'],
+            style=style
+        )
+
+    if not result:
+        raise ValueError('生成失败，请检查输入参数')
+
+    emit_log(f"文章生成完成，标题: {result['title']}", 'success')
+    emit_log(f"字数: {result['word_count']}")
+
+    # 如果是协作模式，显示协作轮数
+    if result.get('source') == 'collaborative':
+        emit_log(f"协作轮数: {result.get('rounds', 'N/A')}轮", 'success')
+
+    if cancel_event.is_set():
+        raise LLMCallCancelled()
+
+    # 生成配图
+    images = []
+    image_count = params.get('image_count', 0)
+    if image_count > 0:
+        emit_log(f'开始生成{image_count}张配图...')
+        images = gen.generate_article_images(
+            theme=params.get('theme', result['title']),
+            article_content=result['content'],
+            image_style=params.get('image_style', 'realistic'),
+            num_images=image_count
+        )
+        if images:
+            emit_log(f'配图生成完成，共{len(images)}张', 'success')
+        if cancel_event.is_set():
+            raise LLMCallCancelled()
+
+    # 保存HTML文件
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_title = "".join(c for c in result['title'] if c.isalnum() or c in (' ', '_', '-'))[:20]
+    html_filename = f"Article_{safe_title}_{timestamp}.html"
+    md_filename = f"Article_{safe_title}_{timestamp}.md"
+
+    # 使用 create_article_html 生成HTML内容，然后保存到文件
+    # single_file=True 时配图内嵌，得到可以单独分发的HTML
+    article_dir = Path(__file__).parent
+    html_path = article_dir / html_filename
+    html_content = gen.create_article_html(
+        title=result['title'],
+        content=result['content'],
+        theme=params.get('theme', result['title']),
+        images=images,
+        html_path=html_path,
+        image_mode='inline' if params.get('single_file') else None
+    )
 
-    # 重定向print输出到队列
-    original_print = print
+    # 保存HTML文件到article目录
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    emit_log(f'HTML文件已保存: {html_filename}', 'success')
+
+    # 保存Markdown文件
+    md_content = f"# {result['title']}\n\n{result['content']}"
+    md_path = article_dir / md_filename
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(md_content)
+    emit_log(f'Markdown文件已保存: {md_filename}', 'success')
+
+    # 调用统计：控制台输出汇总表，逐条记录保存到 logs/traces
+    if report_trace(gen, Path(html_filename).stem):
+        emit_log('调用记录已保存', 'success')
+
+    return {
+        'title': result['title'],
+        'content': result['content'],
+        'word_count': result['word_count'],
+        'html_file': html_filename,
+        'md_file': md_filename,
+        'images': images,
+        'trace': gen.trace.to_dict(),
+        'files': {
+            'html': f'/view/{html_filename}'
+        }
+    }
 
-    def queued_print(*args, **kwargs):
-        message = ' '.join(str(arg) for arg in args)
-        output_queue.put(('log', 'info', message))
-        original_print(*args, **kwargs)
 
-    # 临时替换print
-    import builtins
-    builtins.print = queued_print
 
-    def run_generation():
+def process_job(job):
+    """工作线程中执行一个任务，进度事件写入该任务的事件缓冲"""
+    runtime = get_job_runtime(job['id'])
+    gen = ToutiaoArticleGenerator(use_llm_cache=not job['params'].get('no_cache'))
+    gen.cancel_event = runtime['cancel']
+    with job_events(runtime['events'].append):
         try:
-            # 获取文风描述 - 如果有自定义文风则使用，否则使用默认值
-            style = params.get('style', '').strip()
-            if not style:
-                style = 'standard'
-
-            # 检查是否使用协作模式
-            use_collaborative = params.get('collaborative', 'n') == 'y'
-            max_rounds = params.get('max_rounds', 3)
-
-            if params['mode'] == '1':
-                # 主题生成模式
-                target_length = params['length']
-                length_desc = "自动" if target_length == 0 else f"{target_length}字"
-
-                if use_collaborative:
-                    # 协作模式 - 双作者协作
-                    output_queue.put(('log', 'info', f"开始协作生成文章，主题: {params['theme']}"))
-                    output_queue.put(('log', 'info', f"模式: 双作者协作 (最多{max_rounds}轮)"))
-                    output_queue.put(('log', 'info', f"目标长度: {length_desc}"))
-                    if style != 'standard':
-                        output_queue.put(('log', 'info', f"文风: {style[:50]}..."))
-                    result = gen.generate_article_collaborative(
-                        theme=params['theme'],
-                        target_length=target_length,
-                        style=style,
-                        max_rounds=max_rounds
-                    )
-                else:
-                    # 快速模式 - 单次生成
-                    output_queue.put(('log', 'info', f"开始生成文章，主题: {params['theme']}"))
-                    output_queue.put(('log', 'info', f"目标长度: {length_desc}"))
-                    if style != 'standard':
-                        output_queue.put(('log', 'info', f"文风: {style[:50]}..."))
-                    result = gen.generate_article_with_ai(
-                        theme=params['theme'],
-                        target_length=target_length,
-                        style=style
-                    )
-            else:
-                # 草稿完善模式 - 从文件读取草稿内容
-                draft_path = params.get('draft_path', '').strip()
-                if not draft_path:
-                    output_queue.put(('error', None, '草稿文件路径不能为空'))
-                    return
-
-                # 解析文件路径
-                base_dir = Path(__file__).parent.parent
-                if os.path.isabs(draft_path):
-                    file_path = Path(draft_path)
-                else:
-                    # 相对路径，相对于post目录
-                    file_path = base_dir / draft_path
-
-                if not file_path.exists():
-                    output_queue.put(('error', None, f'草稿文件不存在: {file_path}'))
-                    return
-
-                output_queue.put(('log', 'info', f'读取草稿文件: {file_path}'))
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    draft_content = f.read()
-
-                output_queue.put(('log', 'info', f'草稿内容: {len(draft_content)}字'))
-                if style != 'standard':
-                    output_queue.put(('log', 'info', f"文风: {style[:50]}..."))
-
-                result = gen.improve_article_draft(
-                    draft_content=draft_content,
-                    target_length=params['length'],
-                    style=style
-                )
-
-            if not result:
-                output_queue.put(('error', None, '生成失败，请检查输入参数'))
+            if runtime['cancel'].is_set():
+                raise LLMCallCancelled()
+            result = run_generation(gen, job['params'], runtime['cancel'])
+            job_queue.finish(job['id'], 'completed', result=result)
+            emit('complete', job_id=job['id'], **result)
+        except LLMCallCancelled:
+            job_queue.finish(job['id'], 'cancelled')
+            emit('cancelled', message='生成已取消')
+        except Exception as e:
+            import traceback
+            message = str(e) if isinstance(e, ValueError) else f'生成错误: {str(e)}'
+            job_queue.finish(job['id'], 'failed', error=message)
+            emit('error', message=message)
+            traceback.print_exc()
+    runtime['events'].close()
+    prune_job_runtime()
+
+
+def prune_job_runtime(keep=50):
+    """只保留最近keep个已结束任务的事件缓冲"""
+    with job_runtime_lock:
+        finished = [job_id for job_id, runtime in job_runtime.items() if runtime['events'].closed]
+        for job_id in finished[:-keep]:
+            del job_runtime[job_id]
+
+
+def job_worker():
+    """工作线程：从队列取任务执行；没有任务时等待提交通知（或每秒检查一次其他进程提交的任务）"""
+    while True:
+        job = job_queue.claim()
+        if job is None:
+            job_wakeup.wait(timeout=1.0)
+            job_wakeup.clear()
+            continue
+        process_job(job)
+
+
+def start_job_workers():
+    """启动工作线程，并把上次中断的任务重新排队"""
+    requeued = job_queue.requeue_running()
+    if requeued:
+        print(f"[任务队列] {requeued} 个中断的任务已重新排队")
+    for i in range(GENERATION_WORKERS):
+        threading.Thread(target=job_worker, daemon=True, name=f'article-job-{i}').start()
+
+
+def follow_job(job_id, offset=0):
+    """SSE: 跟随任务的进度事件，直到任务结束（断开连接不影响任务执行）"""
+    job = job_queue.get(job_id)
+    yield f"data: {json.dumps({'type': 'start', 'job_id': job_id, 'status': job['status']})}\n\n"
+
+    if job['status'] in FINISHED_STATES and job_id not in job_runtime:
+        # 其他进程或重启前完成的任务：直接返回结果
+        yield f"data: {json.dumps(finished_event(job))}\n\n"
+        return
+
+    events = get_job_runtime(job_id)['events']
+    position = job_queue.queue_position(job_id)
+    if position:
+        yield f"data: {json.dumps({'type': 'log', 'level': 'info', 'message': f'排队等待中，前面还有{position}个任务'})}\n\n"
+    while True:
+        batch, offset = events.read(offset)
+        for event in batch:
+            yield f"data: {json.dumps(event)}\n\n"
+        if events.closed and not batch:
+            return
+        if not events.wait(offset, timeout=15):
+            # 长时间没有事件时发送注释行保持连接；任务已在其他进程中结束时直接返回结果
+            job = job_queue.get(job_id)
+            if job['status'] in FINISHED_STATES and not events.closed:
+                yield f"data: {json.dumps(finished_event(job))}\n\n"
                 return
+            yield ": keep-alive\n\n"
 
-            output_queue.put(('log', 'success', f"文章生成完成，标题: {result['title']}"))
-            output_queue.put(('log', 'info', f"字数: {result['word_count']}"))
-
-            # 如果是协作模式，显示协作轮数
-            if result.get('source') == 'collaborative':
-                output_queue.put(('log', 'success', f"协作轮数: {result.get('rounds', 'N/A')}轮"))
-
-            # 生成配图
-            images = []
-            image_count = params.get('image_count', 0)
-            if image_count > 0:
-                output_queue.put(('log', 'info', f'开始生成{image_count}张配图...'))
-                images = gen.generate_article_images(
-                    theme=params.get('theme', result['title']),
-                    article_content=result['content'],
-                    image_style=params.get('image_style', 'realistic'),
-                    num_images=image_count
-                )
-                if images:
-                    output_queue.put(('log', 'success', f'配图生成完成，共{len(images)}张'))
-
-            # 保存HTML文件
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            safe_title = "".join(c for c in result['title'] if c.isalnum() or c in (' ', '_', '-'))[:20]
-            html_filename = f"Article_{safe_title}_{timestamp}.html"
-            md_filename = f"Article_{safe_title}_{timestamp}.md"
-
-            # 使用 create_article_html 生成HTML内容，然后保存到文件
-            html_content = gen.create_article_html(
-                title=result['title'],
-                content=result['content'],
-                theme=params.get('theme', result['title']),
-                images=images
-            )
 
-            # 保存HTML文件到article目录
-            article_dir = Path(__file__).parent
-            html_path = article_dir / html_filename
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            output_queue.put(('log', 'success', f'HTML文件已保存: {html_filename}'))
-
-            # 保存Markdown文件
-            md_content = f"# {result['title']}\n\n{result['content']}"
-            md_path = article_dir / md_filename
-            with open(md_path, 'w', encoding='utf-8') as f:
-                f.write(md_content)
-            output_queue.put(('log', 'success', f'Markdown文件已保存: {md_filename}'))
-
-            output_queue.put(('complete', {
-                'title': result['title'],
-                'content': result['content'],
-                'word_count': result['word_count'],
-                'html_file': html_filename,
-                'md_file': md_filename,
-                'images': images,
-                'files': {
-                    'html': f'/view/{html_filename}'
-                }
-            }))
+def finished_event(job):
+    """已结束任务对应的最终事件"""
+    if job['status'] == 'completed':
+        return {'type': 'complete', 'job_id': job['id'], **(job['result'] or {})}
+    if job['status'] == 'cancelled':
+        return {'type': 'cancelled', 'message': '生成已取消'}
+    return {'type': 'error', 'message': job['error'] or '生成失败'}
 
-        except Exception as e:
-            import traceback
-            output_queue.put(('error', None, f'生成错误: {str(e)}'))
-            traceback.print_exc()
-        finally:
-            builtins.print = original_print
 
-    # 启动生成线程
-    thread = threading.Thread(target=run_generation)
-    thread.start()
+def submit_job(params):
+    """提交生成任务，返回 (job, created)
+
+    force=True 时总是新建任务，并且不使用LLM响应缓存（否则相同参数会得到缓存中的同一篇文章）
+    """
+    force = bool(params.pop('force', False))
+    if force:
+        params['no_cache'] = True
+    job, created = job_queue.submit(params, force=force)
+    if created:
+        job_wakeup.set()
+    return job, created
+
 
-    # 流式返回
-    while thread.is_alive() or not output_queue.empty():
+def validate_params(params):
+    """校验生成参数，返回错误信息或None"""
+    if not isinstance(params, dict):
+        return '参数格式错误'
+    if params.get('mode') == '1' and not params.get('theme'):
+        return '主题不能为空'
+    if params.get('mode') == '2' and not params.get('draft_path'):
+        return '草稿文件路径不能为空'
+    if params.get('num_drafts') not in (None, ''):
         try:
-            item = output_queue.get(timeout=0.5)
-            if item[0] == 'log':
-                yield f"data: {json.dumps({'type': 'log', 'level': item[1], 'message': item[2]})}\n\n"
-            elif item[0] == 'complete':
-                yield f"data: {json.dumps({'type': 'complete', **item[1]})}\n\n"
-            elif item[0] == 'error':
-                yield f"data: {json.dumps({'type': 'error', 'message': item[2]})}\n\n"
-        except queue.Empty:
-            continue
+            num_drafts = int(params['num_drafts'])
+        except (TypeError, ValueError):
+            num_drafts = 0
+        if not 1 <= num_drafts <= MAX_DRAFT_CANDIDATES:
+            return f'候选初稿数必须是1-{MAX_DRAFT_CANDIDATES}之间的整数'
+    return None
 
 
 @app.route('/')
@@ -820,27 +1108,111 @@ def index():
     return response
 
 
+@app.route('/health')
+def health():
+    """健康检查（工具管理器用来判断服务是否已就绪）"""
+    return jsonify({'status': 'ok'})
+
+
 @app.route('/api/generate', methods=['POST'])
 def api_generate():
-    """API: 生成文章"""
+    """API: 生成文章（提交任务并跟随进度；页面断开后任务继续执行）"""
     params = request.json
+    error = validate_params(params)
+    if error:
+        return jsonify({'error': error}), 400
+
+    job, _ = submit_job(params)
+
+    from flask import Response
+    return Response(
+        follow_job(job['id']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-    # 验证参数
-    if params.get('mode') == '1' and not params.get('theme'):
-        return jsonify({'error': '主题不能为空'}), 400
-    if params.get('mode') == '2' and not params.get('draft_path'):
-        return jsonify({'error': '草稿文件路径不能为空'}), 400
 
-    gen = ToutiaoArticleGenerator()
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """API: 提交生成任务，立即返回任务ID（相同参数的任务已存在时返回该任务，传force=true强制新建且不使用缓存）"""
+    params = request.json
+    error = validate_params(params)
+    if error:
+        return jsonify({'error': error}), 400
+
+    job, created = submit_job(params)
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'deduplicated': not created
+    }), 201 if created else 200
+
+
+@app.route('/api/jobs')
+def api_list_jobs():
+    """API: 最近的任务列表（可按status过滤）"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'success': True,
+        'jobs': job_queue.list(status=request.args.get('status'), limit=limit)
+    })
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """API: 任务状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    job.pop('result', None)
+    job['queue_position'] = job_queue.queue_position(job_id)
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/jobs/<job_id>/events')
+def api_follow_job(job_id):
+    """API: SSE跟随任务进度（offset为已收到的事件数，断线重连时从该位置继续）"""
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
 
     from flask import Response
     return Response(
-        stream_generator(gen, params),
-        mimetype='text/event-stream'
+        follow_job(job_id, offset=request.args.get('offset', 0, type=int)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
 
-@app.route('/view/<filename>')
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    """API: 已完成任务的结果"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'error': f"任务未完成（{job['status']}）", 'status': job['status']}), 409
+    return jsonify({'success': True, 'result': job['result']})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@app.route('/api/cancel/<job_id>', methods=['POST'])
+def api_cancel(job_id):
+    """API: 取消任务（排队中的直接取消，运行中的当前阶段模型调用会立即中断）"""
+    previous = job_queue.cancel(job_id)
+    if previous is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if previous in FINISHED_STATES:
+        return jsonify({'error': '任务已结束', 'status': previous}), 409
+    runtime = get_job_runtime(job_id)
+    runtime['cancel'].set()
+    if previous == 'queued':
+        runtime['events'].append({'type': 'cancelled', 'message': '生成已取消'})
+        runtime['events'].close()
+    return jsonify({'success': True, 'status': 'cancelled' if previous == 'queued' else 'cancelling'})
+
+
+@app.route('/view/<path:filename>')
 def view_article(filename):
     """查看生成的文章"""
     article_dir = Path(__file__).parent
@@ -850,11 +1222,14 @@ def view_article(filename):
 
 def main():
     """主函数"""
+    # 工具管理器通过 TOOL_PORT 分配端口，单独运行时使用默认端口
+    port = int(os.environ.get('TOOL_PORT', '5010'))
+
     print("=" * 80)
     print("                    今日头条文章生成器 - Web版 V1.0")
     print("=" * 80)
     print()
-    print("启动Web服务器: http://localhost:5010")
+    print(f"启动Web服务器: http://localhost:{port}")
     print("请在浏览器中打开上述地址")
     print()
     print("功能特性:")
@@ -865,7 +1240,8 @@ def main():
     print("=" * 80)
     print()
 
-    app.run(host='0.0.0.0', port=5010, debug=False, threaded=True)
+    start_job_workers()
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
 
 
 if __name__ == '__main__':
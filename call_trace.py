@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+调用耗时跟踪
+每次外部调用(文本模型、配图、素材搜索)记录为一个span: 阶段、类型、提供方/模型、开始时间、耗时、
+输入/输出token、是否命中缓存、重试次数、状态和估算费用
+
+  - 一次生成结束后用 format_summary() 输出按阶段汇总的表格，write_jsonl() 保存逐条记录
+  - 每个span结束时发出 'span' 进度事件（见 progress_events），Web界面据此绘制瀑布图
+
+费用按 MODEL_PRICES 估算（每千token的 [输入, 输出] 价格，或配图等按次计费的单价），
+可用环境变量 LLM_PRICES 传入JSON覆盖；价格未知的调用费用为None
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from progress_events import emit
+
+DEFAULT_TRACE_DIR = Path(__file__).parent / 'logs' / 'traces'
+
+# 模型 -> [输入, 输出] 每千token价格(元)，或 模型 -> 每次调用价格
+MODEL_PRICES = {
+    'glm-4-flash': [0.0, 0.0],  # 智谱免费模型
+}
+try:
+    MODEL_PRICES.update(json.loads(os.environ.get('LLM_PRICES') or '{}'))
+except ValueError:
+    print("[调用跟踪] LLM_PRICES 不是有效的JSON，已忽略")
+
+
+def estimate_cost(model, input_tokens=0, output_tokens=0):
+    """估算一次调用的费用，价格未知时返回None"""
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return None
+    if isinstance(price, (int, float)):
+        return float(price)
+    return (input_tokens or 0) / 1000 * price[0] + (output_tokens or 0) / 1000 * price[1]
+
+
+class CallTrace:
+    """一次生成过程中的所有调用记录（线程安全）"""
+
+    def __init__(self, name=''):
+        self.name = name
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage, kind='llm', provider=None, model=None, **fields):
+        """记录一次调用；调用方可在with块中往返回的dict里补充 input_tokens/output_tokens/cached/retries 等字段"""
+        record = {
+            'stage': stage,
+            'kind': kind,
+            'provider': provider,
+            'model': model,
+            'start': round(time.time() - self.started_at, 3),
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cached': False,
+            'retries': 0,
+            'status': 'ok',
+        }
+        record.update(fields)
+        started = time.time()
+        try:
+            yield record
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)[:200]
+            raise
+        except BaseException:
+            record['status'] = 'cancelled'
+            raise
+        finally:
+            record['duration'] = round(time.time() - started, 3)
+            if record.get('cost') is None:
+                record['cost'] = estimate_cost(record['model'], record['input_tokens'], record['output_tokens'])
+            with self._lock:
+                self.spans.append(record)
+            emit('span', span=dict(record))
+
+    def record_usage(self, record, response):
+        """从Anthropic兼容响应中读取token用量和缓存标记（缓存命中时token为原调用的用量，费用记0）"""
+        usage = getattr(response, 'usage', None)
+        record['input_tokens'] = getattr(usage, 'input_tokens', 0) or 0
+        record['output_tokens'] = getattr(usage, 'output_tokens', 0) or 0
+        record['cached'] = bool(getattr(response, 'cached', False))
+        if record['cached']:
+            record['cost'] = 0.0
+
+    def snapshot(self):
+        """按开始时间排序的span列表"""
+        with self._lock:
+            return sorted((dict(span) for span in self.spans), key=lambda span: span['start'])
+
+    def summary(self):
+        """按阶段汇总: [{stage, calls, duration, input_tokens, output_tokens, retries, errors, cached, cost}]"""
+        rows = {}
+        for span in self.snapshot():
+            row = rows.setdefault(span['stage'], {
+                'stage': span['stage'], 'calls': 0, 'duration': 0.0, 'input_tokens': 0, 'output_tokens': 0,
+                'retries': 0, 'errors': 0, 'cached': 0, 'cost': None,
+            })
+            row['calls'] += 1
+            row['duration'] = round(row['duration'] + span['duration'], 3)
+            row['input_tokens'] += span['input_tokens']
+            row['output_tokens'] += span['output_tokens']
+            row['retries'] += span['retries']
+            row['errors'] += span['status'] != 'ok'
+            row['cached'] += bool(span['cached'])
+            if span.get('cost') is not None:
+                row['cost'] = (row['cost'] or 0.0) + span['cost']
+        return sorted(rows.values(), key=lambda row: -row['duration'])
+
+    def format_summary(self):
+        """汇总表格文本（按阶段耗时从高到低）"""
+        wall = time.time() - self.started_at
+        rows = self.summary()
+        lines = [
+            f"{'stage':<18}{'calls':>6}{'time(s)':>9}{'share':>7}{'in_tok':>9}{'out_tok':>9}{'retry':>6}{'fail':>5}{'cache':>6}{'cost':>9}",
+        ]
+        for row in rows:
+            cost = f"{row['cost']:.4f}" if row['cost'] is not None else '-'
+            share = f"{row['duration'] / wall:.0%}" if wall > 0 else '-'
+            lines.append(
+                f"{row['stage']:<18}{row['calls']:>6}{row['duration']:>9.1f}{share:>7}{row['input_tokens']:>9}"
+                f"{row['output_tokens']:>9}{row['retries']:>6}{row['errors']:>5}{row['cached']:>6}{cost:>9}"
+            )
+        lines.append(f"总耗时 {wall:.1f}s（并行执行的调用耗时会重叠，各阶段之和可能大于总耗时）")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'wall_time': round(time.time() - self.started_at, 3),
+            'spans': self.snapshot(),
+            'summary': self.summary(),
+        }
+
+    def write_jsonl(self, path=None):
+        """保存逐条记录（每行一个span），返回文件路径"""
+        if path is None:
+            trace_dir = Path(os.environ.get('ARTICLE_TRACE_DIR') or DEFAULT_TRACE_DIR)
+            trace_dir.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started_at))
+            safe_name = "".join(c for c in self.name if c.isalnum() or c in ('_', '-'))[:30]
+            path = trace_dir / f"trace_{stamp}_{safe_name or 'run'}.jsonl"
+        path = Path(path)
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in self.snapshot():
+                f.write(json.dumps(dict(span, trace=self.name), ensure_ascii=False) + '\n')
+        return path
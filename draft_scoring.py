@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+初稿本地评分
+多篇候选初稿并行生成后，不再调用模型，按以下指标本地打分选出最好的一篇:
+
+  - 篇幅: 字数与目标字数的接近程度
+  - 素材覆盖: 搜索素材中的关键词(书名、人名、高频词)在正文中出现的比例
+  - 重复度: 重复或几乎相同的句子所占比例(越低越好)
+
+没有素材时素材覆盖不参与计算，其余两项按比例放大
+"""
+
+import difflib
+import re
+from collections import Counter
+
+WEIGHTS = {'length': 0.5, 'coverage': 0.3, 'duplicates': 0.2}
+MAX_KEYWORDS = 20
+
+_CJK = re.compile(r'[\u4e00-\u9fff]+')
+_SENTENCE_SPLIT = re.compile(r'[。！？!?；;\n]+')
+_PUNCTUATION = re.compile(r'[\s，,、：:“”"‘’\'（）()《》【】—…·]+')
+# 素材格式中的固定字样，不作为关键词
+_MATERIAL_WORDS = {'来源', '素材', '相关', '主题', '故事', '典故'}
+
+
+def length_score(text, target_length):
+    """字数越接近目标越高(0-1)，偏差达到目标字数时为0"""
+    if not target_length:
+        return 1.0
+    return max(0.0, 1.0 - abs(len(text) - target_length) / target_length)
+
+
+def material_keywords(materials, limit=MAX_KEYWORDS):
+    """从搜索素材中提取关键词：《》中的作品名、英文词、出现两次以上的中文双字词"""
+    if not materials:
+        return []
+    materials = re.sub(r'https?://\S+', '', materials)
+    keywords = []
+    for title in re.findall(r'《([^》]{1,20})》', materials):
+        if title not in keywords:
+            keywords.append(title)
+
+    bigrams = Counter()
+    for run in _CJK.findall(materials):
+        bigrams.update(run[i:i + 2] for i in range(len(run) - 1))
+    for word, count in bigrams.most_common():
+        if len(keywords) >= limit or count < 2:
+            break
+        if word not in _MATERIAL_WORDS and not any(word in keyword for keyword in keywords):
+            keywords.append(word)
+    return keywords[:limit]
+
+
+def keyword_coverage(text, keywords):
+    """正文中出现的关键词比例，没有关键词时返回None"""
+    if not keywords:
+        return None
+    return sum(1 for keyword in keywords if keyword in text) / len(keywords)
+
+
+def duplicate_ratio(text, threshold=0.9):
+    """重复句比例：与前文某句相同或相似度超过threshold的句子占比"""
+    sentences = [_PUNCTUATION.sub('', s) for s in _SENTENCE_SPLIT.split(text or '')]
+    sentences = [s for s in sentences if len(s) >= 6]
+    if not sentences:
+        return 0.0
+    duplicates = 0
+    seen = []
+    for sentence in sentences:
+        if any(sentence == prev or difflib.SequenceMatcher(a=sentence, b=prev).ratio() >= threshold
+               for prev in seen):
+            duplicates += 1
+        else:
+            seen.append(sentence)
+    return duplicates / len(sentences)
+
+
+def score_draft(text, target_length, keywords=None):
+    """给一篇初稿打分，返回各项指标和总分(0-1)"""
+    metrics = {
+        'length': round(length_score(text, target_length), 3),
+        'coverage': keyword_coverage(text, keywords),
+        'duplicates': round(duplicate_ratio(text), 3),
+    }
+    parts = {'length': metrics['length'], 'duplicates': 1.0 - metrics['duplicates']}
+    if metrics['coverage'] is not None:
+        metrics['coverage'] = round(metrics['coverage'], 3)
+        parts['coverage'] = metrics['coverage']
+    total_weight = sum(WEIGHTS[name] for name in parts)
+    metrics['score'] = round(sum(WEIGHTS[name] * value for name, value in parts.items()) / total_weight, 3)
+    return metrics
+
+
+def pick_best(drafts, target_length, materials=''):
+    """从候选初稿([{'title', 'content', ...}])中选出得分最高的一篇
+
+    Returns:
+        (最佳初稿, 各候选的评分列表)；得分相同时取靠前的一篇
+    """
+    keywords = material_keywords(materials)
+    scores = [score_draft(draft['content'], target_length, keywords) for draft in drafts]
+    best = max(range(len(drafts)), key=lambda i: (scores[i]['score'], -i))
+    return drafts[best], scores
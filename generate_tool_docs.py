@@ -3,153 +3,311 @@
 """
 工具文档生成器
 分析post目录下的所有Python工具，生成详细的功能文档
+
+分析方式:
+  - 用ast解析源码(语法错误的文件退回正则分析)，命令行运行时变化的文件较多则在进程池中并行分析
+  - 分析结果按 路径/mtime/内容哈希 缓存在磁盘上，只重新分析发生变化的文件
+  - 工具管理器在进程内使用 ToolDocIndex(max_workers=0，不启动进程池)，文档常驻内存
 """
 
+import ast
+import hashlib
 import os
 import re
 import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
-def analyze_python_file(file_path):
-    """分析Python文件，提取功能信息"""
+DOC_CATEGORIES = ['bird', 'picture', 'article', 'hotspot', 'test']
+DOC_OUTPUT_FILE = 'tool_documentation.json'
+DOC_CACHE_FILE = '.tool_docs_cache.json'
+PARALLEL_THRESHOLD = 8  # 需要分析的文件数超过该值时才启用进程池
+
+# 提取使用的模型/API
+API_KEYWORDS = [
+    'get_antigravity_client', 'get_volcano_client',
+    'gemini', 'dall-e', 'flux', 'pollinations',
+    'seedream', 'openai', 'anthropic'
+]
+
+# 提取配置参数
+CONFIG_PATTERNS = [
+    r'API_KEY',
+    r'MODEL\s*=',
+    r'SIZE\s*=',
+    r'temperature\s*='
+]
 
-    content = file_path.read_text(encoding='utf-8', errors='ignore')
 
+def _find_models_and_params(content):
+    """关键词/配置参数检测（与源码结构无关，直接匹配文本）"""
+    lowered = content.lower()
+    models_apis = [keyword for keyword in API_KEYWORDS if keyword.lower() in lowered]
+
+    params = []
+    for pattern in CONFIG_PATTERNS:
+        matches = re.findall(pattern, content, re.IGNORECASE)
+        params.extend(matches[:3])  # 限制数量
+    return models_apis, params
+
+
+def _analyze_with_regex(content):
+    """正则分析（用于ast无法解析的文件）"""
     # 提取文档字符串
     docstring_match = re.search(r'"""(.*?)"""', content, re.DOTALL)
     docstring = docstring_match.group(1).strip() if docstring_match else ""
 
     # 提取导入的模块
     imports = []
-    import_patterns = [
-        r'from\s+(\S+)\s+import',
-        r'import\s+(\S+)'
-    ]
-    for pattern in import_patterns:
-        matches = re.findall(pattern, content)
-        imports.extend(matches)
-
-    # 提取使用的模型/API
-    models_apis = []
-    api_keywords = [
-        'get_antigravity_client', 'get_volcano_client',
-        'gemini', 'dall-e', 'flux', 'pollinations',
-        'seedream', 'openai', 'anthropic'
-    ]
-    for keyword in api_keywords:
-        if keyword.lower() in content.lower():
-            models_apis.append(keyword)
-
-    # 提取主要功能
-    functions = []
-    function_pattern = r'def\s+(\w+)\s*\('
-    matches = re.findall(function_pattern, content)
-    functions = [m for m in matches if not m.startswith('_')]
-
-    # 提取类
-    classes = []
-    class_pattern = r'class\s+(\w+)'
-    matches = re.findall(class_pattern, content)
-    classes = matches
+    for pattern in [r'from\s+(\S+)\s+import', r'import\s+(\S+)']:
+        imports.extend(re.findall(pattern, content))
 
-    # 提取配置参数
-    params = []
-    config_patterns = [
-        r'API_KEY',
-        r'MODEL\s*=',
-        r'SIZE\s*=',
-        r'temperature\s*='
-    ]
-    for pattern in config_patterns:
-        matches = re.findall(pattern, content, re.IGNORECASE)
-        params.extend(matches[:3])  # 限制数量
+    # 提取主要功能和类
+    functions = [m for m in re.findall(r'def\s+(\w+)\s*\(', content) if not m.startswith('_')]
+    classes = re.findall(r'class\s+(\w+)', content)
 
+    models_apis, params = _find_models_and_params(content)
     return {
         'docstring': docstring,
-        'imports': list(set(imports)),
-        'models_apis': list(set(models_apis)),
+        'imports': sorted(set(imports)),
+        'models_apis': models_apis,
         'functions': functions[:10],  # 限制显示数量
         'classes': classes,
         'params': params[:5]
     }
 
-def generate_tool_documentation():
-    """生成所有工具的文档"""
 
-    BASE_DIR = Path(__file__).parent
-    categories = ['bird', 'picture', 'article', 'hotspot', 'test']
+def analyze_source(content):
+    """分析Python源码，提取功能信息"""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return _analyze_with_regex(content)
 
-    documentation = {}
+    imports = set()
+    functions = []
+    classes = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module:
+                imports.add(node.module)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if not node.name.startswith('_'):
+                functions.append((node.lineno, node.name))
+        elif isinstance(node, ast.ClassDef):
+            classes.append((node.lineno, node.name))
 
-    print("=" * 80)
-    print("开始分析工具...")
-    print("=" * 80)
+    models_apis, params = _find_models_and_params(content)
+    return {
+        'docstring': (ast.get_docstring(tree) or '').strip(),
+        'imports': sorted(imports),
+        'models_apis': models_apis,
+        'functions': [name for _, name in sorted(functions)][:10],  # 限制显示数量
+        'classes': [name for _, name in sorted(classes)],
+        'params': params[:5]
+    }
 
-    for category in categories:
-        cat_path = BASE_DIR / category
-        if not cat_path.exists():
-            continue
 
-        print(f"\n分析分类: {category}/")
+def analyze_python_file(file_path):
+    """分析Python文件，提取功能信息"""
+    content = Path(file_path).read_text(encoding='utf-8', errors='ignore')
+    return analyze_source(content)
 
-        category_docs = {}
-
-        for py_file in sorted(cat_path.glob("*.py")):
-            print(f"  - {py_file.name}")
-
-            # 分析文件
-            info = analyze_python_file(py_file)
-
-            # 生成详细描述
-            detailed_info = {
-                'file': py_file.name,
-                'relative_path': str(py_file.relative_to(BASE_DIR)),
-                'docstring': info['docstring'],
-                'description': '',
-                'features': [],
-                'models_used': info['models_apis'],
-                'main_functions': info['functions'],
-                'classes': info['classes'],
-                'imports': info['imports']
-            }
 
-            # 从docstring生成描述
-            if info['docstring']:
-                lines = info['docstring'].split('\n')
-                if lines:
-                    detailed_info['description'] = lines[0]
-                    detailed_info['features'] = lines[1:] if len(lines) > 1 else []
+def _analyze_job(file_path):
+    """进程池任务：读取文件、计算哈希并分析"""
+    data = Path(file_path).read_bytes()
+    info = analyze_source(data.decode('utf-8', errors='ignore'))
+    return hashlib.sha1(data).hexdigest(), info
 
-            # 生成功能说明
-            if not detailed_info['description']:
-                detailed_info['description'] = f"{category} 工具 - {py_file.stem}"
 
-            # 添加模型使用说明
-            if info['models_apis']:
-                model_desc = "使用的模型/API: " + ", ".join(info['models_apis'])
-                detailed_info['features'].append(model_desc)
+def build_tool_doc(py_file, base_dir, category, info):
+    """根据分析结果生成单个工具的文档条目"""
+    detailed_info = {
+        'file': py_file.name,
+        'relative_path': str(py_file.relative_to(base_dir)),
+        'docstring': info['docstring'],
+        'description': '',
+        'features': [],
+        'models_used': info['models_apis'],
+        'main_functions': info['functions'],
+        'classes': info['classes'],
+        'imports': info['imports']
+    }
 
-            # 添加主要函数说明
-            if info['functions']:
-                func_desc = "主要函数: " + ", ".join(info['functions'][:5])
-                detailed_info['features'].append(func_desc)
+    # 从docstring生成描述
+    if info['docstring']:
+        lines = info['docstring'].split('\n')
+        if lines:
+            detailed_info['description'] = lines[0]
+            detailed_info['features'] = lines[1:] if len(lines) > 1 else []
 
-            category_docs[py_file.name] = detailed_info
+    # 生成功能说明
+    if not detailed_info['description']:
+        detailed_info['description'] = f"{category} 工具 - {py_file.stem}"
 
-        if category_docs:
-            documentation[category] = category_docs
+    # 添加模型使用说明
+    if info['models_apis']:
+        model_desc = "使用的模型/API: " + ", ".join(info['models_apis'])
+        detailed_info['features'].append(model_desc)
 
-    # 保存为JSON文件
-    output_file = BASE_DIR / 'tool_documentation.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(documentation, f, ensure_ascii=False, indent=2)
+    # 添加主要函数说明
+    if info['functions']:
+        func_desc = "主要函数: " + ", ".join(info['functions'][:5])
+        detailed_info['features'].append(func_desc)
 
-    print(f"\n[OK] 文档已生成: {output_file}")
-    print(f"[OK] 共分析 {len(documentation)} 个分类")
+    return detailed_info
+
+
+class ToolDocIndex:
+    """增量的工具文档索引（结果常驻内存）"""
+
+    def __init__(self, base_dir, categories=None, cache_file=DOC_CACHE_FILE,
+                 output_file=DOC_OUTPUT_FILE, max_workers=None):
+        """
+        Args:
+            base_dir: 项目根目录
+            categories: 要分析的分类目录
+            cache_file: 分析结果缓存文件(相对base_dir)
+            output_file: 文档输出文件(相对base_dir)
+            max_workers: 进程池大小，默认为CPU数；0表示始终在当前进程中分析
+                (Windows下进程池会在每个子进程里重新导入主模块，在服务进程中使用时应传0)
+        """
+        self.base_dir = Path(base_dir)
+        self.categories = categories or DOC_CATEGORIES
+        self.cache_path = self.base_dir / cache_file
+        self.output_path = self.base_dir / output_file
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()  # 相对路径 -> {mtime_ns, size, sha1, info}
+        self._documentation = None
+        self._etag = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        tmp_path = self.cache_path.with_name(self.cache_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def documentation(self):
+        """返回 (文档, ETag)；尚未构建时优先读取已生成的文档文件"""
+        with self._lock:
+            if self._documentation is None:
+                try:
+                    with open(self.output_path, 'r', encoding='utf-8') as f:
+                        self._set_documentation(json.load(f))
+                except (OSError, ValueError):
+                    pass
+        if self._documentation is None:
+            self.refresh()
+        return self._documentation, self._etag
+
+    def _set_documentation(self, documentation):
+        payload = json.dumps(documentation, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        self._documentation = documentation
+        self._etag = hashlib.sha1(payload).hexdigest()
+
+    def refresh(self):
+        """重新扫描分类目录，只分析变化的文件，并写出文档文件
+
+        Returns:
+            dict: {'tools': 工具总数, 'analyzed': 重新分析数, 'cached': 使用缓存数}
+        """
+        with self._lock:
+            files = []
+            for category in self.categories:
+                cat_path = self.base_dir / category
+                if cat_path.exists():
+                    files.extend((category, py_file) for py_file in sorted(cat_path.glob("*.py")))
+
+            # 先用mtime/大小判断，变化的文件再比较内容哈希
+            pending = []
+            seen = set()
+            for category, py_file in files:
+                rel_path = py_file.relative_to(self.base_dir).as_posix()
+                seen.add(rel_path)
+                stat = py_file.stat()
+                entry = self._cache.get(rel_path)
+                if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    continue
+                if entry:
+                    sha1 = hashlib.sha1(py_file.read_bytes()).hexdigest()
+                    if sha1 == entry['sha1']:
+                        entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                        continue
+                pending.append((rel_path, py_file, stat))
+
+            for rel_path in set(self._cache) - seen:
+                del self._cache[rel_path]
+
+            if pending:
+                paths = [str(py_file) for _, py_file, _ in pending]
+                if self.max_workers != 0 and len(pending) > PARALLEL_THRESHOLD:
+                    with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                        results = list(executor.map(_analyze_job, paths, chunksize=4))
+                else:
+                    results = [_analyze_job(path) for path in paths]
+                for (rel_path, _, stat), (sha1, info) in zip(pending, results):
+                    self._cache[rel_path] = {
+                        'mtime_ns': stat.st_mtime_ns,
+                        'size': stat.st_size,
+                        'sha1': sha1,
+                        'info': info,
+                    }
+
+            documentation = {}
+            for category, py_file in files:
+                info = self._cache[py_file.relative_to(self.base_dir).as_posix()]['info']
+                documentation.setdefault(category, {})[py_file.name] = build_tool_doc(
+                    py_file, self.base_dir, category, info
+                )
+
+            self._save_cache()
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                json.dump(documentation, f, ensure_ascii=False, indent=2)
+            self._set_documentation(documentation)
 
-    total_tools = sum(len(cat) for cat in documentation.values())
-    print(f"[OK] 共分析 {total_tools} 个工具")
+            return {
+                'tools': len(files),
+                'analyzed': len(pending),
+                'cached': len(files) - len(pending),
+            }
+
+
+def generate_tool_documentation():
+    """生成所有工具的文档"""
+
+    BASE_DIR = Path(__file__).parent
+
+    print("=" * 80)
+    print("开始分析工具...")
+    print("=" * 80)
+
+    index = ToolDocIndex(BASE_DIR)
+    stats = index.refresh()
+    documentation, _ = index.documentation()
+
+    for category, category_docs in documentation.items():
+        print(f"\n分析分类: {category}/")
+        for filename in category_docs:
+            print(f"  - {filename}")
+
+    print(f"\n[OK] 文档已生成: {index.output_path}")
+    print(f"[OK] 共分析 {len(documentation)} 个分类")
+    print(f"[OK] 共分析 {stats['tools']} 个工具 (重新分析 {stats['analyzed']} 个, 使用缓存 {stats['cached']} 个)")
+    print(f"[OK] 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     return documentation
 
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+对冲(race)调用
+按降级顺序启动候选提供方：当前候选在 hedge_delay 秒内没有结果(或已失败)就并行启动下一个，
+取第一个有效结果，其余仍在进行的调用结果被丢弃(HTTP请求无法中断，只能等其自行结束)
+
+每个提供方的启动次数受 ProviderBudget 限制，避免对冲带来的额外调用失控
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+
+
+class ProviderBudget:
+    """各提供方允许的调用次数；window不为None时为滑动时间窗口内的次数"""
+
+    def __init__(self, limits, window=None):
+        self.limits = dict(limits)
+        self.window = window
+        self._lock = threading.Lock()
+        self._spent = {}  # provider -> deque[时间戳]
+
+    def try_spend(self, provider):
+        """占用一次调用额度，额度用尽时返回False（未配置的提供方不限制）"""
+        limit = self.limits.get(provider)
+        if limit is None:
+            return True
+        with self._lock:
+            spent = self._spent.setdefault(provider, deque())
+            if self.window is not None:
+                cutoff = time.time() - self.window
+                while spent and spent[0] < cutoff:
+                    spent.popleft()
+            if len(spent) >= limit:
+                return False
+            spent.append(time.time())
+            return True
+
+    def remaining(self):
+        """各提供方剩余额度"""
+        with self._lock:
+            return {provider: limit - len(self._spent.get(provider, ()))
+                    for provider, limit in self.limits.items()}
+
+
+def race(candidates, hedge_delay, budget=None, cancelled=None, on_discard=None, log=print):
+    """对冲执行候选调用
+
+    Args:
+        candidates: [(提供方, 名称, 调用函数)]，调用函数返回结果，失败时返回None或抛出异常
+        hedge_delay: 启动下一个候选前等待的秒数
+        budget: ProviderBudget，额度用尽的候选被跳过
+        cancelled: threading.Event，设置后立即放弃(返回None)
+        on_discard: 落选调用完成后以 (名称, 结果) 调用，用于清理临时文件等
+        log: 日志函数
+
+    Returns:
+        (名称, 结果)，全部失败时返回 (None, None)
+    """
+    results = queue.Queue()
+    state = {'winner': None}
+    lock = threading.Lock()
+    remaining = list(candidates)
+    pending = 0
+
+    def run(name, call):
+        try:
+            result, error = call(), None
+        except Exception as e:
+            result, error = None, e
+        with lock:
+            lost = state['winner'] is not None
+            if not lost:
+                results.put((name, result, error))
+        if lost and result is not None and on_discard:
+            on_discard(name, result)
+
+    def launch_next():
+        while remaining:
+            provider, name, call = remaining.pop(0)
+            if budget is not None and not budget.try_spend(provider):
+                log(f"[RACE] {name}: budget exhausted, skipped")
+                continue
+            # 在调用方的上下文中执行（保留contextvar，如进度事件接收方）
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(run, name, call), daemon=True, name=f'race-{name}').start()
+            return True
+        return False
+
+    last_launch = time.time()
+    if launch_next():
+        pending += 1
+
+    while pending:
+        if cancelled is not None and cancelled.is_set():
+            break
+        # 还有候选时最多等到hedge_delay到期，否则一直等到进行中的调用结束
+        timeout = max(0, last_launch + hedge_delay - time.time()) if remaining else None
+        if cancelled is not None:
+            timeout = 0.5 if timeout is None else min(timeout, 0.5)
+        try:
+            name, result, error = results.get(timeout=timeout)
+        except queue.Empty:
+            if remaining and time.time() >= last_launch + hedge_delay:
+                last_launch = time.time()
+                if launch_next():
+                    pending += 1
+                    log(f"[RACE] no result after {hedge_delay}s, hedging with next provider")
+            continue
+
+        pending -= 1
+        if result is not None:
+            with lock:
+                state['winner'] = name
+                queued = []
+                while not results.empty():
+                    queued.append(results.get_nowait())
+            # 已完成但排在队列中的落选结果也交给清理回调
+            for loser, loser_result, _ in queued:
+                if loser_result is not None and on_discard:
+                    on_discard(loser, loser_result)
+            return name, result
+        if error is not None:
+            log(f"[RACE] {name} failed: {str(error)[:60]}")
+        # 失败后立即启动下一个候选
+        last_launch = time.time()
+        if launch_next():
+            pending += 1
+
+    with lock:
+        state['winner'] = ''  # 放弃：之后完成的调用都按落选处理
+        queued = []
+        while not results.empty():
+            queued.append(results.get_nowait())
+    for loser, loser_result, _ in queued:
+        if loser_result is not None and on_discard:
+            on_discard(loser, loser_result)
+    return None, None
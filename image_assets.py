@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+文章配图资源
+把生成的原图缩放为几种宽度的WebP(不支持时为JPEG)，以内容哈希命名保存在HTML旁边的 assets/ 目录，
+HTML中用 srcset + loading="lazy" 引用，不再把数MB的原图base64内嵌进HTML
+
+  - 文件名由原图内容哈希和宽度组成，同一张图重复导出时直接复用已有文件
+  - 所有尺寸只解码原图一次，从大到小依次缩放；配图入库时已生成的(见 image_ingest)不再解码
+  - 需要单个HTML文件分发时使用内嵌模式(image_mode='inline' 或环境变量 ARTICLE_IMAGE_MODE=inline)
+"""
+
+import base64
+import os
+from pathlib import Path
+
+from PIL import Image, features
+
+from image_ingest import file_digest
+
+ASSET_DIR_NAME = 'assets'
+RENDITION_WIDTHS = (480, 960, 1440)
+RENDITION_QUALITY = 80
+# 文章容器宽800px、左右内边距各40px
+IMAGE_SIZES = '(max-width: 800px) 100vw, 720px'
+
+
+def default_image_mode():
+    """默认配图模式: 'assets'(外部文件) 或 'inline'(单文件导出)"""
+    mode = os.environ.get('ARTICLE_IMAGE_MODE', 'assets').strip().lower()
+    return 'inline' if mode == 'inline' else 'assets'
+
+
+def rendition_format():
+    """Pillow支持WebP时使用WebP，否则使用JPEG，返回 (格式, 扩展名)"""
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def _target_sizes(width, height, widths):
+    """各目标尺寸(不放大原图)，从大到小"""
+    targets = sorted({min(w, width) for w in widths}, reverse=True)
+    return [(w, max(1, round(height * w / width))) for w in targets]
+
+
+def _rendition_paths(src_path, width, height, asset_dir, widths, digest=None):
+    _, ext = rendition_format()
+    digest = (digest or file_digest(src_path))[:16]
+    return [(Path(asset_dir) / f"{digest}-{w}.{ext}", w, h) for w, h in _target_sizes(width, height, widths)]
+
+
+def write_renditions(img, src_path, asset_dir, widths=RENDITION_WIDTHS, quality=RENDITION_QUALITY):
+    """用已解码的RGB图像生成各尺寸版本（已存在的跳过），返回 [(文件路径, 宽, 高)]，从大到小"""
+    fmt, _ = rendition_format()
+    outputs = _rendition_paths(src_path, img.width, img.height, asset_dir, widths)
+    if all(path.exists() for path, _, _ in outputs):
+        return outputs
+
+    Path(asset_dir).mkdir(parents=True, exist_ok=True)
+    current = img
+    for path, w, h in outputs:
+        if current.size != (w, h):
+            current = current.resize((w, h), Image.LANCZOS)
+        if not path.exists():
+            tmp_path = path.with_name(path.name + '.tmp')
+            current.save(tmp_path, fmt, quality=quality)
+            os.replace(tmp_path, path)
+    return outputs
+
+
+def build_renditions(src_path, asset_dir, widths=RENDITION_WIDTHS, quality=RENDITION_QUALITY):
+    """生成原图的多尺寸版本，返回 [(文件路径, 宽, 高)]，从大到小"""
+    with Image.open(src_path) as img:
+        # 只读了文件头，尺寸可用；全部文件已存在(如入库时已生成)时不需要解码
+        outputs = _rendition_paths(src_path, img.width, img.height, asset_dir, widths)
+        if all(path.exists() for path, _, _ in outputs):
+            return outputs
+        decoded = img.convert('RGB')
+    return write_renditions(decoded, src_path, asset_dir, widths, quality)
+
+
+def image_tag_attrs(src_path, html_dir, widths=RENDITION_WIDTHS):
+    """为HTML中的一张配图生成资源文件，返回img标签属性dict（路径相对于HTML所在目录）"""
+    html_dir = Path(html_dir)
+    outputs = build_renditions(src_path, html_dir / ASSET_DIR_NAME, widths)
+    largest, width, height = outputs[0]
+    srcset = ', '.join(f"{ASSET_DIR_NAME}/{path.name} {w}w" for path, w, _ in reversed(outputs))
+    return {
+        # src 取中间尺寸，兼容不支持srcset的环境
+        'src': f"{ASSET_DIR_NAME}/{outputs[len(outputs) // 2][0].name}",
+        'srcset': srcset,
+        'sizes': IMAGE_SIZES,
+        'width': width,
+        'height': height,
+        'loading': 'lazy',
+        'decoding': 'async',
+    }
+
+
+def inline_data_url(src_path):
+    """单文件导出：原图base64内嵌"""
+    with open(src_path, 'rb') as f:
+        data = base64.b64encode(f.read()).decode('utf-8')
+    ext = Path(src_path).suffix.lower().lstrip('.')
+    mime = {'png': 'image/png', 'webp': 'image/webp', 'gif': 'image/gif'}.get(ext, 'image/jpeg')
+    return f"data:{mime};base64,{data}"
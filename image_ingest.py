@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+配图入库
+提供方返回的图片字节边下载边写入磁盘、同时计算sha256，不在内存中保留整张图，也不解码重新编码
+
+  - 格式由文件头识别(JPEG/PNG/WebP/GIF)，原样保存；无法识别时才解码转为JPEG
+  - URL下载得到的内容无法识别时按失败处理(多为返回200的错误页)，调用方可以换下一个提供方
+  - 只有要求限制宽度时才重新编码；需要缩略图时与之共用同一次解码(见 finalize_image)
+  - 入库得到的是临时文件，对冲调用中落选的结果用 discard() 删除
+
+Pillow只在需要解码时才导入，仅下载保存的调用方(如 picture 工具)不依赖Pillow
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+
+IngestedImage = namedtuple('IngestedImage', ['path', 'digest', 'ext', 'size'])
+
+_digest_lock = threading.Lock()
+_known_digests = {}  # (路径, 大小, 修改时间) -> sha256
+
+
+def sniff_extension(head):
+    """根据文件头判断图片格式，返回扩展名，无法识别时返回None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    return None
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return str(Path(path).absolute()), stat.st_size, stat.st_mtime_ns
+
+
+def remember_digest(path, digest):
+    """记录已知文件的哈希，之后 file_digest 不再重新读取文件"""
+    with _digest_lock:
+        _known_digests[_stat_key(path)] = digest
+
+
+def file_digest(path):
+    """文件内容的sha256（入库时已计算过的直接返回）"""
+    key = _stat_key(path)
+    with _digest_lock:
+        digest = _known_digests.get(key)
+    if digest is not None:
+        return digest
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE * 16), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _digest_lock:
+        _known_digests[key] = digest
+    return digest
+
+
+def ingest_stream(chunks, dest_dir):
+    """把字节块写入dest_dir下的临时文件，返回 IngestedImage"""
+    dest_dir = Path(dest_dir)
+    tmp_path = dest_dir / f".ingest-{uuid.uuid4().hex[:12]}.part"
+    sha = hashlib.sha256()
+    head = b''
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                sha.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if not size:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError("empty image response")
+    return IngestedImage(str(tmp_path), sha.hexdigest(), sniff_extension(head), size)
+
+
+def ingest_url(url, dest_dir, timeout=60):
+    """流式下载图片URL；状态码不是200或内容不是可识别的图片时抛出RuntimeError"""
+    import requests
+
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"download failed: HTTP {response.status_code}")
+        ingested = ingest_stream(response.iter_content(CHUNK_SIZE), dest_dir)
+    if ingested.ext is None:
+        discard(ingested)
+        raise RuntimeError(f"download failed: not an image ({response.headers.get('Content-Type', 'unknown type')})")
+    return ingested
+
+
+def ingest_bytes(data, dest_dir):
+    """已在内存中的图片字节(如base64响应解码结果)直接写入"""
+    return ingest_stream([data], dest_dir)
+
+
+def discard(ingested):
+    """删除未采用的入库结果"""
+    if ingested is not None:
+        Path(ingested.path).unlink(missing_ok=True)
+
+
+def finalize_image(ingested, final_stem, max_width=None, rendition_dir=None):
+    """把入库的临时文件移动到最终位置，返回最终路径
+
+    Args:
+        final_stem: 不含扩展名的最终路径，扩展名按实际格式补上
+        max_width: 宽度超过时缩小并重新编码为JPEG（None表示保持原图）
+        rendition_dir: 同时生成缩略图版本的目录（见 image_assets），与缩放共用一次解码
+    """
+    final_stem = Path(final_stem)
+    needs_reencode = ingested.ext is None
+    if not needs_reencode and not max_width and rendition_dir is None:
+        final_path = final_stem.with_name(f"{final_stem.name}.{ingested.ext}")
+        os.replace(ingested.path, final_path)
+        remember_digest(final_path, ingested.digest)
+        return str(final_path)
+
+    from PIL import Image
+
+    # 唯一的一次解码；关闭文件后再移动（Windows下打开中的文件不能替换）
+    with Image.open(ingested.path) as src:
+        img = src.convert('RGB')
+
+    if max_width and img.width > max_width:
+        img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+        needs_reencode = True
+    if needs_reencode:
+        final_path = final_stem.with_name(f"{final_stem.name}.jpg")
+        img.save(final_path, 'JPEG', quality=92)
+        Path(ingested.path).unlink(missing_ok=True)
+    else:
+        final_path = final_stem.with_name(f"{final_stem.name}.{ingested.ext}")
+        os.replace(ingested.path, final_path)
+        remember_digest(final_path, ingested.digest)
+
+    if rendition_dir is not None:
+        from image_assets import write_renditions
+        try:
+            write_renditions(img, final_path, rendition_dir)
+        except Exception as e:
+            print(f"[配图入库] 缩略图生成失败(导出HTML时会重试): {e}")
+    return str(final_path)
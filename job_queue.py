@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+持久化任务队列
+用WAL模式的SQLite保存提交的任务(参数、状态、结果)，服务重启后未完成的任务重新排队；
+相同参数的任务正在排队/运行，或刚完成不久(COMPLETED_DEDUPE_WINDOW内)时，重复提交返回已有任务
+
+任务状态: queued -> running -> completed / failed / cancelled
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+# 完成后多久内的相同提交仍返回该任务(秒)，超过后重新生成
+COMPLETED_DEDUPE_WINDOW = 300
+
+
+def params_hash(params):
+    """任务参数的内容哈希（用于识别重复提交）"""
+    payload = json.dumps(params, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class JobQueue:
+    """SQLite任务队列"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    params_hash TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs(params_hash)')
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def submit(self, params, force=False):
+        """提交任务
+
+        相同参数的任务正在排队/运行，或在COMPLETED_DEDUPE_WINDOW内完成时直接返回该任务（force=True时总是新建）
+
+        Returns:
+            (job, created): created为False表示返回的是已有任务
+        """
+        digest = params_hash(params)
+        with self._lock, self._conn:
+            if not force:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE params_hash = ? AND (status IN ('queued', 'running') "
+                    "OR (status = 'completed' AND finished_at >= ?)) ORDER BY created_at DESC LIMIT 1",
+                    (digest, time.time() - COMPLETED_DEDUPE_WINDOW)
+                ).fetchone()
+                if row is not None:
+                    return self._to_dict(row), False
+            job_id = uuid.uuid4().hex[:12]
+            self._conn.execute(
+                "INSERT INTO jobs (id, params_hash, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, digest, json.dumps(params, ensure_ascii=False), time.time())
+            )
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row), True
+
+    def claim(self):
+        """取出最早排队的任务并标记为运行中，没有任务时返回None"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row['id'])
+            ).rowcount
+            if not updated:
+                return None  # 被其他进程抢先取走
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+        return self._to_dict(row)
+
+    def finish(self, job_id, status, result=None, error=None):
+        """记录任务结束"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?',
+                (status, time.time(), json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, job_id)
+            )
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接标记为已取消
+
+        Returns:
+            str: 取消前的状态，任务不存在时返回None
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row['status'] == 'queued':
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id)
+                )
+            return row['status']
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, status=None, limit=50):
+        """最近的任务（不含结果内容）"""
+        query = 'SELECT id, params, status, created_at, started_at, finished_at, error FROM jobs'
+        args = []
+        if status:
+            query += ' WHERE status = ?'
+            args.append(status)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['params'] = json.loads(job['params'])
+            jobs.append(job)
+        return jobs
+
+    def queue_position(self, job_id):
+        """排队任务前面还有几个任务，不在排队时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row['created_at'],)
+            ).fetchone()[0]
+
+    def requeue_running(self):
+        """服务启动时调用：上次运行中断的任务重新排队，返回数量"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+
+
+class JobEventLog:
+    """单个任务的进度事件缓冲（内存中保留最近的max_events条），供多个客户端跟随"""
+
+    def __init__(self, max_events=5000):
+        self._events = deque(maxlen=max_events)
+        self._total = 0
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def append(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._total += 1
+            self._cond.notify_all()
+
+    def read(self, offset=0):
+        """读取offset之后仍保留的事件，返回 (events, next_offset)"""
+        with self._cond:
+            first = self._total - len(self._events)
+            start = max(offset, first)
+            return list(self._events)[start - first:], self._total
+
+    def wait(self, offset, timeout=None):
+        """等待出现新事件或任务结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._total > offset or self.closed, timeout)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+工具启动调度器
+限制同时运行的工具数量，避免多个图像工具同时抢占同一个API配额
+
+限制维度:
+  - 全局并发数
+  - 按工具分类(picture/article/...)的并发数
+  - 按API提供方(volcano/antigravity/zhipu/...)的并发数
+排队顺序: 优先级高的先运行，同优先级按提交顺序(FIFO)；
+被限制挡住的任务不会阻塞后面使用其他提供方的任务
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+# 描述文字中的关键词 -> API提供方
+PROVIDER_KEYWORDS = {
+    'volcano': ['seedream', 'volcano', 'doubao', '即梦', '火山', 'seedance'],
+    'antigravity': ['antigravity', 'anti-gravity', 'gemini', 'dall-e', 'dalle', 'flux'],
+    'zhipu': ['zhipu', 'glm'],
+    'pollinations': ['pollinations'],
+}
+
+
+def infer_providers(*texts):
+    """根据工具描述/技术栈文字推断使用的API提供方"""
+    content = ' '.join(str(t) for t in texts if t).lower()
+    return sorted(provider for provider, keywords in PROVIDER_KEYWORDS.items()
+                  if any(keyword in content for keyword in keywords))
+
+
+class Job:
+    """一次工具启动请求"""
+
+    def __init__(self, job_id, spec, category, providers, priority, seq):
+        self.id = job_id
+        self.spec = spec
+        self.category = category
+        self.providers = list(providers)
+        self.priority = priority
+        self.seq = seq
+        self.state = 'queued'  # queued -> running -> finished / cancelled
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'category': self.category,
+            'providers': self.providers,
+            'priority': self.priority,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class JobScheduler:
+    """带并发限制的优先级队列调度器"""
+
+    def __init__(self, launcher, max_running=4, category_limits=None, provider_limits=None):
+        """
+        Args:
+            launcher: 启动任务的函数 launcher(job)，抛出异常表示启动失败
+            max_running: 全局最大并发数
+            category_limits: {分类: 最大并发数}
+            provider_limits: {提供方: 最大并发数}
+        """
+        self.launcher = launcher
+        self.max_running = max_running
+        self.category_limits = category_limits or {}
+        self.provider_limits = provider_limits or {}
+
+        self._lock = threading.RLock()
+        self._queue = []  # (-priority, seq, job_id)
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._running = set()
+
+    def submit(self, job_id, spec, category=None, providers=(), priority=0):
+        """提交任务，有空闲名额时立即启动
+
+        Returns:
+            Job
+        """
+        with self._lock:
+            job = Job(job_id, spec, category, providers, priority, next(self._seq))
+            self._jobs[job_id] = job
+            heapq.heappush(self._queue, (-priority, job.seq, job_id))
+            self._dispatch()
+            return job
+
+    def finish(self, job_id):
+        """任务结束时调用，释放名额并启动后续任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != 'running':
+                return
+            job.state = 'finished'
+            job.finished_at = time.time()
+            self._running.discard(job_id)
+            self._dispatch()
+
+    def cancel(self, job_id):
+        """取消排队中的任务，返回是否成功"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != 'queued':
+                return False
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            self._queue = [item for item in self._queue if item[2] != job_id]
+            heapq.heapify(self._queue)
+            return True
+
+    def forget(self, job_id):
+        """移除已结束任务的记录"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state in ('finished', 'cancelled'):
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job_id):
+        """任务在队列中的位置(从1开始)，不在队列中返回None"""
+        with self._lock:
+            for position, (_, _, queued_id) in enumerate(sorted(self._queue), 1):
+                if queued_id == job_id:
+                    return position
+            return None
+
+    def summary(self):
+        """当前调度状态"""
+        with self._lock:
+            running_jobs = [self._jobs[job_id] for job_id in self._running]
+            return {
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'max_running': self.max_running,
+                'by_category': self._count(running_jobs, lambda job: [job.category]),
+                'by_provider': self._count(running_jobs, lambda job: job.providers),
+            }
+
+    @staticmethod
+    def _count(jobs, keys_of):
+        counts = {}
+        for job in jobs:
+            for key in keys_of(job):
+                if key:
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _can_start(self, job, running_jobs):
+        if len(running_jobs) >= self.max_running:
+            return False
+        limit = self.category_limits.get(job.category)
+        if limit is not None and sum(1 for r in running_jobs if r.category == job.category) >= limit:
+            return False
+        for provider in job.providers:
+            limit = self.provider_limits.get(provider)
+            if limit is not None and sum(1 for r in running_jobs if provider in r.providers) >= limit:
+                return False
+        return True
+
+    def _dispatch(self):
+        """按优先级顺序启动所有当前允许启动的任务"""
+        waiting = []
+        while self._queue and len(self._running) < self.max_running:
+            item = heapq.heappop(self._queue)
+            job = self._jobs[item[2]]
+            running_jobs = [self._jobs[job_id] for job_id in self._running]
+            if not self._can_start(job, running_jobs):
+                waiting.append(item)
+                continue
+
+            job.state = 'running'
+            job.started_at = time.time()
+            self._running.add(job.id)
+            try:
+                self.launcher(job)
+            except Exception as e:
+                job.state = 'finished'
+                job.finished_at = time.time()
+                job.error = str(e)
+                self._running.discard(job.id)
+
+        for item in waiting:
+            heapq.heappush(self._queue, item)
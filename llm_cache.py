@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+LLM响应缓存
+按 (模型, system提示词, messages, temperature, max_tokens等请求参数) 的哈希缓存Anthropic兼容接口的响应，
+同一主题重复生成时不再重复付费调用
+
+  - 缓存保存在WAL模式的SQLite中(默认项目根目录 .llm_cache.db)，多个工具进程共享
+  - 超过TTL的条目失效；总大小超过上限时按最近访问时间淘汰
+  - 单次调用传 use_cache=False 跳过缓存；环境变量 LLM_CACHE=0 全局关闭
+  - stream=True 的调用不缓存；stream_message() 流式调用时同样读写缓存(命中时整段回调一次)
+
+环境变量:
+  LLM_CACHE_PATH    缓存数据库路径
+  LLM_CACHE_TTL     有效期(秒)，默认7天
+  LLM_CACHE_MAX_MB  总大小上限(MB)，默认200
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / '.llm_cache.db'
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# 不影响响应内容的请求参数，不参与缓存键
+_IGNORED_PARAMS = {'stream', 'timeout', 'extra_headers', 'metadata'}
+
+
+def cache_key(params):
+    """请求参数的内容哈希"""
+    relevant = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+    payload = json.dumps(relevant, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _serialize_response(response):
+    """Anthropic响应转为可存储的dict；包含非文本内容块时返回None(不缓存)"""
+    blocks = []
+    for block in getattr(response, 'content', None) or []:
+        if getattr(block, 'type', 'text') != 'text':
+            return None
+        blocks.append({'type': 'text', 'text': block.text})
+    if not blocks:
+        return None
+    usage = getattr(response, 'usage', None)
+    return {
+        'id': getattr(response, 'id', None),
+        'model': getattr(response, 'model', None),
+        'stop_reason': getattr(response, 'stop_reason', None),
+        'content': blocks,
+        'usage': {
+            'input_tokens': getattr(usage, 'input_tokens', 0),
+            'output_tokens': getattr(usage, 'output_tokens', 0),
+        },
+    }
+
+
+def _deserialize_response(data):
+    """还原为与Anthropic响应相同的属性访问方式(response.content[0].text)"""
+    return SimpleNamespace(
+        id=data.get('id'),
+        type='message',
+        role='assistant',
+        model=data.get('model'),
+        stop_reason=data.get('stop_reason'),
+        content=[SimpleNamespace(**block) for block in data['content']],
+        usage=SimpleNamespace(**data.get('usage', {})),
+        cached=True,
+    )
+
+
+class LLMResponseCache:
+    """磁盘上的LLM响应缓存"""
+
+    def __init__(self, db_path=None, ttl=None, max_bytes=None):
+        self.db_path = Path(db_path or os.environ.get('LLM_CACHE_PATH') or DEFAULT_CACHE_PATH)
+        self.ttl = ttl if ttl is not None else float(os.environ.get('LLM_CACHE_TTL', DEFAULT_TTL))
+        if max_bytes is None:
+            max_mb = os.environ.get('LLM_CACHE_MAX_MB')
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    response TEXT NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_responses_access ON llm_responses(last_access)')
+
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'bypassed': 0}
+
+    def get(self, key):
+        """返回缓存的响应dict，不存在或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT created_at, response FROM llm_responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[0] > self.ttl:
+                if row is not None:
+                    with self._conn:
+                        self._conn.execute('DELETE FROM llm_responses WHERE key = ?', (key,))
+                    self._counters['evictions'] += 1
+                self._counters['misses'] += 1
+                return None
+            with self._conn:
+                self._conn.execute('UPDATE llm_responses SET last_access = ? WHERE key = ?', (now, key))
+            self._counters['hits'] += 1
+        return json.loads(row[1])
+
+    def put(self, key, data, model=None):
+        """写入一条响应，之后按TTL和总大小淘汰"""
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO llm_responses (key, model, created_at, last_access, size, response) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, model, now, now, len(payload.encode('utf-8')), payload)
+                )
+            self._counters['writes'] += 1
+            self._evict(now)
+
+    def _evict(self, now):
+        with self._conn:
+            expired = self._conn.execute(
+                'DELETE FROM llm_responses WHERE created_at < ?', (now - self.ttl,)
+            ).rowcount
+            self._counters['evictions'] += expired
+
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_responses').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # 按最近访问时间从旧到新淘汰，直到低于上限
+            evict_keys = []
+            for key, size in self._conn.execute('SELECT key, size FROM llm_responses ORDER BY last_access'):
+                if total <= self.max_bytes:
+                    break
+                evict_keys.append((key,))
+                total -= size
+            self._conn.executemany('DELETE FROM llm_responses WHERE key = ?', evict_keys)
+            self._counters['evictions'] += len(evict_keys)
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters['bypassed'] += 1
+
+    def stats(self):
+        """本进程的命中/未命中计数 + 缓存条目数和总大小"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses'
+            ).fetchone()
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        counters.update(
+            entries=entries,
+            size_bytes=size,
+            hit_rate=round(counters['hits'] / lookups, 3) if lookups else 0.0,
+        )
+        return counters
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM llm_responses')
+
+
+class _CachedMessages:
+    """包装 client.messages，create() 先查缓存"""
+
+    def __init__(self, messages, cache):
+        self._messages = messages
+        self._cache = cache
+
+    def create(self, use_cache=True, **params):
+        if not use_cache or params.get('stream'):
+            self._cache.record_bypass()
+            return self._messages.create(**params)
+
+        key = cache_key(params)
+        data = self._cache.get(key)
+        if data is not None:
+            return _deserialize_response(data)
+
+        response = self._messages.create(**params)
+        data = _serialize_response(response)
+        if data is not None:
+            try:
+                self._cache.put(key, data, model=params.get('model'))
+            except sqlite3.Error as e:
+                print(f"[LLM缓存] 写入失败: {e}")
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class CachedTextClient:
+    """Anthropic兼容客户端的缓存包装，其余属性直接转发给原客户端"""
+
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.messages = _CachedMessages(client.messages, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class LLMCallCancelled(BaseException):
+    """流式调用被取消
+
+    继承BaseException而不是Exception：生成流程中各步骤用 except Exception 吞掉错误并继续，
+    取消需要穿过这些处理直接结束整个生成
+    """
+
+
+def stream_message(client, on_text, cancelled=None, use_cache=True, **params):
+    """流式调用 messages 接口，生成的文本片段逐段交给 on_text，返回完整响应(结构与messages.create相同)
+
+    Args:
+        client: 文本客户端(可以是CachedTextClient)
+        on_text: 回调，参数为新生成的文本片段
+        cancelled: threading.Event，设置后关闭连接并抛出 LLMCallCancelled
+        use_cache: 是否读写响应缓存
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise LLMCallCancelled()
+
+    cache = client.cache if isinstance(client, CachedTextClient) else None
+    messages = client._client.messages if cache is not None else client.messages
+    key = None
+    if cache is not None and use_cache:
+        key = cache_key(params)
+        data = cache.get(key)
+        if data is not None:
+            response = _deserialize_response(data)
+            on_text(''.join(block.text for block in response.content))
+            return response
+    elif cache is not None:
+        cache.record_bypass()
+
+    # 退出with时关闭HTTP连接，服务端随之停止生成
+    with messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            if cancelled is not None and cancelled.is_set():
+                raise LLMCallCancelled()
+            on_text(text)
+        response = stream.get_final_message()
+
+    if key is not None:
+        data = _serialize_response(response)
+        if data is not None:
+            try:
+                cache.put(key, data, model=params.get('model'))
+            except sqlite3.Error as e:
+                print(f"[LLM缓存] 写入失败: {e}")
+    return response
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """进程内共享的默认缓存实例"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+        return _default_cache
+
+
+def default_cache_stats():
+    """默认缓存的统计；本进程没有使用缓存时返回None"""
+    return _default_cache.stats() if _default_cache is not None else None
+
+
+def cached_text_client(client):
+    """为文本客户端加上响应缓存；客户端为None或 LLM_CACHE=0 时原样返回"""
+    if client is None or os.environ.get('LLM_CACHE', '1') == '0':
+        return client
+    try:
+        return CachedTextClient(client, get_llm_cache())
+    except sqlite3.Error as e:
+        print(f"[LLM缓存] 初始化失败，不使用缓存: {e}")
+        return client
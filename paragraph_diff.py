@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+段落级修改跟踪
+协作写作中每轮只把改动过的段落交给审校，修改时只重写被标记的段落，而不是反复发送整篇文章
+
+段落以空行分隔，提示词中用 [P1] [P2] ... 编号(从1开始)
+"""
+
+import difflib
+import re
+
+_PATCH_MARKER = re.compile(r'^\s*\[P(\d+)\]\s*$', re.MULTILINE)
+_DELETE_WORDS = ('删除', '(删除)', '（删除）', '[删除]', 'DELETE')
+
+
+def split_paragraphs(content):
+    """按空行分段，去掉空段落"""
+    return [p.strip() for p in re.split(r'\n\s*\n', content or '') if p.strip()]
+
+
+def join_paragraphs(paragraphs):
+    return '\n\n'.join(paragraphs)
+
+
+def changed_paragraphs(old, new):
+    """new中新增或修改过的段落编号(从1开始)；删除段落时删除处之后留下的段落也算改动(衔接需要重新检查)"""
+    changed = set()
+    matcher = difflib.SequenceMatcher(a=old, b=new, autojunk=False)
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag in ('replace', 'insert'):
+            changed.update(range(j1 + 1, j2 + 1))
+        elif tag == 'delete' and new:
+            changed.add(min(j1, len(new) - 1) + 1)
+    return sorted(changed)
+
+
+def numbered(paragraphs, numbers=None):
+    """带编号的段落文本；numbers为None时输出全部"""
+    numbers = numbers if numbers is not None else range(1, len(paragraphs) + 1)
+    return '\n\n'.join(f"[P{n}]\n{paragraphs[n - 1]}" for n in numbers if 1 <= n <= len(paragraphs))
+
+
+def outline(paragraphs, width=24):
+    """全文提纲：每段的编号和开头"""
+    lines = []
+    for n, para in enumerate(paragraphs, 1):
+        head = para.replace('\n', ' ')
+        lines.append(f"[P{n}] {head[:width]}{'…' if len(head) > width else ''}")
+    return '\n'.join(lines)
+
+
+def parse_paragraph_numbers(values, count):
+    """把模型返回的段落编号(整数或"P3"之类的字符串)整理为有效编号列表"""
+    numbers = []
+    for value in values or []:
+        match = re.search(r'\d+', str(value))
+        if match and 1 <= int(match.group()) <= count and int(match.group()) not in numbers:
+            numbers.append(int(match.group()))
+    return sorted(numbers)
+
+
+def parse_patches(text, allowed):
+    """解析修改结果：每个 [Pn] 标记后是该段的新内容，内容为"删除"表示删掉该段
+
+    Returns:
+        {段落编号: 新内容('' 表示删除)}，只包含allowed中的编号
+    """
+    patches = {}
+    markers = list(_PATCH_MARKER.finditer(text or ''))
+    for i, match in enumerate(markers):
+        number = int(match.group(1))
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        # 只去掉单独成行的分隔线，保留内容自身的列表符号等字符
+        body = re.sub(r'^\s*-{3,}\s*$', '', text[match.end():end], flags=re.MULTILINE).strip()
+        if number not in allowed:
+            continue
+        patches[number] = '' if body in _DELETE_WORDS else body
+    return patches
+
+
+def apply_patches(paragraphs, patches):
+    """按编号替换或删除段落，返回新的段落列表（新内容中含空行时拆成多段）"""
+    result = []
+    for n, para in enumerate(paragraphs, 1):
+        if n not in patches:
+            result.append(para)
+        elif patches[n]:
+            result.extend(split_paragraphs(patches[n]))
+    return result
@@ -24,12 +24,12 @@ V9.1修复(2026-02-13):
   ✅ 图生图现在正确保留参考图片的主体内容
 """
 
+import os
 import sys
 from pathlib import Path
 import json
 from datetime import datetime
 import base64
-import requests
 from io import BytesIO
 import tempfile
 import logging
@@ -44,6 +44,11 @@ if sys.platform == 'win32':
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config import Config, get_antigravity_client, get_zhipu_anthropic_client
+from provider_health import get_provider_health
+from hedging import ProviderBudget, race
+from image_ingest import ingest_url
+
+CIRCUIT_OPEN_MESSAGE = "circuit open"  # 熔断跳过时返回的消息标记，降级链据此继续尝试下一个模型
 
 app = Flask(__name__)
 BASE_DIR = Path(__file__).parent.parent
@@ -122,6 +127,12 @@ ANTIGRAVITY_IMAGE_MODELS = [
     ("dall-e-3", "DALL-E 3", "OpenAI最新图像模型"),
 ]
 
+# 对冲模式: 设置IMAGE_HEDGE_DELAY(秒)后，当前模型超时未返回就并行尝试下一个，取最先完成的图片
+_hedge_delay = os.environ.get('IMAGE_HEDGE_DELAY')
+IMAGE_HEDGE_DELAY = float(_hedge_delay) if _hedge_delay else None
+# 对冲模式下每小时各付费提供方最多调用次数
+HEDGE_BUDGET = ProviderBudget({'volcano': 120, 'antigravity': 120}, window=3600)
+
 # 配置详细日志
 logging.basicConfig(
     level=logging.DEBUG,
@@ -191,6 +202,12 @@ def generate_with_seedream(prompt, reference_image_path, output_path, style_name
         - size参数改为"2K"而不是"2048x2048"
         - 添加extra_body参数支持watermark
     """
+    health = get_provider_health()
+    health_key = f"volcano:{model_version}"
+    if not health.available(health_key):
+        logging.warning(f"[即梦AI] {model_version} 熔断中,跳过 (剩余{health.remaining(health_key)}秒)")
+        return False, f"{model_version} {CIRCUIT_OPEN_MESSAGE}", "unknown"
+
     try:
         # 获取API密钥
         api_key = Config.VOLCANO_API_KEY
@@ -246,6 +263,8 @@ def generate_with_seedream(prompt, reference_image_path, output_path, style_name
                 }
             )
 
+        health.record_success(health_key)
+
         # 获取图片URL
         if response.data and len(response.data) > 0:
             image_url = response.data[0].url
@@ -253,15 +272,14 @@ def generate_with_seedream(prompt, reference_image_path, output_path, style_name
 
             logging.info(f"[图片URL] {image_url}")
 
-            # 下载图片
-            img_response = requests.get(image_url, timeout=60)
-            if img_response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(img_response.content)
-                logging.info(f"[✓] 图片已保存: {output_path}")
-                return True, f"成功生成: {output_path}", model_used
-            else:
-                return False, f"下载图像失败: HTTP {img_response.status_code}", model_used
+            # 流式下载图片(边下载边写盘)
+            try:
+                ingested = ingest_url(image_url, Path(output_path).parent, timeout=60)
+            except RuntimeError as e:
+                return False, f"下载图像失败: {e}", model_used
+            os.replace(ingested.path, output_path)
+            logging.info(f"[✓] 图片已保存: {output_path}")
+            return True, f"成功生成: {output_path}", model_used
         else:
             logging.error(f"[错误] 响应格式未知: response.data为空")
             return False, "即梦AI返回空响应", "unknown"
@@ -272,6 +290,9 @@ def generate_with_seedream(prompt, reference_image_path, output_path, style_name
         import traceback
         logging.debug(traceback.format_exc())
 
+        if health.record_failure(health_key, e):
+            logging.warning(f"[熔断器] {health_key} 已熔断,冷却{health.remaining(health_key)}秒")
+
         # 检查是否是配额问题
         if "429" in error_str or "quota" in error_str.lower() or "limit" in error_str.lower():
             return False, error_str, "unknown"
@@ -299,9 +320,14 @@ def generate_with_antigravity(prompt, output_path, style_name):
             return False, "Antigravity客户端未配置", "unknown"
 
         logging.info("[Antigravity] 正在尝试备选图像模型...")
+        health = get_provider_health()
 
         # 按优先级尝试各个模型
         for model_id, model_name, model_desc in ANTIGRAVITY_IMAGE_MODELS:
+            health_key = f"antigravity:{model_id}"
+            if not health.available(health_key):
+                logging.warning(f"[Antigravity] {model_name} 熔断中,跳过 (剩余{health.remaining(health_key)}秒)")
+                continue
             try:
                 logging.info(f"[Antigravity] 尝试模型: {model_name} ({model_id})")
 
@@ -310,29 +336,30 @@ def generate_with_antigravity(prompt, output_path, style_name):
                     prompt=prompt,
                     size="1024x1024"
                 )
+                health.record_success(health_key)
 
                 if response.data and len(response.data) > 0:
                     image_url = response.data[0].url
 
                     logging.info(f"[Antigravity] 获取图片URL: {image_url[:50]}...")
 
-                    # 下载图片
-                    img_response = requests.get(image_url, timeout=60)
-                    if img_response.status_code == 200:
-                        with open(output_path, 'wb') as f:
-                            f.write(img_response.content)
-                        logging.info(f"[✓] Antigravity图片已保存: {output_path}")
-                        logging.info(f"[✓] 使用模型: {model_name}")
-                        return True, f"成功生成(使用{model_name}): {output_path}", f"antigravity-{model_id}"
-                    else:
-                        logging.warning(f"[Antigravity] 下载失败: HTTP {img_response.status_code}")
+                    # 流式下载图片(边下载边写盘)
+                    try:
+                        ingested = ingest_url(image_url, Path(output_path).parent, timeout=60)
+                    except RuntimeError as e:
+                        logging.warning(f"[Antigravity] 下载失败: {e}")
                         continue
+                    os.replace(ingested.path, output_path)
+                    logging.info(f"[✓] Antigravity图片已保存: {output_path}")
+                    logging.info(f"[✓] 使用模型: {model_name}")
+                    return True, f"成功生成(使用{model_name}): {output_path}", f"antigravity-{model_id}"
                 else:
                     logging.warning(f"[Antigravity] {model_name} 返回空响应")
                     continue
 
             except Exception as e:
                 error_str = str(e)
+                health.record_failure(health_key, e)
                 # 检查是否是配额问题
                 if "429" in error_str or "quota" in error_str.lower() or "limit" in error_str.lower():
                     logging.warning(f"[Antigravity] {model_name} 配额已用尽,尝试下一个模型...")
@@ -355,6 +382,12 @@ def generate_with_antigravity(prompt, output_path, style_name):
         return False, f"Antigravity生成失败: {str(e)}", "unknown"
 
 
+def _should_fallback(message):
+    """配额问题或熔断跳过时继续尝试下一个模型"""
+    lowered = message.lower()
+    return "429" in message or "limit" in lowered or "quota" in lowered or CIRCUIT_OPEN_MESSAGE in lowered
+
+
 def generate_image_with_fallback(prompt, reference_image_path, output_path, style_name):
     """智能图像生成: 优先Seedream 4.5 -> Seedream 4.0 -> Antigravity
 
@@ -372,6 +405,9 @@ def generate_image_with_fallback(prompt, reference_image_path, output_path, styl
     Returns:
         (success, message, model_used)
     """
+    if IMAGE_HEDGE_DELAY is not None:
+        return generate_image_raced(prompt, reference_image_path, output_path, style_name, IMAGE_HEDGE_DELAY)
+
     # 1. 首先尝试 Seedream 4.5
     logging.info("[Fallback 1/3] 尝试 Seedream 4.5...")
     success, message, model_used = generate_with_seedream(
@@ -383,7 +419,7 @@ def generate_image_with_fallback(prompt, reference_image_path, output_path, styl
         return success, message, model_used
 
     # 检查是否是配额问题
-    if "429" in message or "limit" in message.lower() or "quota" in message.lower():
+    if _should_fallback(message):
         logging.info("[Fallback 2/3] Seedream 4.5配额用尽,尝试 Seedream 4.0...")
 
         # 2. 尝试 Seedream 4.0
@@ -396,7 +432,7 @@ def generate_image_with_fallback(prompt, reference_image_path, output_path, styl
             return success, message, model_used
 
         # 检查是否还是配额问题
-        if "429" in message or "limit" in message.lower() or "quota" in message.lower():
+        if _should_fallback(message):
             logging.info("[Fallback 3/3] Seedream 4.0也配额用尽,切换到Antigravity备选模型...")
             # 3. Fallback到Antigravity
             return generate_with_antigravity(prompt, output_path, style_name)
@@ -405,6 +441,50 @@ def generate_image_with_fallback(prompt, reference_image_path, output_path, styl
     return success, message, model_used
 
 
+def generate_image_raced(prompt, reference_image_path, output_path, style_name, hedge_delay):
+    """对冲模式: Seedream 4.5 / Seedream 4.0 / Antigravity 按顺序间隔hedge_delay秒并行启动
+
+    各候选写入各自的临时文件，最先成功的改名为output_path，其余结果丢弃
+
+    Returns:
+        (success, message, model_used)
+    """
+    def candidate(tag, generate):
+        tmp_path = f"{output_path}.{tag}.tmp"
+
+        def call():
+            success, message, model_used = generate(tmp_path)
+            if not success:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise RuntimeError(message)
+            return tmp_path, message, model_used
+        return call
+
+    def discard(name, result):
+        try:
+            os.remove(result[0])
+        except OSError:
+            pass
+
+    candidates = [
+        ('volcano', 'Seedream 4.5', candidate('seedream45', lambda path: generate_with_seedream(
+            prompt, reference_image_path, path, style_name, model_version="doubao-seedream-4-5-251128"))),
+        ('volcano', 'Seedream 4.0', candidate('seedream40', lambda path: generate_with_seedream(
+            prompt, reference_image_path, path, style_name, model_version="doubao-seedream-4-0-250828"))),
+        ('antigravity', 'Antigravity', candidate('antigravity', lambda path: generate_with_antigravity(
+            prompt, path, style_name))),
+    ]
+    name, result = race(candidates, hedge_delay, budget=HEDGE_BUDGET, on_discard=discard, log=logging.info)
+    if result is None:
+        return False, "所有图像模型均生成失败", "unknown"
+
+    tmp_path, message, model_used = result
+    os.replace(tmp_path, output_path)
+    logging.info(f"[对冲] 采用 {name} 的结果")
+    return True, message.replace(tmp_path, str(output_path)), model_used
+
+
 def encode_image_to_base64(image_path):
     """将图像文件编码为base64"""
     try:
@@ -422,6 +502,12 @@ def index():
     return send_from_directory(Path(__file__).parent, 'web_image_generator.html')
 
 
+@app.route('/health')
+def health():
+    """健康检查（工具管理器用来判断服务是否已就绪）"""
+    return jsonify({'status': 'ok'})
+
+
 @app.route('/api/generate-image', methods=['POST'])
 def api_generate_image():
     """API: 生成图像 - V9简化版"""
@@ -665,11 +751,14 @@ def api_save_image():
 
 def main():
     """主函数"""
+    # 工具管理器通过 TOOL_PORT 分配端口，单独运行时使用默认端口
+    port = int(os.environ.get('TOOL_PORT', '5009'))
+
     print("\n" + "="*80)
     print("                    AI图像生成器 - Web版 V9.3 (多模型Fallback版)")
     print("="*80)
     print()
-    print("启动Web服务器: http://localhost:5009")
+    print(f"启动Web服务器: http://localhost:{port}")
     print("请在浏览器中打开上述地址")
     print()
     print("功能特性:")
@@ -695,11 +784,11 @@ def main():
     print()
     print("💡 调试提示:")
     print("  - 所有print输出都会在浏览器F12控制台中显示")
-    print("  - 可访问 http://localhost:5009/logs 查看完整日志")
+    print(f"  - 可访问 http://localhost:{port}/logs 查看完整日志")
     print("="*80)
     print()
 
-    app.run(host='0.0.0.0', port=5009, debug=False)
+    app.run(host='0.0.0.0', port=port, debug=False)
 
 
 if __name__ == "__main__":
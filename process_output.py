@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+工具进程输出缓冲
+进程启动时为stdout/stderr各启动一个读取线程，逐行写入缓冲区；
+状态接口和SSE流式接口都只读取缓冲区，不再在请求中读取管道
+
+缓冲区是固定容量的环形缓冲，只保留最近的若干行；
+需要完整日志时可以同时写入按大小轮转的日志文件
+"""
+
+import threading
+from collections import deque
+from pathlib import Path
+
+
+class RotatingLogFile:
+    """按大小轮转的日志文件: name.log -> name.log.1 -> ... -> name.log.N"""
+
+    def __init__(self, path, max_bytes=1024 * 1024, backup_count=3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, text):
+        if self._file is None:
+            return
+        if self._file.tell() + len(text.encode('utf-8')) > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{index}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ProcessOutput:
+    """按行保存的进程输出（环形缓冲）
+
+    行号(offset)从0开始全局递增，缓冲区只保留最近 max_lines 行；
+    读取已被淘汰的行时从最早保留的行开始返回。
+    """
+
+    def __init__(self, max_lines=2000, max_line_length=4096, spill_path=None):
+        """
+        Args:
+            max_lines: 内存中保留的最大行数
+            max_line_length: 单行最大字符数，超出部分截断
+            spill_path: 可选，同时写入的轮转日志文件路径
+        """
+        self.max_line_length = max_line_length
+        self._lines = deque(maxlen=max_lines)
+        self._total = 0  # 累计写入的行数，即下一行的offset
+        self._cond = threading.Condition()
+        self._open_streams = 0
+        self._spill = RotatingLogFile(spill_path) if spill_path else None
+        self._process = None
+        self._on_exit = None
+        self.spill_path = str(spill_path) if spill_path else None
+        self.closed = False
+
+    @property
+    def first_offset(self):
+        """缓冲区中最早一行的offset"""
+        return self._total - len(self._lines)
+
+    def append(self, text):
+        """追加一段输出（可以包含多行）"""
+        if not text:
+            return
+        if not text.endswith('\n'):
+            text += '\n'
+        lines = text.splitlines(keepends=True)
+        with self._cond:
+            for line in lines:
+                if len(line) > self.max_line_length:
+                    line = line[:self.max_line_length] + '...[截断]\n'
+                self._lines.append(line)
+            self._total += len(lines)
+            if self._spill is not None:
+                self._spill.write(text)
+            self._cond.notify_all()
+
+    def read(self, offset=0):
+        """读取offset之后仍保留在缓冲区的行
+
+        Returns:
+            (lines, next_offset): 第一行的offset为 next_offset - len(lines)
+        """
+        with self._cond:
+            start = max(offset, self.first_offset)
+            lines = list(self._lines)[start - self.first_offset:]
+            return lines, self._total
+
+    def text(self):
+        """获取缓冲区中的输出文本（前面被淘汰的行用一行提示代替）"""
+        with self._cond:
+            dropped = self.first_offset
+            text = ''.join(self._lines)
+        if dropped:
+            text = f'[... 已省略前{dropped}行输出 ...]\n' + text
+        return text
+
+    def tail(self, num_lines=50):
+        """获取最后若干行"""
+        with self._cond:
+            return ''.join(list(self._lines)[-num_lines:])
+
+    def wait(self, offset, timeout=None):
+        """等待offset之后出现新行或输出结束，返回是否有新内容/已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._total > offset or self.closed, timeout)
+
+    def wait_closed(self, timeout=None):
+        """等待所有管道读取完毕"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.closed, timeout)
+
+    def attach(self, process, on_exit=None):
+        """为进程的stdout/stderr各启动一个读取线程（进程启动时调用一次）
+
+        Args:
+            process: subprocess.Popen对象
+            on_exit: 可选，管道读完后调用 on_exit(process)，由回调负责回收进程
+        """
+        self._process = process
+        self._on_exit = on_exit
+        streams = [(process.stdout, ''), (process.stderr, '[stderr] ')]
+        streams = [(pipe, prefix) for pipe, prefix in streams if pipe is not None]
+        with self._cond:
+            self._open_streams = len(streams)
+            if not streams:
+                self._close()
+        for pipe, prefix in streams:
+            threading.Thread(
+                target=self._read_pipe, args=(pipe, prefix), daemon=True,
+                name=f'output-reader-{process.pid}'
+            ).start()
+
+    def _close(self):
+        self.closed = True
+        if self._spill is not None:
+            self._spill.close()
+        self._cond.notify_all()
+
+    def _read_pipe(self, pipe, prefix):
+        try:
+            for raw_line in iter(pipe.readline, b''):
+                self.append(prefix + raw_line.decode('utf-8', errors='ignore'))
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+            with self._cond:
+                self._open_streams -= 1
+                last_stream = self._open_streams <= 0
+                if last_stream:
+                    self._close()
+            if last_stream and self._on_exit is not None:
+                self._on_exit(self._process)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+任务进度事件
+每个生成任务通过 job_events(sink) 设置自己的事件接收函数(保存在contextvar中)，
+同一进程内并发运行的多个任务各自只收到自己的事件，不再需要替换 builtins.print
+
+事件是dict，至少包含 'type':
+  log    {'level', 'message'}     进度文本（progress_print 会同时输出到控制台）
+  token  {'stage', 'text'}        模型流式生成的文本片段
+  其他类型由调用方自行约定
+
+注意: 新线程不会继承contextvar，线程池中执行的任务需要用 contextvars.copy_context().run 提交
+"""
+
+import builtins
+import contextvars
+import sys
+from contextlib import contextmanager
+
+_current_sink = contextvars.ContextVar('progress_sink', default=None)
+
+
+@contextmanager
+def job_events(sink):
+    """在当前上下文中把进度事件发给sink(event_dict)"""
+    token = _current_sink.set(sink)
+    try:
+        yield
+    finally:
+        _current_sink.reset(token)
+
+
+def has_listener():
+    """当前上下文是否有任务在接收事件"""
+    return _current_sink.get() is not None
+
+
+def emit(event_type, **fields):
+    """发出一个进度事件；没有任务在接收时忽略"""
+    sink = _current_sink.get()
+    if sink is None:
+        return
+    event = {'type': event_type}
+    event.update(fields)
+    try:
+        sink(event)
+    except Exception as e:
+        builtins.print(f"[进度事件] 发送失败: {e}", file=sys.stderr)
+
+
+def emit_log(message, level='info'):
+    """发出一条进度文本事件（不输出到控制台）"""
+    emit('log', level=level, message=message)
+
+
+def progress_print(*args, sep=' ', end='\n', file=None, flush=False):
+    """与print相同的签名：输出到控制台，同时作为log事件发给当前任务"""
+    builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+    if file is None or file is sys.stdout:
+        emit_log(sep.join(str(arg) for arg in args))
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+模型提供方健康状态(熔断器)
+图像/文本生成遇到配额用尽(429)、模型不存在(404/NOT_FOUND)或容量不足(503/过载)时，
+为该 提供方:模型 打开熔断，冷却期内所有调用直接跳过，不再浪费一次完整的请求
+
+  - 冷却时间优先取自响应头 Retry-After 或错误信息中的重试时间，否则按错误类型取默认值
+  - 冷却结束后进入半开状态：只放行一次试探调用，成功则关闭熔断，失败则以加倍的冷却时间重新打开
+  - 状态保存在项目根目录的 .provider_health.db (WAL模式的SQLite) 中，同一台机器上的各个工具共享
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+HEALTH_PATH_ENV_VAR = 'PROVIDER_HEALTH_PATH'
+DEFAULT_HEALTH_PATH = Path(__file__).parent / '.provider_health.db'
+
+# 各类错误的默认冷却时间(秒)
+DEFAULT_COOLDOWNS = {
+    'quota': 600,
+    'not_found': 3600,
+    'capacity': 120,
+}
+MAX_COOLDOWN = 6 * 3600
+PROBE_TIMEOUT = 120  # 半开状态下试探调用的最长占用时间，超时后允许其他调用再次试探
+
+QUOTA_PATTERNS = ['429', 'quota', 'rate limit', 'ratelimit', 'resource_exhausted', 'limitexceeded', 'too many requests']
+NOT_FOUND_PATTERNS = ['404', 'not_found', 'notfound', 'model not found', 'does not exist']
+CAPACITY_PATTERNS = ['503', '529', 'overloaded', 'capacity', 'service unavailable', 'serveroverloaded']
+
+_RETRY_TEXT_PATTERNS = [
+    re.compile(r'retry[\s_-]*after\D{0,10}?(\d+(?:\.\d+)?)', re.IGNORECASE),
+    re.compile(r'retry in (\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+    re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"'),
+]
+
+
+def classify_error(error):
+    """判断错误是否应打开熔断，返回 'quota' / 'not_found' / 'capacity' 或None"""
+    status = getattr(error, 'status_code', None)
+    if status == 429:
+        return 'quota'
+    if status == 404:
+        return 'not_found'
+    if status in (503, 529):
+        return 'capacity'
+
+    text = str(error).lower()
+    for kind, patterns in (('quota', QUOTA_PATTERNS), ('not_found', NOT_FOUND_PATTERNS),
+                           ('capacity', CAPACITY_PATTERNS)):
+        if any(pattern in text for pattern in patterns):
+            return kind
+    return None
+
+
+def retry_after_seconds(error):
+    """从响应头Retry-After或错误信息中提取建议的重试等待秒数，没有时返回None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        value = headers.get('retry-after-ms')
+        if value:
+            return float(value) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        pass
+
+    text = str(error)
+    for pattern in _RETRY_TEXT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class ProviderHealth:
+    """跨进程共享的提供方熔断状态
+
+    每次读改写都在SQLite的 BEGIN IMMEDIATE 事务中完成，多个工具进程同时更新熔断或争抢半开试探时不会互相覆盖
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get(HEALTH_PATH_ENV_VAR) or DEFAULT_HEALTH_PATH)
+        self._lock = threading.Lock()
+        # 自动提交模式，事务由 _transaction 显式开启
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS breakers (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                open_until REAL NOT NULL,
+                probe_until REAL,
+                error TEXT
+            )
+        ''')
+
+    @contextmanager
+    def _transaction(self):
+        """加写锁的事务：其他进程在此期间只能等待"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _get(self, conn, key):
+        return conn.execute('SELECT * FROM breakers WHERE key = ?', (key,)).fetchone()
+
+    def available(self, key):
+        """是否可以调用该提供方；冷却结束后只放行一次试探调用"""
+        try:
+            with self._transaction() as conn:
+                breaker = self._get(conn, key)
+                if breaker is None:
+                    return True
+                now = time.time()
+                if now < breaker['open_until'] or now < (breaker['probe_until'] or 0):
+                    return False
+                conn.execute('UPDATE breakers SET probe_until = ? WHERE key = ?', (now + PROBE_TIMEOUT, key))
+                return True
+        except sqlite3.Error as e:
+            print(f"[熔断器] 读取状态失败: {e}")
+            return True
+
+    def remaining(self, key):
+        """熔断剩余冷却秒数，未熔断时为0"""
+        with self._lock:
+            breaker = self._get(self._conn, key)
+        if breaker is None:
+            return 0
+        return max(0, round(breaker['open_until'] - time.time()))
+
+    def record_success(self, key):
+        """调用成功，关闭熔断"""
+        try:
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM breakers WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"[熔断器] 保存状态失败: {e}")
+
+    def record_failure(self, key, error):
+        """记录一次失败，属于熔断类错误时打开熔断
+
+        Returns:
+            str: 打开熔断时返回错误类型，否则返回None
+        """
+        kind = classify_error(error)
+        try:
+            with self._transaction() as conn:
+                if kind is None:
+                    # 半开试探时遇到其他错误，释放试探名额
+                    conn.execute('UPDATE breakers SET probe_until = NULL WHERE key = ?', (key,))
+                    return None
+
+                previous = self._get(conn, key)
+                failures = (previous['failures'] + 1) if previous else 1
+                cooldown = retry_after_seconds(error)
+                if cooldown is None:
+                    cooldown = DEFAULT_COOLDOWNS[kind] * (2 ** (failures - 1))
+                cooldown = min(cooldown, MAX_COOLDOWN)
+                conn.execute(
+                    'INSERT OR REPLACE INTO breakers (key, kind, failures, open_until, probe_until, error) '
+                    'VALUES (?, ?, ?, ?, NULL, ?)',
+                    (key, kind, failures, time.time() + cooldown, str(error)[:200])
+                )
+        except sqlite3.Error as e:
+            print(f"[熔断器] 保存状态失败: {e}")
+        return kind
+
+    def snapshot(self):
+        """所有熔断中的提供方 {key: {kind, failures, remaining, error}}"""
+        with self._lock:
+            breakers = self._conn.execute('SELECT * FROM breakers').fetchall()
+        now = time.time()
+        return {
+            breaker['key']: {
+                'kind': breaker['kind'],
+                'failures': breaker['failures'],
+                'remaining': max(0, round(breaker['open_until'] - now)),
+                'state': 'open' if now < breaker['open_until'] else 'half_open',
+                'error': breaker['error'],
+            }
+            for breaker in breakers
+        }
+
+
+_default_health = None
+_default_lock = threading.Lock()
+
+
+def get_provider_health():
+    """进程内共享的默认熔断器实例"""
+    global _default_health
+    with _default_lock:
+        if _default_health is None:
+            _default_health = ProviderHealth()
+        return _default_health
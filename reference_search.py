@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+参考素材搜索
+写作前的DuckDuckGo素材搜索：多个查询变体并行执行，结果按规范化URL去重、按排名合并，
+截取固定条数和字数的摘要，提示词长度可预期
+
+  - 每个查询的结果缓存在WAL模式的SQLite中(默认项目根目录 .search_cache.db)，有效期内同一查询不再联网
+  - 同一URL被多个查询命中时排名靠前
+
+环境变量:
+  SEARCH_CACHE_PATH   缓存数据库路径
+  SEARCH_CACHE_TTL    有效期(秒)，默认1天
+  SEARCH_CACHE=0      关闭缓存
+"""
+
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / '.search_cache.db'
+DEFAULT_TTL = 24 * 3600
+SEARCH_WORKERS = 4
+MAX_SNIPPETS = 8
+SNIPPET_CHARS = 200
+MAX_TOTAL_CHARS = 2400
+
+# 不影响页面内容的跟踪参数
+_TRACKING_PARAMS = {'spm', 'from', 'fbclid', 'gclid', 'share_token', 'share_source', 'ref', 'source', 'wfr'}
+
+
+def canonical_url(url):
+    """规范化URL用于去重：统一协议和域名大小写、去掉www./m.、锚点、跟踪参数和末尾斜杠"""
+    if not url:
+        return ''
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'wap.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith('utm_') and k.lower() not in _TRACKING_PARAMS]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+
+class SearchCache:
+    """磁盘上的搜索结果缓存"""
+
+    def __init__(self, db_path=None, ttl=None):
+        self.db_path = Path(db_path or os.environ.get('SEARCH_CACHE_PATH') or DEFAULT_CACHE_PATH)
+        self.ttl = ttl if ttl is not None else float(os.environ.get('SEARCH_CACHE_TTL', DEFAULT_TTL))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS search_results (
+                    key TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    results TEXT NOT NULL
+                )
+            ''')
+
+    @staticmethod
+    def _key(query, max_results):
+        return f"{max_results}:{' '.join(query.split())}"
+
+    def get(self, query, max_results):
+        """返回缓存的结果列表，不存在或已过期时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT created_at, results FROM search_results WHERE key = ?', (self._key(query, max_results),)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return json.loads(row[1])
+
+    def put(self, query, max_results, results):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO search_results (key, created_at, results) VALUES (?, ?, ?)',
+                (self._key(query, max_results), time.time(), json.dumps(results, ensure_ascii=False))
+            )
+            self._conn.execute('DELETE FROM search_results WHERE created_at < ?', (time.time() - self.ttl,))
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_search_cache():
+    """进程内共享的默认缓存实例；SEARCH_CACHE=0 或无法打开时返回None"""
+    global _default_cache
+    if os.environ.get('SEARCH_CACHE', '1') == '0':
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = SearchCache()
+            except sqlite3.Error as e:
+                print(f"[素材搜索] 缓存初始化失败，不使用缓存: {e}")
+                return None
+        return _default_cache
+
+
+def search(query, max_results=5, cache=None):
+    """执行一个查询，返回 [{'title', 'snippet', 'url'}]（先查缓存）
+
+    未安装duckduckgo-search时抛出ImportError，其余搜索异常原样抛出
+    """
+    if cache is not None:
+        cached = cache.get(query, max_results)
+        if cached is not None:
+            print(f"[素材搜索] 查询(缓存): {query}")
+            return cached
+
+    from duckduckgo_search import DDGS
+
+    print(f"[素材搜索] 查询: {query}")
+    with DDGS() as ddgs:
+        results = [
+            {'title': r.get('title', ''), 'snippet': r.get('body', ''), 'url': r.get('href', '')}
+            for r in ddgs.text(query, max_results=max_results)
+        ]
+    # 空结果多为临时限流，不缓存，下次仍然联网查询
+    if cache is not None and results:
+        try:
+            cache.put(query, max_results, results)
+        except sqlite3.Error as e:
+            print(f"[素材搜索] 缓存写入失败: {e}")
+    return results
+
+
+def search_many(queries, max_results=3, max_snippets=MAX_SNIPPETS, cache=None, workers=SEARCH_WORKERS):
+    """并行执行多个查询，按规范化URL去重并排序
+
+    Args:
+        queries: [(查询, 权重)]，权重越大该查询的结果越靠前
+        max_snippets: 最多返回的结果条数
+
+    Returns:
+        排序后的结果列表，每条附带 'score'
+    """
+    if not queries:
+        return []
+
+    def run(query):
+        try:
+            return search(query, max_results, cache)
+        except ImportError:
+            raise
+        except Exception as e:
+            print(f"[素材搜索] 搜索异常({query}): {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(queries)), thread_name_prefix='search') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, query) for query, _ in queries]
+        result_lists = [future.result() for future in futures]
+
+    # 每个查询中排第rank位的结果得 权重/(rank+1) 分，同一URL累加
+    merged = {}
+    order = 0
+    for (_, weight), results in zip(queries, result_lists):
+        for rank, result in enumerate(results):
+            key = canonical_url(result.get('url')) or result.get('title', '')
+            if not key:
+                continue
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = dict(result, score=0.0, order=order)
+                order += 1
+            elif len(result.get('snippet', '')) > len(entry.get('snippet', '')):
+                entry['snippet'] = result['snippet']
+            entry['score'] += weight / (rank + 1)
+
+    ranked = sorted(merged.values(), key=lambda r: (-r['score'], r['order']))
+    for entry in ranked:
+        entry.pop('order')
+    return ranked[:max_snippets]
+
+
+def format_materials(results, snippet_chars=SNIPPET_CHARS, max_chars=MAX_TOTAL_CHARS):
+    """格式化为提示词中的素材文本，每条摘要和总字数都有上限"""
+    blocks = []
+    total = 0
+    for r in results:
+        snippet = r.get('snippet', '').strip()
+        if len(snippet) > snippet_chars:
+            snippet = snippet[:snippet_chars] + '…'
+        block = f"【{r.get('title', '')}】\n{snippet}\n来源: {r.get('url', '')}"
+        if blocks and total + len(block) > max_chars:
+            break
+        blocks.append(block)
+        total += len(block)
+    return '\n\n'.join(blocks)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+工具进程资源统计
+后台线程定期采样运行中子进程的CPU时间、内存(RSS/峰值RSS)和磁盘读写字节数；
+进程结束时在POSIX系统上用wait4回收，取得内核统计的精确CPU时间和峰值内存
+
+采样方式:
+  - 安装了psutil时使用psutil(跨平台，包括Windows)
+  - 否则在Linux上读取/proc
+  - 都不可用时只记录耗时
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_PROC_AVAILABLE = os.path.exists('/proc/self/stat')
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _read_proc_stats(pid):
+    """从/proc读取进程统计"""
+    stats = {}
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        # comm字段可能包含空格，从最后一个')'之后开始切分
+        fields = f.read().rsplit(')', 1)[1].split()
+    stats['cpu_time'] = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+    with open(f'/proc/{pid}/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                stats['rss'] = int(line.split()[1]) * 1024
+            elif line.startswith('VmHWM:'):
+                stats['peak_rss'] = int(line.split()[1]) * 1024
+
+    try:
+        with open(f'/proc/{pid}/io', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    stats['read_bytes'] = int(value)
+                elif key == 'write_bytes':
+                    stats['write_bytes'] = int(value)
+    except OSError:
+        pass  # 部分系统不允许读取io统计
+    return stats
+
+
+def _read_psutil_stats(pid):
+    """用psutil读取进程统计"""
+    proc = psutil.Process(pid)
+    with proc.oneshot():
+        cpu = proc.cpu_times()
+        memory = proc.memory_info()
+        stats = {
+            'cpu_time': cpu.user + cpu.system,
+            'rss': memory.rss,
+            # Windows上有peak_wset，其他平台只能取采样到的最大值
+            'peak_rss': getattr(memory, 'peak_wset', memory.rss),
+        }
+        try:
+            io = proc.io_counters()
+            stats['read_bytes'] = io.read_bytes
+            stats['write_bytes'] = io.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    return stats
+
+
+def read_process_stats(pid):
+    """读取一次进程资源统计，进程不存在或无法读取时返回None"""
+    try:
+        if psutil is not None:
+            return _read_psutil_stats(pid)
+        if _PROC_AVAILABLE:
+            return _read_proc_stats(pid)
+    except Exception:
+        return None
+    return None
+
+
+def reap_process(process):
+    """等待子进程结束并回收
+
+    Returns:
+        (returncode, rusage): rusage为内核统计的资源数据，平台不支持时为None
+    """
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+
+    # 与Popen.wait相同，持有_waitpid_lock期间其他线程的poll()不会抢先回收该进程
+    lock = getattr(process, '_waitpid_lock', None) or contextlib.nullcontext()
+    with lock:
+        if process.returncode is not None:
+            return process.returncode, None
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            return process.wait(), None
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    maxrss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+    return process.returncode, {
+        'cpu_time': rusage.ru_utime + rusage.ru_stime,
+        'peak_rss': maxrss,
+        'read_bytes': rusage.ru_inblock * 512,
+        'write_bytes': rusage.ru_oublock * 512,
+    }
+
+
+class ResourceMonitor:
+    """定期采样被跟踪进程的资源使用"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._tracked = {}  # key -> {'process', 'start', 'stats'}
+        self._thread = None
+
+    def track(self, key, process):
+        """开始跟踪一个进程"""
+        with self._lock:
+            self._tracked[key] = {'process': process, 'start': time.time(), 'stats': {}}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, daemon=True, name='resource-monitor')
+                self._thread.start()
+        self._sample(key)
+
+    def current(self, key):
+        """运行中进程的最新采样"""
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is None:
+                return None
+            return dict(entry['stats'], wall_time=round(time.time() - entry['start'], 3))
+
+    def finish(self, key, rusage=None):
+        """停止跟踪，合并采样和rusage，返回最终统计"""
+        with self._lock:
+            entry = self._tracked.pop(key, None)
+        if entry is None:
+            return None
+
+        metrics = dict(entry['stats'])
+        metrics.pop('rss', None)
+        if rusage:
+            metrics['cpu_time'] = rusage['cpu_time']
+            metrics['peak_rss'] = max(rusage['peak_rss'], metrics.get('peak_rss', 0))
+            # /proc/io的字节数比块计数精确，没有采样到时才用rusage
+            metrics.setdefault('read_bytes', rusage['read_bytes'])
+            metrics.setdefault('write_bytes', rusage['write_bytes'])
+        metrics['wall_time'] = round(time.time() - entry['start'], 3)
+        if 'cpu_time' in metrics:
+            metrics['cpu_time'] = round(metrics['cpu_time'], 3)
+        return metrics
+
+    def _sample(self, key):
+        with self._lock:
+            entry = self._tracked.get(key)
+        # 不调用poll()，避免抢在reap_process之前回收子进程
+        if entry is None or entry['process'].returncode is not None:
+            return
+        stats = read_process_stats(entry['process'].pid)
+        if not stats:
+            return
+        with self._lock:
+            previous = entry['stats']
+            stats['peak_rss'] = max(stats.get('peak_rss', 0), stats.get('rss', 0), previous.get('peak_rss', 0))
+            # 累计值只增不减（进程退出后/proc中的部分字段会清零）
+            for counter in ('cpu_time', 'read_bytes', 'write_bytes'):
+                if counter in previous:
+                    stats[counter] = max(stats.get(counter, 0), previous[counter])
+            entry['stats'] = stats
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                keys = list(self._tracked)
+            for key in keys:
+                self._sample(key)
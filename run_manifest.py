@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+工具运行清单(manifest)
+工具管理器为每次运行分配一个运行目录(按process_id区分)，通过环境变量告诉工具:
+  TOOL_RUN_DIR       运行目录
+  TOOL_RUN_MANIFEST  清单文件路径(运行目录下的manifest.json)
+
+工具在运行过程中写入清单(状态、输出文件、各阶段耗时)，
+管理器只读取这一个文件判断是否完成，不再扫描输出目录
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+RUN_DIR_ENV_VAR = 'TOOL_RUN_DIR'
+MANIFEST_ENV_VAR = 'TOOL_RUN_MANIFEST'
+MANIFEST_FILENAME = 'manifest.json'
+
+
+class RunManifest:
+    """工具端：写入运行清单（每次更新都整体原子替换）"""
+
+    def __init__(self, path, process_id=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        self._last_mark = now
+        self.data = {
+            'process_id': process_id,
+            'pid': os.getpid(),
+            'status': 'running',
+            'started_at': now,
+            'updated_at': now,
+            'finished_at': None,
+            'outputs': [],
+            'timings': {},
+            'error': None,
+        }
+        self._write()
+
+    @classmethod
+    def from_env(cls):
+        """由工具管理器启动时返回清单对象，单独运行时返回None"""
+        path = os.environ.get(MANIFEST_ENV_VAR)
+        if not path:
+            return None
+        try:
+            return cls(path, process_id=Path(path).parent.name)
+        except OSError as e:
+            print(f"[运行清单] 创建失败: {e}")
+            return None
+
+    def mark(self, stage):
+        """记录一个阶段结束，耗时为距上一次记录的秒数"""
+        now = time.time()
+        self.data['timings'][stage] = round(now - self._last_mark, 3)
+        self._last_mark = now
+        self._write()
+
+    def add_output(self, path, kind=None):
+        """登记一个输出文件"""
+        path = Path(path)
+        self.data['outputs'].append({
+            'path': str(path.absolute()),
+            'name': path.name,
+            'kind': kind or path.suffix.lstrip('.'),
+        })
+        self._write()
+
+    def finish(self, status='completed', error=None):
+        """标记运行结束"""
+        self.data['status'] = status
+        self.data['error'] = error
+        self.data['finished_at'] = time.time()
+        self._write()
+
+    def _write(self):
+        self.data['updated_at'] = time.time()
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ManifestReader:
+    """管理器端：读取运行清单，文件未变化时直接返回上次结果（每次只stat一个文件）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._state = None
+        self._data = None
+
+    def read(self):
+        """返回清单内容，清单尚未创建时返回None"""
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        state = (stat.st_mtime_ns, stat.st_size)
+        if state != self._state:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+                self._state = state
+            except (OSError, ValueError):
+                pass
+        return self._data
+
+    def output(self, kind):
+        """清单中指定类型的第一个输出文件"""
+        data = self.read()
+        for item in (data or {}).get('outputs', []):
+            if item.get('kind') == kind:
+                return item
+        return None
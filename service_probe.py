@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Web服务类工具的端口分配与就绪检测
+  - 优先使用配置的端口，被占用时由系统分配空闲端口，通过环境变量 TOOL_PORT 传给子进程
+  - 启动后按指数退避轮询健康检查地址，直到服务可以响应
+"""
+
+import socket
+import time
+import urllib.error
+import urllib.request
+
+PORT_ENV_VAR = 'TOOL_PORT'
+
+
+def port_is_free(port, host='127.0.0.1'):
+    """检查端口当前是否可以监听"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def allocate_port(preferred=None):
+    """分配端口：preferred可用时直接使用，否则由系统分配一个空闲端口"""
+    if preferred and port_is_free(preferred):
+        return preferred
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def probe(url, timeout=1.0):
+    """请求一次健康检查地址，服务有响应(非5xx)即视为就绪"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def wait_until_ready(url, process=None, timeout=30.0, initial_delay=0.1, max_delay=0.5):
+    """轮询直到服务就绪
+
+    Args:
+        url: 健康检查地址
+        process: 可选，对应的子进程；进程退出时立即放弃
+        timeout: 最长等待时间(秒)
+        initial_delay: 第一次重试间隔(秒)，之后每次翻倍
+        max_delay: 最大重试间隔(秒)
+
+    Returns:
+        float: 从开始等待到就绪的秒数；超时或进程退出返回None
+    """
+    start = time.time()
+    delay = initial_delay
+    while True:
+        if probe(url):
+            return time.time() - start
+        if process is not None and process.poll() is not None:
+            return None
+        remaining = timeout - (time.time() - start)
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+工具目录缓存
+启动时构建一次工具列表，之后通过文件监听增量更新，避免每次请求都重新扫描目录
+
+监听方式:
+  - 优先使用watchdog(Linux下基于inotify，Windows下基于ReadDirectoryChangesW)
+  - 未安装watchdog时降级为后台mtime轮询
+"""
+
+import hashlib
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# 工具分类（目录 -> 显示名称），文档库固定排在最后
+CATEGORIES = {
+    "bird": "鸟类绘画工具",
+    "picture": "节日图像生成",
+    "article": "文章生成工具",
+    "video": "视频工具(下载/生成)",
+    "hotspot": "AI热点研究",
+    "test": "测试工具",
+    "docs": "文档库"
+}
+
+DOCS_DIR = "docs"
+
+
+def get_file_info(file_path):
+    """获取文件信息"""
+    stat = file_path.stat()
+    modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+    size = stat.st_size
+    return modified, size
+
+
+class ToolCatalog:
+    """工具目录缓存
+
+    每个文件对应一条缓存条目，文件变化时只重建对应条目；
+    对外提供的工具列表（含使用频率排序）与其ETag一起缓存，直到下次失效。
+    """
+
+    def __init__(self, base_dir, tool_descriptions, details_getter, usage_getter, poll_interval=2.0):
+        """
+        Args:
+            base_dir: 项目根目录
+            tool_descriptions: 工具描述配置(TOOL_DESCRIPTIONS)
+            details_getter: 根据相对路径获取工具详情的函数
+            usage_getter: 返回 {工具相对路径: 使用次数} 的函数
+            poll_interval: 轮询模式下的扫描间隔(秒)
+        """
+        self.base_dir = Path(base_dir)
+        self.tool_descriptions = tool_descriptions
+        self.details_getter = details_getter
+        self.usage_getter = usage_getter
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        self._entries = {}     # 相对路径 -> 工具条目
+        self._stats = {}       # 相对路径 -> (mtime_ns, size)
+        self._dir_stats = {}   # 分类目录 -> mtime_ns (轮询模式用)
+        self._snapshot = None  # (tools, etag)
+        self._started = False
+        self._observer = None
+        self.watch_mode = None
+
+    # ========== 生命周期 ==========
+
+    def start(self):
+        """构建完整目录并启动文件监听（只执行一次）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._full_scan()
+
+        if not self._start_watchdog():
+            self.watch_mode = 'polling'
+            threading.Thread(target=self._poll_loop, daemon=True, name='tool-catalog-poll').start()
+
+    def stop(self):
+        """停止文件监听"""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    # ========== 对外接口 ==========
+
+    def snapshot(self):
+        """获取工具列表及其ETag
+
+        Returns:
+            (tools, etag): tools为 {分类名称: [工具条目]}，不应被调用方修改
+        """
+        self.start()
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._assemble()
+            return self._snapshot
+
+    def invalidate_usage(self):
+        """使用频率变化后调用，下次请求时重新排序"""
+        with self._lock:
+            self._snapshot = None
+
+    def refresh_paths(self, paths):
+        """增量刷新指定文件的条目
+
+        Args:
+            paths: 发生变化的文件绝对路径列表
+        """
+        changed = False
+        with self._lock:
+            for path in paths:
+                rel_path = self._tracked_rel_path(Path(path))
+                if rel_path and self._refresh_entry(rel_path):
+                    changed = True
+            if changed:
+                self._snapshot = None
+        return changed
+
+    # ========== 条目构建 ==========
+
+    def _tracked_rel_path(self, path):
+        """判断文件是否属于目录缓存的范围，返回相对路径"""
+        try:
+            rel_path = path.resolve().relative_to(self.base_dir.resolve())
+        except (ValueError, OSError):
+            return None
+        rel_str = str(rel_path).replace('\\', '/')
+
+        if rel_str in self._doc_paths():
+            return rel_str
+        parts = rel_path.parts
+        if len(parts) == 2 and parts[0] in CATEGORIES and parts[0] != DOCS_DIR and path.suffix == '.py':
+            return rel_str
+        return None
+
+    def _doc_paths(self):
+        """文档库中配置的文档路径 -> 文档key"""
+        docs = {}
+        for doc_key, doc_config in self.tool_descriptions.get(f"{DOCS_DIR}/", {}).items():
+            if isinstance(doc_config, dict) and doc_config.get('is_document'):
+                doc_category = doc_config.get('category', '')
+                docs[f"{doc_category}/{doc_key}"] = doc_key
+        return docs
+
+    def _full_scan(self):
+        """完整扫描所有分类目录"""
+        self._entries.clear()
+        self._stats.clear()
+        for cat_dir in CATEGORIES:
+            cat_path = self.base_dir / cat_dir
+            if cat_dir == DOCS_DIR or not cat_path.exists():
+                continue
+            self._dir_stats[cat_dir] = cat_path.stat().st_mtime_ns
+            for py_file in cat_path.glob("*.py"):
+                self._refresh_entry(f"{cat_dir}/{py_file.name}")
+        for doc_path in self._doc_paths():
+            self._refresh_entry(doc_path)
+        self._snapshot = None
+
+    def _refresh_entry(self, rel_path):
+        """重新检查单个文件，返回条目是否发生变化"""
+        file_path = self.base_dir / rel_path
+        try:
+            stat = file_path.stat()
+        except OSError:
+            stat = None
+
+        if stat is None:
+            if rel_path in self._entries:
+                del self._entries[rel_path]
+                self._stats.pop(rel_path, None)
+                return True
+            return False
+
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if self._stats.get(rel_path) == file_state and rel_path in self._entries:
+            return False
+
+        doc_key = self._doc_paths().get(rel_path)
+        if doc_key:
+            entry = self._build_doc_entry(doc_key, rel_path)
+        else:
+            entry = self._build_tool_entry(rel_path)
+        self._entries[rel_path] = entry
+        self._stats[rel_path] = file_state
+        return True
+
+    def _build_tool_entry(self, rel_path):
+        """构建Python工具条目"""
+        py_file = self.base_dir / rel_path
+        cat_dir, filename = rel_path.split('/', 1)
+        cat_name = CATEGORIES[cat_dir]
+        modified, size = get_file_info(py_file)
+
+        tool_config = self.tool_descriptions.get(f"{cat_dir}/", {}).get(filename)
+
+        # 处理新旧两种格式
+        if isinstance(tool_config, dict):
+            description = tool_config.get('description', f"{cat_name} - {filename}")
+            needs_input = tool_config.get('needs_input', False)
+            input_fields = tool_config.get('input_fields', [])
+            # 优先使用tool_config中的details，如果没有则从tool_details_config.py获取
+            details = tool_config.get('details')
+            if not details:
+                details = self.details_getter(rel_path)
+            readme_file = tool_config.get('readme_file')
+        else:
+            description = tool_config if tool_config else f"{cat_name} - {filename}"
+            needs_input = False
+            input_fields = []
+            details = self.details_getter(rel_path)
+            readme_file = None
+
+        return {
+            'category': cat_name,
+            'filename': rel_path,
+            'description': description,
+            'modified': modified,
+            'size': size,
+            'needs_input': needs_input,
+            'input_fields': input_fields,
+            'details': details,
+            'readme_file': readme_file,
+        }
+
+    def _build_doc_entry(self, doc_key, rel_path):
+        """构建文档库条目"""
+        doc_config = self.tool_descriptions[f"{DOCS_DIR}/"][doc_key]
+        modified, size = get_file_info(self.base_dir / rel_path)
+        return {
+            'category': CATEGORIES[DOCS_DIR],
+            'filename': f"{DOCS_DIR}/{doc_key}",
+            'description': doc_config.get('description', doc_key),
+            'modified': modified,
+            'size': size,
+            'needs_input': False,
+            'input_fields': [],
+            'details': doc_config.get('details'),
+            'readme_file': doc_config.get('readme_file'),
+            'is_document': True,
+            'document_path': rel_path
+        }
+
+    def _assemble(self):
+        """把缓存条目组装成按分类、按使用频率排序的工具列表"""
+        frequency_data = self.usage_getter() or {}
+        grouped = {cat_name: [] for cat_name in CATEGORIES.values()}
+
+        for entry in self._entries.values():
+            tool = {k: v for k, v in entry.items() if k != 'category'}
+            if entry.get('is_document'):
+                tool['usage_count'] = 0
+            else:
+                tool['usage_count'] = frequency_data.get(entry['filename'], 0)
+            grouped[entry['category']].append(tool)
+
+        # 与原逻辑一致：项目下没有docs目录时不显示文档库
+        if not (self.base_dir / DOCS_DIR).exists():
+            grouped[CATEGORIES[DOCS_DIR]] = []
+
+        tools = {}
+        for cat_name, tools_list in grouped.items():
+            if not tools_list:
+                continue
+            if cat_name != CATEGORIES[DOCS_DIR]:
+                # 按使用频率排序（高频在前），频率相同的按文件名排序
+                tools_list.sort(key=lambda x: (-x['usage_count'], x['filename']))
+            else:
+                order = list(self._doc_paths())
+                tools_list.sort(key=lambda x: order.index(x['document_path']))
+            tools[cat_name] = tools_list
+
+        payload = json.dumps(tools, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        etag = hashlib.sha1(payload).hexdigest()
+        return tools, etag
+
+    # ========== 文件监听 ==========
+
+    def _start_watchdog(self):
+        """使用watchdog监听分类目录，返回是否启动成功"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return False
+
+        catalog = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                paths = [event.src_path]
+                if getattr(event, 'dest_path', None):
+                    paths.append(event.dest_path)
+                catalog.refresh_paths(paths)
+
+        watch_dirs = {self.base_dir / cat_dir for cat_dir in CATEGORIES if cat_dir != DOCS_DIR}
+        watch_dirs.update((self.base_dir / doc_path).parent for doc_path in self._doc_paths())
+
+        try:
+            observer = Observer()
+            handler = _Handler()
+            for watch_dir in watch_dirs:
+                if watch_dir.exists():
+                    observer.schedule(handler, str(watch_dir), recursive=False)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            print(f"[目录缓存] 文件监听启动失败，改用轮询: {e}")
+            return False
+
+        self._observer = observer
+        self.watch_mode = 'watchdog'
+        return True
+
+    def _poll_loop(self):
+        """轮询模式：定期比较目录和文件的mtime"""
+        stop = threading.Event()
+        while not stop.wait(self.poll_interval):
+            try:
+                self._poll_once()
+            except Exception as e:
+                print(f"[目录缓存] 轮询失败: {e}")
+
+    def _poll_once(self):
+        """检查一轮变化：目录mtime变化时重新列目录，已知文件逐个比较mtime"""
+        changed_paths = []
+        for cat_dir in CATEGORIES:
+            cat_path = self.base_dir / cat_dir
+            if cat_dir == DOCS_DIR or not cat_path.exists():
+                continue
+            dir_mtime = cat_path.stat().st_mtime_ns
+            if self._dir_stats.get(cat_dir) != dir_mtime:
+                self._dir_stats[cat_dir] = dir_mtime
+                changed_paths.extend(cat_path.glob("*.py"))
+
+        with self._lock:
+            known = list(self._stats.keys())
+        changed_paths.extend(self.base_dir / rel_path for rel_path in known)
+        changed_paths.extend(self.base_dir / doc_path for doc_path in self._doc_paths())
+        self.refresh_paths(changed_paths)
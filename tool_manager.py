@@ -9,43 +9,48 @@ import os
 import subprocess
 import time
 import json
+import hashlib
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory, make_response
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, make_response
 from datetime import datetime
 import tempfile
 
 # 导入工具详细配置
 from tool_details_config import get_tool_details
+from tool_catalog import ToolCatalog
+from usage_ledger import UsageLedger
+from process_output import ProcessOutput
+from job_scheduler import JobScheduler, infer_providers
+from worker_pool import WorkerPool
+from service_probe import PORT_ENV_VAR, allocate_port, wait_until_ready
+from run_manifest import RUN_DIR_ENV_VAR, MANIFEST_ENV_VAR, MANIFEST_FILENAME, ManifestReader
+from generate_tool_docs import ToolDocIndex
+from resource_monitor import ResourceMonitor, reap_process
+from provider_health import get_provider_health
 
 app = Flask(__name__)
 
-# 使用频率记录文件路径
+# 旧版使用频率文件（仅用于首次导入）和使用记录数据库
 USAGE_FREQUENCY_FILE = Path(__file__).parent / 'tool_usage_frequency.json'
+USAGE_LEDGER_DB = Path(__file__).parent / 'tool_usage.db'
 
-def load_usage_frequency():
-    """加载使用频率数据"""
-    if USAGE_FREQUENCY_FILE.exists():
-        try:
-            with open(USAGE_FREQUENCY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+usage_ledger = UsageLedger(USAGE_LEDGER_DB, legacy_json=USAGE_FREQUENCY_FILE)
 
-def save_usage_frequency(frequency_data):
-    """保存使用频率数据"""
-    with open(USAGE_FREQUENCY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(frequency_data, f, ensure_ascii=False, indent=2)
+def load_usage_frequency():
+    """加载使用频率数据（内存汇总，不读磁盘）"""
+    return usage_ledger.counts()
 
 def record_tool_usage(tool_filename):
-    """记录工具使用（增加使用计数）"""
-    frequency_data = load_usage_frequency()
-    if tool_filename in frequency_data:
-        frequency_data[tool_filename] += 1
-    else:
-        frequency_data[tool_filename] = 1
-    save_usage_frequency(frequency_data)
-    return frequency_data.get(tool_filename, 0)
+    """记录工具启动，返回运行记录ID"""
+    run_id = usage_ledger.record_start(tool_filename)
+    tool_catalog.invalidate_usage()
+    return run_id
+
+def record_tool_finish(proc_info, return_code, metrics=None):
+    """记录工具结束（同一进程只记录一次，资源统计可以之后补充）"""
+    run_id = proc_info.get('run_id')
+    if run_id is not None:
+        usage_ledger.record_finish(run_id, return_code, metrics=metrics)
 
 # 禁用模板缓存
 app.config['TEMPLATES_AUTO_RELOAD'] = True
@@ -53,7 +58,11 @@ app.config['TEMPLATES_AUTO_RELOAD'] = True
 # 添加请求后钩子，禁用浏览器缓存
 @app.after_request
 def add_no_cache_headers(response):
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    if response.headers.get('ETag'):
+        # 带ETag的响应允许浏览器缓存，但每次都要带If-None-Match重新验证
+        response.headers['Cache-Control'] = 'no-cache, must-revalidate, max-age=0'
+    else:
+        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
@@ -61,6 +70,176 @@ def add_no_cache_headers(response):
 # 全局变量存储运行中的进程
 running_processes = {}
 
+# 进程输出与历史记录
+RUN_LOG_DIR = Path(__file__).parent / 'logs'
+RUN_HISTORY_FILE = RUN_LOG_DIR / 'run_history.jsonl'
+OUTPUT_MAX_LINES = 2000                                           # 每个进程在内存中保留的输出行数
+OUTPUT_SPILL_ENABLED = os.environ.get('TOOL_OUTPUT_SPILL') == '1'  # 是否同时写入轮转日志文件
+FINISHED_PROCESS_TTL = 3600                                       # 已结束进程保留时间(秒)
+FINISHED_PROCESS_MAX = 50                                         # 最多保留的已结束进程数
+
+def new_process_output(process_id):
+    """创建进程输出缓冲区"""
+    spill_path = RUN_LOG_DIR / 'runs' / f'{process_id}.log' if OUTPUT_SPILL_ENABLED else None
+    return ProcessOutput(max_lines=OUTPUT_MAX_LINES, spill_path=spill_path)
+
+def save_run_summary(process_id, proc_info):
+    """把已结束进程的摘要追加到历史记录文件"""
+    log = proc_info['log']
+    summary = {
+        'process_id': process_id,
+        'filename': proc_info['filename'],
+        'status': proc_info['status'],
+        'returncode': proc_info['process'].poll() if proc_info['process'] else None,
+        'start_time': proc_info['start_time'],
+        'end_time': proc_info.get('end_time'),
+        'output_tail': log.tail(50),
+        'log_file': log.spill_path,
+        'metrics': proc_info.get('metrics'),
+        'manifest': proc_info['manifest'].read() if proc_info.get('manifest') else None
+    }
+    RUN_LOG_DIR.mkdir(exist_ok=True)
+    with open(RUN_HISTORY_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+
+def prune_running_processes():
+    """淘汰已结束的进程：超过保留时间或超过保留数量的，保存摘要后从内存移除"""
+    now = time.time()
+    finished = []
+    for process_id, proc_info in list(running_processes.items()):
+        if proc_info['process'] is None:
+            # 排队中；已取消或启动失败的排队任务按结束时间淘汰
+            if proc_info['status'] in ('stopped', 'failed'):
+                finished.append((proc_info['end_time'], process_id))
+            continue
+        return_code = proc_info['process'].poll()
+        if return_code is None:
+            continue
+        if proc_info.get('end_time') is None:
+            # 第一次发现进程已结束（可能从未被轮询过）
+            proc_info['end_time'] = now
+            if proc_info['status'] == 'running':
+                proc_info['status'] = 'completed' if return_code == 0 else 'failed'
+            record_tool_finish(proc_info, return_code)
+        finished.append((proc_info['end_time'], process_id))
+
+    finished.sort(reverse=True)
+    for index, (end_time, process_id) in enumerate(finished):
+        if index >= FINISHED_PROCESS_MAX or now - end_time > FINISHED_PROCESS_TTL:
+            proc_info = running_processes.pop(process_id, None)
+            if proc_info is None:
+                continue
+            try:
+                save_run_summary(process_id, proc_info)
+            except Exception as e:
+                print(f"[运行记录] 保存摘要失败: {e}")
+            tool_scheduler.forget(process_id)
+
+# 工具启动调度（限制同时运行的工具数量，超出的排队）
+MAX_RUNNING_TOOLS = int(os.environ.get('TOOL_MAX_RUNNING', '4'))
+CATEGORY_LIMITS = {'picture': 2, 'article': 2, 'bird': 2, 'video': 1}
+PROVIDER_LIMITS = {'volcano': 1, 'antigravity': 2, 'zhipu': 3, 'pollinations': 2}
+
+def get_tool_providers(filename, tool_info):
+    """从工具配置推断使用的API提供方（配置中的providers字段优先）"""
+    if isinstance(tool_info, dict):
+        if tool_info.get('providers'):
+            return list(tool_info['providers'])
+        description = tool_info.get('description', '')
+    else:
+        description = tool_info or ''
+    details = get_tool_details(filename)
+    return infer_providers(description, json.dumps(details, ensure_ascii=False) if details else '')
+
+def start_tool_process(spec):
+    """启动工具子进程：python脚本交给预热进程池，其他命令直接启动"""
+    cmd = spec['cmd']
+    if tool_worker_pool is not None and cmd[0] == 'python' and len(cmd) >= 2:
+        stdin_data = None
+        if spec.get('stdin_path'):
+            with open(spec['stdin_path'], 'r', encoding='utf-8') as f:
+                stdin_data = f.read()
+        return tool_worker_pool.run(cmd[1], cmd[2:], env=spec['env'], cwd=BASE_DIR, stdin_data=stdin_data)
+
+    stdin_file = open(spec['stdin_path'], 'r', encoding='utf-8') if spec.get('stdin_path') else None
+    try:
+        return subprocess.Popen(
+            cmd,
+            stdin=stdin_file,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=BASE_DIR,
+            env=spec['env']
+        )
+    finally:
+        if stdin_file is not None:
+            stdin_file.close()
+
+def launch_tool_process(job):
+    """调度器启动任务时调用：创建子进程并开始读取输出"""
+    proc_info = running_processes[job.id]
+    try:
+        process = start_tool_process(job.spec)
+    except Exception as e:
+        # 排队后由调度器启动时没有请求可以返回错误，记在输出中供状态查询显示
+        proc_info['status'] = 'failed'
+        proc_info['end_time'] = time.time()
+        proc_info['log'].append(f"[ERROR] 启动失败: {e}")
+        raise
+
+    proc_info['process'] = process
+    proc_info['start_time'] = time.time()
+    proc_info['status'] = 'running'
+    proc_info['run_id'] = record_tool_usage(proc_info['filename'])
+    resource_monitor.track(job.id, process)
+    proc_info['log'].attach(process, on_exit=lambda process: on_tool_exit(job.id, process))
+
+def on_tool_exit(process_id, process):
+    """工具输出读完后调用：回收进程、记录资源统计并释放调度名额"""
+    try:
+        return_code, rusage = reap_process(process)
+        metrics = resource_monitor.finish(process_id, rusage)
+        proc_info = running_processes.get(process_id)
+        if proc_info is not None:
+            proc_info['metrics'] = metrics
+            record_tool_finish(proc_info, return_code, metrics)
+    finally:
+        tool_scheduler.finish(process_id)
+
+# 子进程资源采样（CPU时间、峰值内存、磁盘读写）
+resource_monitor = ResourceMonitor(interval=1.0)
+
+# Web服务类工具
+WEB_SERVICE_READY_TIMEOUT = 30  # 等待服务就绪的最长时间(秒)
+
+def find_running_service(filename):
+    """查找同一Web服务工具仍在运行的实例，返回 (process_id, proc_info)"""
+    for process_id, proc_info in running_processes.items():
+        process = proc_info['process']
+        if proc_info['filename'] == filename and proc_info.get('url') and process is not None and process.poll() is None:
+            return process_id, proc_info
+    return None, None
+
+# 预热的Python解释器池（TOOL_WORKER_POOL=0 关闭，每次启动全新解释器）
+WORKER_POOL_SIZE = int(os.environ.get('TOOL_WORKER_POOL', '2'))
+
+def worker_pool_env():
+    """工作进程的启动环境：与工具运行环境一致，包含项目根目录"""
+    env = os.environ.copy()
+    env['PYTHONPATH'] = str(Path(__file__).parent) + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+tool_worker_pool = WorkerPool(
+    size=WORKER_POOL_SIZE, cwd=Path(__file__).parent, env=worker_pool_env()
+) if WORKER_POOL_SIZE > 0 else None
+
+tool_scheduler = JobScheduler(
+    launch_tool_process,
+    max_running=MAX_RUNNING_TOOLS,
+    category_limits=CATEGORY_LIMITS,
+    provider_limits=PROVIDER_LIMITS
+)
+
 BASE_DIR = Path(__file__).parent
 
 # 工具描述配置
@@ -84,7 +263,8 @@ TOOL_DESCRIPTIONS = {
             "description": "🎨 AI图像生成器 V9.1 (主题/参考图片+7种画图风格)⭐⭐⭐",
             "is_web_service": True,
             "port": 5009,
-            "url": "http://localhost:5009"
+            "url": "http://localhost:5009",
+            "health_path": "/health"
         },
         "generate_festival_images.py": "生成器 - 节日主题图像生成器 (支持自定义主题,使用DALL-E3+Flux+Seedream对比)",
         "advanced_watermark_remover.py": "工具 - 高级去水印 (NS高质量算法,油猴脚本智能检测,推荐使用)⭐⭐",
@@ -94,7 +274,8 @@ TOOL_DESCRIPTIONS = {
             "description": "📝 今日头条文章生成器 Web版 (独立Web应用，支持主题生成+草稿完善+智能配图)⭐⭐⭐",
             "is_web_service": True,
             "port": 5010,
-            "url": "http://localhost:5010"
+            "url": "http://localhost:5010",
+            "health_path": "/health"
         },
         "toutiao_article_generator.py": {
             "description": "生成器 - 今日头条文章生成器 v3.1 (命令行版)",
@@ -187,138 +368,36 @@ TOOL_DESCRIPTIONS = {
     }
 }
 
-def get_file_info(file_path):
-    """获取文件信息"""
-    stat = file_path.stat()
-    modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-    size = stat.st_size
-    return modified, size
+# 工具目录缓存（启动时构建一次，文件变化时增量更新）
+tool_catalog = ToolCatalog(BASE_DIR, TOOL_DESCRIPTIONS, get_tool_details, load_usage_frequency)
+
+# 工具文档索引（结果常驻内存，更新时只重新分析变化的文件）
+# 在服务进程内直接分析：进程池的子进程会重新导入本模块，重复执行上面的初始化
+tool_doc_index = ToolDocIndex(BASE_DIR, max_workers=0)
 
 def get_all_tools():
     """获取所有分类的工具（按使用频率排序）"""
-    tools = {}
-
-    # 加载使用频率数据
-    frequency_data = load_usage_frequency()
-
-    # 定义工具分类
-    categories = {
-        "bird": "鸟类绘画工具",
-        "picture": "节日图像生成",
-        "article": "文章生成工具",
-        "video": "视频工具(下载/生成)",
-        "hotspot": "AI热点研究",
-        "test": "测试工具",
-        "docs": "文档库"
-    }
-
-    for cat_dir, cat_name in categories.items():
-        cat_path = BASE_DIR / cat_dir
-        if not cat_path.exists():
-            continue
-
-        tools_list = []
-
-        # 处理docs目录（文档库）- 特殊处理HTML文件
-        if cat_dir == "docs":
-            for doc_key, doc_config in TOOL_DESCRIPTIONS.get("docs/", {}).items():
-                if isinstance(doc_config, dict) and doc_config.get('is_document'):
-                    doc_category = doc_config.get('category', '')
-                    doc_path = BASE_DIR / doc_category / doc_key
-                    if doc_path.exists():
-                        stat = doc_path.stat()
-                        modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-                        size = stat.st_size
-                        tools_list.append({
-                            'filename': f"docs/{doc_key}",
-                            'description': doc_config.get('description', doc_key),
-                            'modified': modified,
-                            'size': size,
-                            'needs_input': False,
-                            'input_fields': [],
-                            'details': doc_config.get('details'),
-                            'readme_file': doc_config.get('readme_file'),
-                            'usage_count': 0,
-                            'is_document': True,
-                            'document_path': f"{doc_category}/{doc_key}"
-                        })
-            if tools_list:
-                tools[cat_name] = tools_list
-            continue
-
-        # 只查找Python文件,不包含HTML文件
-        for py_file in sorted(cat_path.glob("*.py")):
-            modified, size = get_file_info(py_file)
-
-            # 获取工具描述
-            rel_path = py_file.relative_to(BASE_DIR)
-            sub_dir = str(rel_path.parent).replace('\\', '/') + '/'
-            filename = py_file.name
-            tool_rel_path = str(rel_path).replace('\\', '/')
-
-            tool_config = TOOL_DESCRIPTIONS.get(sub_dir, {}).get(filename)
-
-            # 处理新旧两种格式
-            if isinstance(tool_config, dict):
-                description = tool_config.get('description', f"{cat_name} - {filename}")
-                needs_input = tool_config.get('needs_input', False)
-                input_fields = tool_config.get('input_fields', [])
-                # 优先使用tool_config中的details，如果没有则从tool_details_config.py获取
-                details = tool_config.get('details')
-                if not details:
-                    details = get_tool_details(str(rel_path))
-                # 获取readme_file配置
-                readme_file = tool_config.get('readme_file')
-            else:
-                description = tool_config if tool_config else f"{cat_name} - {filename}"
-                needs_input = False
-                input_fields = []
-                # 从tool_details_config.py获取详情
-                details = get_tool_details(str(rel_path))
-                readme_file = None
-
-            # 获取使用频率
-            usage_count = frequency_data.get(tool_rel_path, 0)
-
-            tools_list.append({
-                'filename': tool_rel_path,
-                'description': description,
-                'modified': modified,
-                'size': size,
-                'needs_input': needs_input,
-                'input_fields': input_fields,
-                'details': details,  # 添加详细说明
-                'readme_file': readme_file,  # 添加readme文件路径
-                'usage_count': usage_count  # 添加使用频率
-            })
-
-        # 按使用频率排序（高频在前），频率相同的按文件名排序
-        tools_list.sort(key=lambda x: (-x['usage_count'], x['filename']))
-
-        if tools_list:
-            tools[cat_name] = tools_list
-
-    # 确保文档库排在最后
-    docs_category = "文档库"
-    if docs_category in tools:
-        docs_data = tools.pop(docs_category)
-        # 使用OrderedDict确保顺序
-        from collections import OrderedDict
-        ordered_tools = OrderedDict()
-        for k, v in tools.items():
-            ordered_tools[k] = v
-        ordered_tools[docs_category] = docs_data
-        return dict(ordered_tools)
-
+    tools, _ = tool_catalog.snapshot()
     return tools
 
+# 已渲染的主页缓存: ((目录ETag, 模板mtime), html)
+_index_cache = {'key': None, 'html': None}
+
 @app.route('/')
 def index():
     """主页面"""
-    tools = get_all_tools()
-    return render_template('tool_manager.html', tools=tools, running_processes=running_processes)
-
-@app.route('/view/article/<filename>')
+    tools, etag = tool_catalog.snapshot()
+    template_path = BASE_DIR / 'templates' / 'tool_manager.html'
+    cache_key = (etag, template_path.stat().st_mtime_ns)
+    if _index_cache['key'] != cache_key:
+        _index_cache['html'] = render_template('tool_manager.html', tools=tools, running_processes=running_processes)
+        _index_cache['key'] = cache_key
+
+    response = make_response(_index_cache['html'])
+    response.set_etag(hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest())
+    return response.make_conditional(request)
+
+@app.route('/view/article/<path:filename>')
 def view_article(filename):
     """查看生成的文章HTML文件"""
     article_dir = BASE_DIR / 'article'
@@ -470,52 +549,38 @@ def api_document_info():
 @app.route('/api/tools')
 def api_tools():
     """API: 获取所有工具列表"""
-    tools = get_all_tools()
-    return jsonify({'success': True, 'tools': tools})
+    tools, etag = tool_catalog.snapshot()
+    response = jsonify({'success': True, 'tools': tools})
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 @app.route('/api/documentation')
 def api_documentation():
-    """API: 获取工具文档"""
-    doc_file = BASE_DIR / 'tool_documentation.json'
-    if doc_file.exists():
-        import json
-        with open(doc_file, 'r', encoding='utf-8') as f:
-            return jsonify({'success': True, 'documentation': json.load(f)})
-    return jsonify({'success': False, 'error': '文档文件不存在'})
+    """API: 获取工具文档（内存中的文档索引）"""
+    try:
+        documentation, etag = tool_doc_index.documentation()
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'文档加载失败: {str(e)}'})
+    if documentation is None:
+        return jsonify({'success': False, 'error': '文档文件不存在'})
+    response = jsonify({'success': True, 'documentation': documentation})
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 @app.route('/api/update-documentation', methods=['POST'])
 def api_update_documentation():
-    """API: 重新生成工具文档"""
+    """API: 重新生成工具文档（只重新分析发生变化的文件）"""
     try:
-        import subprocess
-        import sys
-
-        # 运行文档生成脚本
-        script_path = BASE_DIR / 'generate_tool_docs.py'
-        if not script_path.exists():
-            return jsonify({'success': False, 'error': '文档生成脚本不存在'})
-
-        result = subprocess.run(
-            [sys.executable, str(script_path)],
-            capture_output=True,
-            text=True,
-            cwd=BASE_DIR,
-            encoding='utf-8',
-            errors='ignore'
-        )
-
-        if result.returncode == 0:
-            return jsonify({
-                'success': True,
-                'message': '文档已成功更新',
-                'output': result.stdout
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': f'文档生成失败: {result.stderr}'
-            })
-
+        start_time = time.time()
+        stats = tool_doc_index.refresh()
+        elapsed = time.time() - start_time
+        return jsonify({
+            'success': True,
+            'message': '文档已成功更新',
+            'output': f"共 {stats['tools']} 个工具，重新分析 {stats['analyzed']} 个，"
+                      f"使用缓存 {stats['cached']} 个，耗时 {elapsed:.2f} 秒",
+            'stats': stats
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': f'更新失败: {str(e)}'})
 
@@ -533,12 +598,17 @@ def api_run():
     if not tool_path.exists():
         return jsonify({'success': False, 'error': f'工具不存在: {filename}'})
 
-    # 记录工具使用
-    record_tool_usage(filename)
+    # 清理已结束的旧进程
+    prune_running_processes()
 
     # 生成唯一的进程ID（将文件名中的斜杠替换为下划线，避免URL路由问题）
     safe_filename = filename.replace('/', '_').replace('\\', '_')
     process_id = f"{safe_filename}_{int(time.time())}"
+    suffix = 1
+    while process_id in running_processes:
+        # 同一秒内重复启动同一工具
+        suffix += 1
+        process_id = f"{safe_filename}_{int(time.time())}_{suffix}"
 
     try:
         if tool_path.suffix == '.py':
@@ -553,6 +623,7 @@ def api_run():
             # 设置UTF-8编码，避免中文乱码
             env['PYTHONIOENCODING'] = 'utf-8'
             env['PYTHONUTF8'] = '1'
+            stdin_path = None
 
             # Web服务类型工具 - 后台启动并自动打开浏览器
             tool_config = TOOL_DESCRIPTIONS.get(filename.replace('picture/', 'picture/').replace('article/', 'article/').replace('video/', 'video/').replace('bird/', 'bird/').replace('hotspot/', 'hotspot/').replace('test/', 'test/'), None)
@@ -567,44 +638,85 @@ def api_run():
                         break
 
             if tool_info and isinstance(tool_info, dict) and tool_info.get('is_web_service'):
-                # Web服务类型工具
-                port = tool_info.get('port', 5000)
-                url = tool_info.get('url', f'http://localhost:{port}')
-
-                # 后台启动服务
-                process = subprocess.Popen(
-                    ['python', str(tool_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=BASE_DIR,
-                    env=env
-                )
-
-                # 延迟打开浏览器（等待服务启动）
-                import threading
+                # Web服务类型工具 - 已有实例在运行时直接复用
                 import webbrowser
 
-                def open_browser():
-                    time.sleep(2)  # 等待2秒让服务启动
-                    webbrowser.open(url)
-
-                threading.Thread(target=open_browser, daemon=True).start()
+                existing_id, existing = find_running_service(filename)
+                if existing is not None:
+                    webbrowser.open(existing['url'])
+                    return jsonify({
+                        'success': True,
+                        'message': f'Web服务已在运行，正在打开浏览器: {existing["url"]}',
+                        'process_id': existing_id,
+                        'filename': filename,
+                        'url': existing['url'],
+                        'reused': True,
+                        'time_to_ready': existing.get('time_to_ready')
+                    })
 
-                running_processes[process_id] = {
+                # 分配端口（配置的端口被占用时改用空闲端口），通过环境变量传给服务
+                configured_port = tool_info.get('port')
+                port = allocate_port(configured_port)
+                if port == configured_port and tool_info.get('url'):
+                    url = tool_info['url']
+                else:
+                    url = f'http://localhost:{port}'
+                env[PORT_ENV_VAR] = str(port)
+
+                # 后台启动服务（常驻服务不占用调度名额，直接启动）
+                run_id = record_tool_usage(filename)
+                process = start_tool_process({'cmd': ['python', str(tool_path)], 'env': env})
+
+                log = new_process_output(process_id)
+                log.append(f'Web服务启动中: {url}')
+                resource_monitor.track(process_id, process)
+                log.attach(process, on_exit=lambda process: on_tool_exit(process_id, process))
+                proc_info = {
                     'process': process,
                     'filename': filename,
                     'start_time': time.time(),
-                    'output': f'Web服务已启动: {url}\n请在浏览器中使用...',
+                    'log': log,
                     'status': 'running',
-                    'tool_path': tool_path
+                    'tool_path': tool_path,
+                    'run_id': run_id,
+                    'url': url,
+                    'port': port
                 }
+                running_processes[process_id] = proc_info
+
+                # 轮询健康检查地址直到服务就绪，再打开浏览器
+                health_url = url.rstrip('/') + tool_info.get('health_path', '/')
+                time_to_ready = wait_until_ready(health_url, process, timeout=WEB_SERVICE_READY_TIMEOUT)
+                if time_to_ready is None:
+                    if process.poll() is not None:
+                        log.wait_closed(timeout=2)
+                        return jsonify({
+                            'success': False,
+                            'error': f'Web服务启动失败 (退出码 {process.poll()})',
+                            'process_id': process_id,
+                            'output': log.tail(30)
+                        })
+                    log.append(f'Web服务在{WEB_SERVICE_READY_TIMEOUT}秒内未就绪，请稍后手动打开: {url}')
+                    return jsonify({
+                        'success': True,
+                        'message': f'Web服务已启动但尚未就绪: {url}',
+                        'process_id': process_id,
+                        'filename': filename,
+                        'url': url,
+                        'time_to_ready': None
+                    })
+
+                proc_info['time_to_ready'] = round(time_to_ready, 2)
+                log.append(f'Web服务已就绪 (耗时{proc_info["time_to_ready"]}秒): {url}\n请在浏览器中使用...')
+                webbrowser.open(url)
 
                 return jsonify({
                     'success': True,
-                    'message': f'Web服务已启动，正在打开浏览器: {url}',
+                    'message': f'Web服务已就绪 (耗时{proc_info["time_to_ready"]}秒)，正在打开浏览器: {url}',
                     'process_id': process_id,
                     'filename': filename,
-                    'url': url
+                    'url': url,
+                    'time_to_ready': proc_info['time_to_ready']
                 })
 
             # 今日头条文章生成器 - 支持模式选择、主题/草稿、字数、配图参数
@@ -671,13 +783,7 @@ def api_run():
                 print(f"[DEBUG] ARTICLE_PARAMS_JSON: {env.get('ARTICLE_PARAMS_JSON')}")
                 print(f"[DEBUG] ====================================\\n")
 
-                process = subprocess.Popen(
-                    ['python', str(tool_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=BASE_DIR,
-                    env=env
-                )
+                launch_cmd = ['python', str(tool_path)]
             # 百度视频下载器 - 支持URL和输出文件名参数
             elif filename == 'video/baidu_video_downloader.py':
                 params = data.get('params', {})
@@ -716,13 +822,7 @@ def api_run():
                 env['ARTICLE_IMAGES'] = generate_images
                 env['ARTICLE_IMAGE_STYLE'] = image_style
 
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=BASE_DIR,
-                    env=env
-                )
+                launch_cmd = cmd
             # 视频生成对比工具 - 支持提示词参数
             elif filename == 'video/video_generation_comparison.py':
                 params = data.get('params', {})
@@ -756,13 +856,7 @@ def api_run():
                 env['ARTICLE_IMAGES'] = generate_images
                 env['ARTICLE_IMAGE_STYLE'] = image_style
 
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=BASE_DIR,
-                    env=env
-                )
+                launch_cmd = cmd
             # 节日图像生成器 - 支持主题参数
             elif filename == 'picture/generate_festival_images.py':
                 theme = data.get('params', {}).get('theme', '')
@@ -772,34 +866,17 @@ def api_run():
                         f.write(theme + '\n')
                         temp_file = f.name
 
-                    process = subprocess.Popen(
-                        ['python', str(tool_path)],
-                        stdin=open(temp_file, 'r', encoding='utf-8'),
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        cwd=BASE_DIR,
-                        env=env
-                    )
+                    launch_cmd = ['python', str(tool_path)]
+                    stdin_path = temp_file
                 else:
-                    process = subprocess.Popen(
-                        ['python', str(tool_path)],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        cwd=BASE_DIR,
-                        env=env
-                    )
+                    launch_cmd = ['python', str(tool_path)]
             else:
-                process = subprocess.Popen(
-                    ['python', str(tool_path)],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=BASE_DIR,
-                    env=env
-                )
+                launch_cmd = ['python', str(tool_path)]
         elif tool_path.suffix == '.html':
             # HTML文件 - 在浏览器中打开
             import webbrowser
             webbrowser.open(f'file://{tool_path.absolute()}')
+            usage_ledger.record_finish(record_tool_usage(filename), 0)
             return jsonify({
                 'success': True,
                 'message': f'已在浏览器中打开: {tool_path.name}',
@@ -809,25 +886,81 @@ def api_run():
         else:
             return jsonify({'success': False, 'error': f'不支持的文件类型: {tool_path.suffix}'})
 
+        # 每次运行一个运行目录，工具在其中写入运行清单
+        run_dir = RUN_LOG_DIR / 'runs' / process_id
+        env[RUN_DIR_ENV_VAR] = str(run_dir)
+        env[MANIFEST_ENV_VAR] = str(run_dir / MANIFEST_FILENAME)
+
+        # 交给调度器：有空闲名额时立即启动，否则排队
         running_processes[process_id] = {
-            'process': process,
+            'process': None,
             'filename': filename,
-            'start_time': time.time(),
-            'output': '',
-            'status': 'running',
-            'tool_path': tool_path  # 保存工具路径用于文件检查
+            'submit_time': time.time(),
+            'start_time': None,
+            'log': new_process_output(process_id),
+            'status': 'queued',
+            'tool_path': tool_path,
+            'manifest': ManifestReader(run_dir / MANIFEST_FILENAME)
         }
+        job = tool_scheduler.submit(
+            process_id,
+            {'cmd': launch_cmd, 'env': env, 'stdin_path': stdin_path},
+            category=filename.split('/')[0],
+            providers=get_tool_providers(filename, tool_info),
+            priority=int(data.get('priority', 0))
+        )
+        if job.error:
+            running_processes.pop(process_id, None)
+            tool_scheduler.forget(process_id)
+            return jsonify({'success': False, 'error': job.error})
 
         return jsonify({
             'success': True,
-            'message': f'工具已启动: {filename}',
+            'message': f'工具已启动: {filename}' if job.state == 'running' else f'工具已加入队列: {filename}',
             'process_id': process_id,
-            'filename': filename
+            'filename': filename,
+            'status': running_processes[process_id]['status'],
+            'queue_position': tool_scheduler.queue_position(process_id)
         })
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+def report_article_html(proc_info, html_item):
+    """把清单中登记的HTML文件写入输出并在浏览器中打开（每次运行只处理一次）"""
+    if proc_info.get('html_reported'):
+        return
+    proc_info['html_reported'] = True
+
+    log = proc_info['log']
+    html_path = html_item['path']
+    html_url = f'file:///{html_path.replace(chr(92), "/")}'
+    if f"[OUTPUT] HTML: {html_item['name']}" not in log.text():
+        log.append(f"[OUTPUT] HTML: {html_item['name']}")
+    log.append(f'[文章链接] {html_url}')
+
+    # 自动用Chrome打开生成的HTML文件
+    try:
+        chrome_paths = [
+            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+        ]
+        chrome_exe = None
+        for cp in chrome_paths:
+            if os.path.exists(cp):
+                chrome_exe = cp
+                break
+
+        if chrome_exe:
+            subprocess.Popen([chrome_exe, html_path], shell=False)
+            log.append('[浏览器] 已在Chrome中打开HTML文件')
+        else:
+            # 如果找不到Chrome，使用默认浏览器
+            os.startfile(html_path)
+            log.append('[浏览器] 已在默认浏览器中打开HTML文件')
+    except Exception as e:
+        log.append(f"[提示] HTML文件: {html_item['name']}")
+
 @app.route('/api/status/<process_id>')
 def api_status(process_id):
     """API: 获取运行状态"""
@@ -839,142 +972,62 @@ def api_status(process_id):
 
     proc_info = running_processes[process_id]
     process = proc_info['process']
+    job = tool_scheduler.get(process_id)
+
+    if process is None:
+        # 尚未启动 - 排队中、排队时被取消或启动失败
+        if proc_info['status'] == 'queued':
+            output = '排队中，等待空闲名额...'
+        elif proc_info['status'] == 'failed':
+            output = f"启动失败: {job.error if job and job.error else '未知错误'}"
+        else:
+            output = '已取消排队'
+        return jsonify({
+            'success': True,
+            'filename': proc_info['filename'],
+            'status': proc_info['status'],
+            'elapsed_time': 0,
+            'output': output,
+            'error': job.error if job else None,
+            'returncode': None,
+            'queue_position': tool_scheduler.queue_position(process_id),
+            'job': job.to_dict() if job else None,
+            'scheduler': tool_scheduler.summary()
+        })
 
     # 检查进程状态
     return_code = process.poll()
 
-    if return_code is None:
-        # 进程仍在运行
-        # Windows下尝试非阻塞读取
-        try:
-            # 使用线程超时方式读取
-            import threading
-            output_data = {'stdout': '', 'stderr': ''}
-
-            def read_stdout():
-                try:
-                    output_data['stdout'] = process.stdout.read()
-                except:
-                    pass
-
-            def read_stderr():
-                try:
-                    output_data['stderr'] = process.stderr.read()
-                except:
-                    pass
-
-            t1 = threading.Thread(target=read_stdout)
-            t2 = threading.Thread(target=read_stderr)
-            t1.start()
-            t2.start()
-            t1.join(timeout=0.1)
-            t2.join(timeout=0.1)
-
-            if output_data['stdout']:
-                proc_info['output'] += output_data['stdout'].decode('utf-8', errors='ignore')
-            if output_data['stderr']:
-                proc_info['output'] += '\n[stderr] ' + output_data['stderr'].decode('utf-8', errors='ignore')
-        except:
-            pass
+    log = proc_info['log']
+    # 工具写入的运行清单（只stat这一个文件，未变化时使用缓存）
+    manifest_reader = proc_info.get('manifest')
+    manifest = manifest_reader.read() if manifest_reader else None
 
+    if return_code is None:
+        # 进程仍在运行 - 输出由读取线程写入缓冲区，这里只读取
         elapsed_time = time.time() - proc_info['start_time']
 
-        # 对于头条文章生成器,检查是否生成了HTML文件
-        tool_path = proc_info.get('tool_path')
-        if tool_path and 'toutiao_article_generator' in str(tool_path):
-            # 检查article目录下最近生成的HTML文件 (支持多种命名模式)
-            article_dir = tool_path.parent
-            # 支持新的文件名模式
-            html_patterns = ['DraftImproved_*.html', 'Article_*.html', '今日头条文章_*.html', '文章草稿完善_*.html']
-            html_files = []
-            for pattern in html_patterns:
-                html_files.extend(article_dir.glob(pattern))
-
-            if html_files:
-                # 获取最新的HTML文件
-                latest_html = max(html_files, key=lambda p: p.stat().st_mtime)
-                file_age = time.time() - latest_html.stat().st_mtime
-
-                # 如果文件在进程启动后生成,且超过5秒前创建的,认为已完成
-                if file_age > 5 and file_age < elapsed_time:
-                    proc_info['status'] = 'completed'
-                    html_path = str(latest_html.absolute())
-                    html_url = f'file:///{html_path.replace(chr(92), "/")}'
-                    proc_info['output'] += f'\n[OUTPUT] HTML: {latest_html.name}'
-                    proc_info['output'] += f'\n[文章链接] {html_url}'
-
-                    # 自动用Chrome打开生成的HTML文件
-                    try:
-                        chrome_paths = [
-                            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-                            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-                        ]
-                        chrome_exe = None
-                        for cp in chrome_paths:
-                            if os.path.exists(cp):
-                                chrome_exe = cp
-                                break
-
-                        if chrome_exe:
-                            subprocess.Popen([chrome_exe, html_path], shell=False)
-                            proc_info['output'] += f'\n[浏览器] 已在Chrome中打开HTML文件'
-                        else:
-                            os.startfile(html_path)
-                            proc_info['output'] += f'\n[浏览器] 已在默认浏览器中打开HTML文件'
-                    except Exception as e:
-                        proc_info['output'] += f'\n[提示] HTML文件: {latest_html.name}'
+        # 清单已标记完成（进程可能还在做收尾工作，如打开浏览器）
+        if manifest and manifest.get('status') == 'completed':
+            proc_info['status'] = 'completed'
+            html_item = manifest_reader.output('html')
+            if html_item:
+                report_article_html(proc_info, html_item)
 
-                    return jsonify({
-                        'success': True,
-                        'filename': proc_info['filename'],
-                        'status': 'completed',
-                        'elapsed_time': round(elapsed_time, 1),
-                        'output': proc_info['output'],
-                        'returncode': 0
-                    })
+            return jsonify({
+                'success': True,
+                'filename': proc_info['filename'],
+                'status': 'completed',
+                'elapsed_time': round(elapsed_time, 1),
+                'output': log.text(),
+                'returncode': 0,
+                'manifest': manifest
+            })
 
-        # 检查是否已在输出中标记为完成(用于长时间运行的任务)
-        output_so_far = proc_info.get('output', '')
+        # 检查是否已在输出中标记为完成(用于未写清单的长时间运行任务)
+        output_so_far = log.text()
         if '生成完成!' in output_so_far or '[成功] HTML文件已保存' in output_so_far or '[SUCCESS] Article generation completed!' in output_so_far or '[OUTPUT] HTML:' in output_so_far:
             # 虽然进程还在运行(可能在等待浏览器打开等),但主要工作已完成
-            # 尝试打开生成的HTML文件
-            if tool_path and 'toutiao_article_generator' in str(tool_path):
-                article_dir = tool_path.parent
-                html_patterns = ['DraftImproved_*.html', 'Article_*.html', '今日头条文章_*.html', '文章草稿完善_*.html']
-                html_files = []
-                for pattern in html_patterns:
-                    html_files.extend(article_dir.glob(pattern))
-
-                if html_files:
-                    # 获取进程启动后生成的最新HTML文件
-                    start_time = proc_info['start_time']
-                    recent_files = [f for f in html_files if f.stat().st_mtime > start_time]
-                    if recent_files:
-                        latest_html = max(recent_files, key=lambda p: p.stat().st_mtime)
-                        html_path = str(latest_html.absolute())
-                        html_url = f'file:///{html_path.replace(chr(92), "/")}'
-                        output_so_far += f'\n[文章链接] {html_url}'
-
-                        try:
-                            chrome_paths = [
-                                r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-                                r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-                            ]
-                            chrome_exe = None
-                            for cp in chrome_paths:
-                                if os.path.exists(cp):
-                                    chrome_exe = cp
-                                    break
-
-                            if chrome_exe:
-                                subprocess.Popen([chrome_exe, html_path], shell=False)
-                                output_so_far += f'\n[浏览器] 已在Chrome中打开HTML文件'
-                            else:
-                                os.startfile(html_path)
-                                output_so_far += f'\n[浏览器] 已在默认浏览器中打开HTML文件'
-                        except Exception as e:
-                            output_so_far += f'\n[提示] HTML文件: {latest_html.name}'
-
             return jsonify({
                 'success': True,
                 'filename': proc_info['filename'],
@@ -1002,84 +1055,164 @@ def api_status(process_id):
             'status': 'running',
             'elapsed_time': round(elapsed_time, 1),
             'output': output_so_far if output_so_far else '正在运行...',
-            'returncode': None
+            'returncode': None,
+            'manifest': manifest
         })
     else:
-        # 进程已结束 - 使用communicate()获取剩余输出
-        try:
-            stdout, stderr = process.communicate(timeout=5)
-            output = stdout.decode('utf-8', errors='ignore')
-            error = stderr.decode('utf-8', errors='ignore')
-
-            if error:
-                output += f'\n[stderr]\n{error}'
-
-            # 追加到之前的输出
-            if proc_info.get('output'):
-                output = proc_info['output'] + output
-        except:
-            # communicate()超时或失败,使用已缓存的输出
-            output = proc_info.get('output', '输出读取失败')
-
-        # 对于头条文章生成器,检测生成的HTML文件
-        tool_path = proc_info.get('tool_path')
-        if tool_path and 'toutiao_article_generator' in str(tool_path) and return_code == 0:
-            article_dir = tool_path.parent
-            html_patterns = ['DraftImproved_*.html', 'Article_*.html', '今日头条文章_*.html', '文章草稿完善_*.html']
-            html_files = []
-            for pattern in html_patterns:
-                html_files.extend(article_dir.glob(pattern))
-
-            if html_files:
-                # 获取进程启动后生成的最新HTML文件
-                start_time = proc_info['start_time']
-                recent_files = [f for f in html_files if f.stat().st_mtime > start_time]
-                if recent_files:
-                    latest_html = max(recent_files, key=lambda p: p.stat().st_mtime)
-                    html_path = str(latest_html.absolute())
-                    html_url = f'file:///{html_path.replace(chr(92), "/")}'
-                    output += f'\n[OUTPUT] HTML: {latest_html.name}'
-                    output += f'\n[文章链接] {html_url}'
-
-                    # 自动用Chrome打开生成的HTML文件
-                    try:
-                        import subprocess
-                        # 使用Chrome打开HTML文件
-                        chrome_paths = [
-                            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-                            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-                        ]
-                        chrome_exe = None
-                        for cp in chrome_paths:
-                            if os.path.exists(cp):
-                                chrome_exe = cp
-                                break
-
-                        if chrome_exe:
-                            subprocess.Popen([chrome_exe, html_path], shell=False)
-                            output += f'\n[浏览器] 已在Chrome中打开HTML文件'
-                        else:
-                            # 如果找不到Chrome，使用默认浏览器
-                            os.startfile(html_path)
-                            output += f'\n[浏览器] 已在默认浏览器中打开HTML文件'
-                    except Exception as e:
-                        output += f'\n[提示] HTML文件: {latest_html.name}'
-
-        proc_info['status'] = 'completed' if return_code == 0 else 'failed'
-        proc_info['output'] = output
+        # 进程已结束 - 等待读取线程把管道中剩余的输出读完
+        if proc_info.get('return_code') is not None:
+            # 已经处理过结束状态，直接返回缓存结果
+            return jsonify({
+                'success': True,
+                'filename': proc_info['filename'],
+                'status': proc_info['status'],
+                'elapsed_time': round(proc_info['end_time'] - proc_info['start_time'], 1),
+                'output': log.text(),
+                'returncode': proc_info['return_code'],
+                'manifest': manifest
+            })
+
+        log.wait_closed(timeout=5)
+
+        # 清单中登记了HTML文件时输出链接并打开
+        if manifest and return_code == 0:
+            html_item = manifest_reader.output('html')
+            if html_item:
+                report_article_html(proc_info, html_item)
+        if manifest and manifest.get('status') == 'failed' and manifest.get('error'):
+            log.append(f"[错误] {manifest['error']}")
+
+        if proc_info['status'] == 'running':
+            proc_info['status'] = 'completed' if return_code == 0 else 'failed'
         proc_info['return_code'] = return_code
+        proc_info['end_time'] = time.time()
+        record_tool_finish(proc_info, return_code)
 
-        elapsed_time = time.time() - proc_info['start_time']
+        elapsed_time = proc_info['end_time'] - proc_info['start_time']
 
         return jsonify({
             'success': True,
             'filename': proc_info['filename'],
             'status': proc_info['status'],
             'elapsed_time': round(elapsed_time, 1),
-            'output': output,
-            'returncode': return_code
+            'output': log.text(),
+            'returncode': return_code,
+            'manifest': manifest
         })
 
+@app.route('/api/stream/<process_id>')
+def api_stream(process_id):
+    """API: 以SSE方式推送工具输出
+
+    每行输出是一个事件，事件id为行号。断线重连时浏览器会带上Last-Event-ID，
+    也可以用 ?offset=N 指定从第N行开始读取。输出结束后发送 end 事件。
+    """
+    if process_id not in running_processes:
+        return jsonify({'success': False, 'error': '进程不存在'}), 404
+
+    proc_info = running_processes[process_id]
+    log = proc_info['log']
+
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        offset = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    def generate(offset):
+        while True:
+            lines, next_offset = log.read(offset)
+            for line_no, line in enumerate(lines, next_offset - len(lines)):
+                yield f"id: {line_no}\ndata: {json.dumps({'line': line.rstrip(chr(10))}, ensure_ascii=False)}\n\n"
+            offset = next_offset
+
+            if proc_info['process'] is None and proc_info['status'] != 'queued':
+                # 排队时被取消，不会再有输出
+                yield f"event: end\ndata: {json.dumps({'returncode': None})}\n\n"
+                return
+
+            if log.closed and not lines:
+                try:
+                    returncode = proc_info['process'].wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    returncode = None
+                yield f"event: end\ndata: {json.dumps({'returncode': returncode})}\n\n"
+                return
+
+            if not log.wait(offset, timeout=15):
+                # 保持连接，防止代理或浏览器超时断开
+                yield ': keep-alive\n\n'
+
+    return Response(generate(offset), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+
+def collect_running_metrics():
+    """运行中工具的最新资源采样"""
+    running = []
+    for process_id, proc_info in list(running_processes.items()):
+        current = resource_monitor.current(process_id)
+        if current is not None:
+            running.append({'process_id': process_id, 'filename': proc_info['filename'], **current})
+    return running
+
+@app.route('/api/metrics')
+def api_metrics():
+    """API: 资源统计（各工具耗时/CPU/内存/IO的分位数 + 运行中工具的实时采样）"""
+    return jsonify({
+        'success': True,
+        'tools': usage_ledger.metric_percentiles(),
+        'running': collect_running_metrics(),
+        'scheduler': tool_scheduler.summary()
+    })
+
+@app.route('/api/provider_health')
+def api_provider_health():
+    """API: 熔断中的模型提供方（各工具共享的状态）"""
+    return jsonify({
+        'success': True,
+        'providers': get_provider_health().snapshot()
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus文本格式的资源统计"""
+    def label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    summaries = [
+        ('duration', 'tool_run_duration_seconds', '工具运行耗时(秒)'),
+        ('cpu_time', 'tool_run_cpu_seconds', '工具CPU时间(秒)'),
+        ('peak_rss', 'tool_run_peak_rss_bytes', '工具峰值内存(字节)'),
+        ('read_bytes', 'tool_run_read_bytes', '工具磁盘读取(字节)'),
+        ('write_bytes', 'tool_run_write_bytes', '工具磁盘写入(字节)'),
+    ]
+    tools = usage_ledger.metric_percentiles()
+    lines = []
+    for field, name, help_text in summaries:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} summary')
+        for tool, stats in sorted(tools.items()):
+            if field not in stats:
+                continue
+            for quantile in ('0.5', '0.9', '0.99'):
+                value = stats[field][f'p{int(float(quantile) * 100)}']
+                lines.append(f'{name}{{tool="{label(tool)}",quantile="{quantile}"}} {value}')
+            lines.append(f'{name}_sum{{tool="{label(tool)}"}} {stats[field]["sum"]}')
+            lines.append(f'{name}_count{{tool="{label(tool)}"}} {stats[field]["count"]}')
+
+    running = collect_running_metrics()
+    for field, name in (('cpu_time', 'tool_running_cpu_seconds'), ('rss', 'tool_running_rss_bytes')):
+        lines.append(f'# TYPE {name} gauge')
+        for item in running:
+            if field in item:
+                lines.append(f'{name}{{process_id="{label(item["process_id"])}",tool="{label(item["filename"])}"}} {item[field]}')
+
+    scheduler = tool_scheduler.summary()
+    lines.append('# TYPE tool_scheduler_running gauge')
+    lines.append(f"tool_scheduler_running {scheduler['running']}")
+    lines.append('# TYPE tool_scheduler_queued gauge')
+    lines.append(f"tool_scheduler_queued {scheduler['queued']}")
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/stop', methods=['POST'])
 def api_stop():
     """API: 停止运行中的工具"""
@@ -1090,7 +1223,18 @@ def api_stop():
         return jsonify({'success': False, 'error': '进程不存在'})
 
     try:
+        if tool_scheduler.cancel(process_id):
+            # 还在排队，直接移出队列
+            running_processes[process_id]['status'] = 'stopped'
+            running_processes[process_id]['end_time'] = time.time()
+            return jsonify({
+                'success': True,
+                'message': '已取消排队'
+            })
+
         process = running_processes[process_id]['process']
+        if process is None:
+            return jsonify({'success': False, 'error': '进程未启动'})
         process.terminate()
         time.sleep(0.5)
 
@@ -1098,6 +1242,7 @@ def api_stop():
             process.kill()
 
         running_processes[process_id]['status'] = 'stopped'
+        record_tool_finish(running_processes[process_id], process.poll())
 
         return jsonify({
             'success': True,
@@ -1153,6 +1298,10 @@ def main():
     print("=" * 80)
     print()
 
+    # 预先启动工作进程，首次运行工具时无需冷启动
+    if tool_worker_pool is not None:
+        tool_worker_pool.start()
+
     # 启动Flask服务器(关闭debug模式,避免运行时修改文件导致重启)
     app.run(host='0.0.0.0', port=5000, debug=False)
 
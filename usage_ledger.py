@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+工具使用记录
+用WAL模式的SQLite记录每次运行(工具、开始/结束时间、退出码、耗时)，
+内存中维护按工具汇总的统计，后台定期把旧记录压缩成汇总行
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 每次运行记录的资源统计字段
+METRIC_COLUMNS = ['cpu_time', 'peak_rss', 'read_bytes', 'write_bytes']
+
+
+class UsageLedger:
+    """工具运行记录表 + 内存汇总
+
+    - 每次启动工具插入一行，结束时补写结束时间/退出码/耗时
+    - counts() 直接读内存，不访问磁盘
+    - 超过 keep_days 天的已结束记录会被后台线程合并到 tool_usage_totals
+    """
+
+    def __init__(self, db_path, legacy_json=None, keep_days=30, compact_interval=3600):
+        """
+        Args:
+            db_path: SQLite数据库路径
+            legacy_json: 旧版 tool_usage_frequency.json 路径，首次创建数据库时导入其计数
+            keep_days: 明细记录保留天数
+            compact_interval: 后台压缩间隔(秒)
+        """
+        self.db_path = Path(db_path)
+        self.keep_days = keep_days
+        self.compact_interval = compact_interval
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables(legacy_json)
+
+        # 内存汇总: 工具 -> {'runs', 'finished', 'failed', 'total_duration'}
+        self._stats = {}
+        self._load_stats()
+
+        self._compactor = threading.Thread(target=self._compact_loop, daemon=True, name='usage-ledger-compact')
+        self._compactor.start()
+
+    def _create_tables(self, legacy_json):
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tool_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tool TEXT NOT NULL,
+                    start_time REAL NOT NULL,
+                    end_time REAL,
+                    exit_code INTEGER,
+                    duration REAL,
+                    cpu_time REAL,
+                    peak_rss INTEGER,
+                    read_bytes INTEGER,
+                    write_bytes INTEGER
+                )
+            ''')
+            # 旧数据库补充资源统计列
+            existing = {row[1] for row in self._conn.execute('PRAGMA table_info(tool_runs)')}
+            for column in METRIC_COLUMNS:
+                if column not in existing:
+                    column_type = 'REAL' if column == 'cpu_time' else 'INTEGER'
+                    self._conn.execute(f'ALTER TABLE tool_runs ADD COLUMN {column} {column_type}')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tool_usage_totals (
+                    tool TEXT PRIMARY KEY,
+                    runs INTEGER NOT NULL DEFAULT 0,
+                    finished INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    total_duration REAL NOT NULL DEFAULT 0
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tool_runs_start ON tool_runs(start_time)')
+
+            # 首次使用时导入旧版JSON计数
+            imported = self._conn.execute('SELECT COUNT(*) FROM tool_usage_totals').fetchone()[0]
+            if not imported and legacy_json and Path(legacy_json).exists():
+                try:
+                    with open(legacy_json, 'r', encoding='utf-8') as f:
+                        legacy_counts = json.load(f)
+                    self._conn.executemany(
+                        'INSERT OR IGNORE INTO tool_usage_totals (tool, runs) VALUES (?, ?)',
+                        [(tool, int(count)) for tool, count in legacy_counts.items()]
+                    )
+                    print(f"[使用记录] 已导入旧版使用频率: {len(legacy_counts)}个工具")
+                except Exception as e:
+                    print(f"[使用记录] 导入旧版使用频率失败: {e}")
+
+    def _load_stats(self):
+        """启动时从数据库汇总出内存统计"""
+        rows = self._conn.execute('''
+            SELECT tool, SUM(runs), SUM(finished), SUM(failed), SUM(total_duration) FROM (
+                SELECT tool, runs, finished, failed, total_duration FROM tool_usage_totals
+                UNION ALL
+                SELECT tool,
+                       1,
+                       CASE WHEN end_time IS NOT NULL THEN 1 ELSE 0 END,
+                       CASE WHEN exit_code IS NOT NULL AND exit_code != 0 THEN 1 ELSE 0 END,
+                       COALESCE(duration, 0)
+                FROM tool_runs
+            ) GROUP BY tool
+        ''').fetchall()
+        for tool, runs, finished, failed, total_duration in rows:
+            self._stats[tool] = {
+                'runs': runs or 0,
+                'finished': finished or 0,
+                'failed': failed or 0,
+                'total_duration': total_duration or 0.0,
+            }
+
+    def _tool_stats(self, tool):
+        stats = self._stats.get(tool)
+        if stats is None:
+            stats = {'runs': 0, 'finished': 0, 'failed': 0, 'total_duration': 0.0}
+            self._stats[tool] = stats
+        return stats
+
+    # ========== 记录 ==========
+
+    def record_start(self, tool, start_time=None):
+        """记录一次工具启动
+
+        Returns:
+            int: 运行记录ID，结束时传给 record_finish
+        """
+        start_time = start_time or time.time()
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    'INSERT INTO tool_runs (tool, start_time) VALUES (?, ?)',
+                    (tool, start_time)
+                )
+            self._tool_stats(tool)['runs'] += 1
+            return cursor.lastrowid
+
+    def record_finish(self, run_id, exit_code, end_time=None, metrics=None):
+        """补写一次运行的结束信息（重复调用只生效一次，之后只补充资源统计）
+
+        Args:
+            metrics: 可选，资源统计 {cpu_time, peak_rss, read_bytes, write_bytes, ...}
+        """
+        end_time = end_time or time.time()
+        with self._lock:
+            if metrics:
+                values = [metrics.get(column) for column in METRIC_COLUMNS]
+                with self._conn:
+                    self._conn.execute(
+                        f"UPDATE tool_runs SET {', '.join(f'{c} = ?' for c in METRIC_COLUMNS)} WHERE id = ?",
+                        values + [run_id]
+                    )
+            row = self._conn.execute(
+                'SELECT tool, start_time, end_time FROM tool_runs WHERE id = ?', (run_id,)
+            ).fetchone()
+            if not row or row[2] is not None:
+                return
+            tool, start_time, _ = row
+            duration = max(0.0, end_time - start_time)
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE tool_runs SET end_time = ?, exit_code = ?, duration = ? WHERE id = ?',
+                    (end_time, exit_code, duration, run_id)
+                )
+            stats = self._tool_stats(tool)
+            stats['finished'] += 1
+            stats['total_duration'] += duration
+            if exit_code is not None and exit_code != 0:
+                stats['failed'] += 1
+
+    # ========== 查询（只读内存） ==========
+
+    def counts(self):
+        """返回 {工具: 运行次数}"""
+        with self._lock:
+            return {tool: stats['runs'] for tool, stats in self._stats.items()}
+
+    def stats(self, tool=None):
+        """返回单个工具或全部工具的汇总统计"""
+        with self._lock:
+            if tool is not None:
+                return dict(self._tool_stats(tool))
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def metric_percentiles(self, quantiles=(0.5, 0.9, 0.99)):
+        """按工具计算明细记录中耗时和资源统计的分位数
+
+        Returns:
+            {工具: {'runs': 记录数, 'duration': {'p50': ..., 'max': ...}, 'cpu_time': {...}, ...}}
+        """
+        fields = ['duration'] + METRIC_COLUMNS
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT tool, {', '.join(fields)} FROM tool_runs WHERE end_time IS NOT NULL"
+            ).fetchall()
+
+        values = {}
+        for row in rows:
+            tool_values = values.setdefault(row[0], {field: [] for field in fields})
+            for field, value in zip(fields, row[1:]):
+                if value is not None:
+                    tool_values[field].append(value)
+
+        result = {}
+        for tool, tool_values in values.items():
+            summary = {'runs': len(tool_values['duration'])}
+            for field, samples in tool_values.items():
+                if not samples:
+                    continue
+                samples.sort()
+                stats = {f'p{int(q * 100)}': _percentile(samples, q) for q in quantiles}
+                stats['max'] = samples[-1]
+                stats['sum'] = sum(samples)
+                stats['count'] = len(samples)
+                summary[field] = stats
+            result[tool] = summary
+        return result
+
+    # ========== 后台压缩 ==========
+
+    def compact(self):
+        """把超过保留期的已结束记录合并进汇总表"""
+        cutoff = time.time() - self.keep_days * 86400
+        with self._lock:
+            with self._conn:
+                self._conn.execute('''
+                    INSERT INTO tool_usage_totals (tool, runs, finished, failed, total_duration)
+                    SELECT tool, COUNT(*), COUNT(end_time),
+                           SUM(CASE WHEN exit_code IS NOT NULL AND exit_code != 0 THEN 1 ELSE 0 END),
+                           COALESCE(SUM(duration), 0)
+                    FROM tool_runs WHERE start_time < ? GROUP BY tool
+                    ON CONFLICT(tool) DO UPDATE SET
+                        runs = runs + excluded.runs,
+                        finished = finished + excluded.finished,
+                        failed = failed + excluded.failed,
+                        total_duration = total_duration + excluded.total_duration
+                ''', (cutoff,))
+                deleted = self._conn.execute('DELETE FROM tool_runs WHERE start_time < ?', (cutoff,)).rowcount
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return deleted
+
+    def _compact_loop(self):
+        stop = threading.Event()
+        while not stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"[使用记录] 压缩失败: {e}")
+
+
+def _percentile(sorted_values, q):
+    """线性插值分位数（sorted_values已排序且非空）"""
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
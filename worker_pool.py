@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+预热的Python工作进程池
+每次启动工具都要重新导入openai/anthropic/PIL和config(解析.env)，冷启动要好几秒；
+这里预先启动若干个已导入这些模块的解释器，工具通过runpy在其中运行
+
+每个工作进程只运行一个工具:
+  - stdin第一行是JSON任务描述(脚本、参数、环境变量、工作目录)，之后的内容作为工具的stdin
+  - 工具的stdout/stderr就是工作进程自己的管道，调用方按普通子进程读取
+  - 取走一个工作进程后，后台立即补充一个新的
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+from collections import deque
+
+# 工作进程预先导入的模块（导入失败的忽略）
+DEFAULT_PRELOAD = ['config', 'openai', 'anthropic', 'requests', 'PIL.Image']
+
+
+class WorkerPool:
+    """预热解释器池"""
+
+    def __init__(self, size=2, python='python', cwd=None, env=None, preload=None):
+        """
+        Args:
+            size: 保持空闲的工作进程数
+            python: Python解释器
+            cwd: 工作进程的启动目录
+            env: 工作进程的启动环境变量
+            preload: 预先导入的模块列表
+        """
+        self.size = size
+        self.python = python
+        self.cwd = cwd
+        self.env = env
+        self.preload = DEFAULT_PRELOAD if preload is None else list(preload)
+
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._closed = False
+
+    def start(self):
+        """在后台填满进程池"""
+        threading.Thread(target=self._replenish, daemon=True, name='worker-pool-fill').start()
+
+    def close(self):
+        """结束所有空闲的工作进程"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for worker in idle:
+            worker.kill()
+
+    def idle_count(self):
+        with self._lock:
+            return len(self._idle)
+
+    def run(self, script, args=(), env=None, cwd=None, stdin_data=None):
+        """在一个预热的工作进程中运行脚本
+
+        Args:
+            script: 脚本路径
+            args: 命令行参数(不含脚本路径)
+            env: 工具运行时的环境变量(替换工作进程的环境变量，已预导入config时再叠加.env)
+            cwd: 工具运行时的工作目录
+            stdin_data: 传给工具stdin的文本
+
+        Returns:
+            subprocess.Popen: 运行该工具的工作进程
+        """
+        worker = self._take()
+        spec = {
+            'script': str(script),
+            'args': [str(arg) for arg in args],
+            'env': env,
+            'cwd': str(cwd) if cwd else None,
+        }
+        worker.stdin.write((json.dumps(spec, ensure_ascii=False) + '\n').encode('utf-8'))
+        if stdin_data:
+            worker.stdin.write(stdin_data.encode('utf-8'))
+        worker.stdin.close()
+        worker.stdin = None  # 对调用方而言与未接stdin管道的子进程一致
+
+        threading.Thread(target=self._replenish, daemon=True, name='worker-pool-fill').start()
+        return worker
+
+    def _take(self):
+        """取一个存活的空闲工作进程，没有时直接新建一个"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.popleft()
+                if worker.poll() is None:
+                    return worker
+        return self._spawn()
+
+    def _spawn(self):
+        env = dict(self.env if self.env is not None else os.environ)
+        env['PYTHONIOENCODING'] = 'utf-8'
+        env['PYTHONUTF8'] = '1'
+        return subprocess.Popen(
+            [self.python, '-u', os.path.abspath(__file__), '--worker', ','.join(self.preload)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            env=env
+        )
+
+    def _replenish(self):
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) >= self.size:
+                    return
+            try:
+                worker = self._spawn()
+            except OSError as e:
+                print(f"[进程池] 启动工作进程失败: {e}")
+                return
+            with self._lock:
+                if self._closed:
+                    worker.kill()
+                    return
+                self._idle.append(worker)
+
+
+def _worker_main(preload):
+    """工作进程入口：预先导入模块，等待任务后用runpy运行脚本"""
+    import contextlib
+    import importlib
+    import runpy
+
+    # 预导入期间的输出不属于任何工具，丢弃
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        for module_name in preload:
+            try:
+                importlib.import_module(module_name)
+            except Exception:
+                pass
+
+    line = sys.stdin.readline()
+    if not line:
+        return
+    spec = json.loads(line)
+
+    if spec.get('env') is not None:
+        os.environ.clear()
+        os.environ.update(spec['env'])
+        # 预导入config时读入的.env已随上面一起清掉，而工具中再次 import config 不会重新执行；
+        # 按冷启动时的顺序(任务环境变量，再由.env覆盖)重新加载
+        config = sys.modules.get('config')
+        if config is not None and hasattr(config, 'load_env'):
+            config.load_env()
+    if spec.get('cwd'):
+        os.chdir(spec['cwd'])
+
+    script = os.path.abspath(spec['script'])
+    sys.argv = [script] + spec.get('args', [])
+    # 与 python script.py 一致：脚本所在目录放在sys.path最前面
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == '--worker':
+        modules = sys.argv[2].split(',') if len(sys.argv) > 2 and sys.argv[2] else []
+        _worker_main(modules)